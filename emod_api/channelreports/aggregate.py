@@ -0,0 +1,521 @@
+#!/usr/bin/env python3
+
+"""
+Experiment-scale aggregation of channel reports (e.g., InsetChart.json) across simulations.
+
+Reports are read in a process pool, only the requested channels are parsed, and each
+series is folded into streaming per-timestep accumulators, so memory does not grow with the
+number of simulations. Series may have different lengths (e.g., simulations which stop
+when prevalence reaches zero), each timestep is summarized over the series which reach it.
+
+    from emod_api.channelreports.aggregate import aggregate
+    stats = aggregate("my_experiment", ["Infected", "New Infections"], workers=8)
+    mean = stats["ref"]["Infected"].mean
+
+Per-timestep quantiles (median, prediction interval bands) are accumulated the same way,
+in bounded memory, with aggregate_quantiles():
+
+    from emod_api.channelreports.aggregate import aggregate_quantiles
+    quantiles = aggregate_quantiles("my_experiment", ["Infected"], workers=8)
+    low, high = quantiles["ref"]["Infected"].band(0.9)
+"""
+
+from concurrent.futures import ProcessPoolExecutor
+from functools import partial
+import os
+from pathlib import Path
+from typing import Callable, Union
+import warnings
+
+import numpy as np
+
+from emod_api.channelreports.channels import ChannelReport
+from emod_api.channelreports.smoothing import stack_series
+
+_DEFAULT_GROUP = "ref"
+
+
+class ChannelStatistics(object):
+
+    """
+    Streaming per-timestep count, mean, variance, minimum, and maximum of a set of series.
+
+    Series are added one at a time with add() and accumulators from different processes
+    are combined with merge(). Mean and variance use Welford's algorithm (Chan et al. for
+    merging) so accumulation is numerically stable.
+    """
+
+    def __init__(self) -> None:
+        self._count = np.zeros(0, dtype=np.int64)
+        self._mean = np.zeros(0, dtype=np.float64)
+        self._m2 = np.zeros(0, dtype=np.float64)
+        self._minimum = np.zeros(0, dtype=np.float64)
+        self._maximum = np.zeros(0, dtype=np.float64)
+        return
+
+    def _grow(self, length: int) -> None:
+
+        extra = length - len(self._count)
+        if extra > 0:
+            self._count = np.concatenate([self._count, np.zeros(extra, dtype=np.int64)])
+            self._mean = np.concatenate([self._mean, np.zeros(extra)])
+            self._m2 = np.concatenate([self._m2, np.zeros(extra)])
+            self._minimum = np.concatenate([self._minimum, np.full(extra, np.inf)])
+            self._maximum = np.concatenate([self._maximum, np.full(extra, -np.inf)])
+
+        return
+
+    def add(self, data: np.ndarray) -> None:
+
+        """Add one series, which may be shorter or longer than previous series."""
+
+        data = np.asarray(data, dtype=np.float64)
+        length = len(data)
+        self._grow(length)
+
+        count = self._count[:length] + 1
+        delta = data - self._mean[:length]
+        self._mean[:length] += delta / count
+        self._m2[:length] += delta * (data - self._mean[:length])
+        self._count[:length] = count
+        np.minimum(self._minimum[:length], data, out=self._minimum[:length])
+        np.maximum(self._maximum[:length], data, out=self._maximum[:length])
+
+        return
+
+    def merge(self, other: "ChannelStatistics") -> "ChannelStatistics":
+
+        """Combine the series accumulated by other into this accumulator."""
+
+        length = len(other._count)
+        self._grow(length)
+
+        count_a = self._count[:length].astype(np.float64)
+        count_b = other._count.astype(np.float64)
+        total = count_a + count_b
+        safe = np.where(total > 0, total, 1)
+        delta = other._mean - self._mean[:length]
+        self._mean[:length] += delta * count_b / safe
+        self._m2[:length] += other._m2 + delta * delta * count_a * count_b / safe
+        self._count[:length] += other._count
+        np.minimum(self._minimum[:length], other._minimum, out=self._minimum[:length])
+        np.maximum(self._maximum[:length], other._maximum, out=self._maximum[:length])
+
+        return self
+
+    def __len__(self) -> int:
+        """Number of timesteps, i.e., length of the longest series"""
+        return len(self._count)
+
+    @property
+    def nbytes(self) -> int:
+        """Bytes held by the accumulators"""
+        return sum(array.nbytes for array in (self._count, self._mean, self._m2, self._minimum, self._maximum))
+
+    @property
+    def count(self) -> np.ndarray:
+        """Number of series reaching each timestep"""
+        return self._count
+
+    @property
+    def mean(self) -> np.ndarray:
+        return self._mean
+
+    @property
+    def variance(self) -> np.ndarray:
+        """Sample variance (NaN where fewer than two series reach the timestep)"""
+        with np.errstate(divide="ignore", invalid="ignore"):
+            return np.where(self._count > 1, self._m2 / (self._count - 1), np.nan)
+
+    @property
+    def std(self) -> np.ndarray:
+        return np.sqrt(self.variance)
+
+    @property
+    def minimum(self) -> np.ndarray:
+        return self._minimum
+
+    @property
+    def maximum(self) -> np.ndarray:
+        return self._maximum
+
+
+class ChannelQuantiles(object):
+
+    """
+    Streaming per-timestep quantiles of a set of series, e.g., the median and prediction
+    interval bands of a channel across replicate simulations.
+
+    The first `buffer` series are kept as they are. After that each timestep gets a histogram
+    of `bins` equal bins spanning the range of the values seen so far. When a value falls
+    outside, that histogram's range is doubled (pairs of bins are merged) until it fits, so
+    memory is bounded by timesteps x bins however many series are added. Quantiles are
+    interpolated between order statistics, as np.quantile() does, with each order statistic
+    placed within its bin, so they are accurate to about a bin width (histograms span at most
+    about four times the range of their values).
+
+    With exact=True every series is kept and quantiles are exact (np.nanquantile), for
+    small experiments and for checking the approximation.
+    """
+
+    def __init__(self, bins: int = 256, buffer: int = 128, exact: bool = False) -> None:
+        assert bins >= 2 and bins % 2 == 0, "bins must be even and >= 2"
+        assert exact or buffer >= 1, "buffer must be >= 1"
+        self._bins = bins
+        self._buffer = None if exact else buffer
+        self._series = []       # series kept as they are, until histograms are built
+        self._counts = None     # (timesteps x bins) histograms
+        self._low = None        # lower edge of the first bin of each histogram
+        self._width = None      # bin width of each histogram
+        self._count = np.zeros(0, dtype=np.int64)
+        self._minimum = np.zeros(0, dtype=np.float64)
+        self._maximum = np.zeros(0, dtype=np.float64)
+        return
+
+    def _grow(self, length: int) -> None:
+
+        extra = length - len(self._count)
+        if extra > 0:
+            self._count = np.concatenate([self._count, np.zeros(extra, dtype=np.int64)])
+            self._minimum = np.concatenate([self._minimum, np.full(extra, np.inf)])
+            self._maximum = np.concatenate([self._maximum, np.full(extra, -np.inf)])
+        if self._counts is not None:
+            self._grow_histograms(length)
+
+        return
+
+    def _grow_histograms(self, length: int) -> None:
+
+        """Add empty histograms for timesteps beyond the existing ones, their range is set by their first value."""
+
+        extra = length - len(self._counts)
+        if extra > 0:
+            self._low = np.concatenate([self._low, np.full(extra, np.nan)])
+            self._width = np.concatenate([self._width, np.full(extra, np.nan)])
+            self._counts = np.concatenate([self._counts, np.zeros((extra, self._bins), dtype=self._counts.dtype)])
+
+        return
+
+    def _build(self) -> None:
+
+        """Switch from keeping series to histograms spanning the range of the series kept so far."""
+
+        self._low = np.full(len(self._count), np.nan)
+        self._width = np.full(len(self._count), np.nan)
+        self._counts = np.zeros((len(self._count), self._bins), dtype=np.uint32)
+        valid = np.flatnonzero(self._count > 0)
+        self._cover(valid, self._minimum[valid], self._maximum[valid])
+        series, self._series = self._series, []
+        for data in series:
+            self._bin(data)
+
+        return
+
+    def _cover(self, steps: np.ndarray, low: np.ndarray, high: np.ndarray) -> None:
+
+        """Double the range of the histograms at steps, merging pairs of bins, until each spans [low, high]."""
+
+        # histograms without a range yet (no values) start with exactly [low, high], constant timesteps need a non-zero width
+        new = np.isnan(self._low[steps])
+        self._low[steps[new]] = low[new]
+        self._width[steps[new]] = np.maximum(high[new] - low[new], np.maximum(np.abs(high[new]), 1.0) * 1e-6) / self._bins
+
+        half = self._bins // 2
+        while True:
+            top = self._low[steps] + self._width[steps] * self._bins
+            below = low < self._low[steps]
+            grow = below | (high > top)
+            if not grow.any():
+                return
+            rows, down = steps[grow], below[grow]
+            pairs = self._counts[rows, 0::2] + self._counts[rows, 1::2]
+            self._counts[rows] = 0
+            # extend up: merged bins become the lower half, extend down: the upper half
+            self._counts[rows[~down], :half] = pairs[~down]
+            self._counts[rows[down], half:] = pairs[down]
+            self._low[rows[down]] -= self._width[rows[down]] * self._bins
+            self._width[rows] *= 2
+
+    def _bin(self, data: np.ndarray) -> None:
+
+        steps = np.flatnonzero(np.isfinite(data))
+        values = data[steps]
+        self._cover(steps, values, values)
+        index = np.floor((values - self._low[steps]) / self._width[steps]).astype(np.int64)
+        np.clip(index, 0, self._bins - 1, out=index)
+        # one value per timestep, so the flat indices are unique
+        self._counts.reshape(-1)[steps * self._bins + index] += 1
+
+        return
+
+    def _place(self, data: np.ndarray) -> None:
+
+        if self._counts is None:
+            self._series.append(data)
+            if self._buffer is not None and len(self._series) >= self._buffer:
+                self._build()
+        else:
+            self._bin(data)
+
+        return
+
+    def add(self, data: np.ndarray) -> None:
+
+        """Add one series, which may be shorter or longer than previous series. NaN values are ignored."""
+
+        data = np.asarray(data, dtype=np.float64)
+        length = len(data)
+        self._grow(length)
+        self._count[:length] += ~np.isnan(data)
+        np.fmin(self._minimum[:length], data, out=self._minimum[:length])
+        np.fmax(self._maximum[:length], data, out=self._maximum[:length])
+        self._place(data)
+
+        return
+
+    def merge(self, other: "ChannelQuantiles") -> "ChannelQuantiles":
+
+        """Combine the series accumulated by other into this accumulator."""
+
+        length = len(other._count)
+        self._grow(length)
+        self._count[:length] += other._count
+        np.fmin(self._minimum[:length], other._minimum, out=self._minimum[:length])
+        np.fmax(self._maximum[:length], other._maximum, out=self._maximum[:length])
+
+        if other._counts is None:
+            for data in other._series:
+                self._place(data)
+        elif self._counts is None:
+            series, self._series = self._series, []
+            self._low, self._width, self._counts = other._low.copy(), other._width.copy(), other._counts.copy()
+            self._grow_histograms(len(self._count))
+            for data in series:
+                self._bin(data)
+        else:
+            # move each of other's bins, at its center, into this accumulator's histograms
+            steps = np.flatnonzero(other._count > 0)
+            bins = other._counts.shape[1]
+            low, width = other._low[steps], other._width[steps]
+            # only the occupied part of other's range needs to be covered
+            self._cover(steps, other._minimum[steps], other._maximum[steps])
+            centers = low[:, np.newaxis] + (np.arange(bins) + 0.5) * width[:, np.newaxis]
+            index = np.floor((centers - self._low[steps, np.newaxis]) / self._width[steps, np.newaxis]).astype(np.int64)
+            np.clip(index, 0, self._bins - 1, out=index)
+            flat = (steps[:, np.newaxis] * self._bins + index).reshape(-1)
+            moved = np.bincount(flat, weights=other._counts[steps].reshape(-1), minlength=self._counts.size)
+            self._counts += moved.astype(self._counts.dtype).reshape(self._counts.shape)
+
+        return self
+
+    def __len__(self) -> int:
+        """Number of timesteps, i.e., length of the longest series"""
+        return len(self._count)
+
+    @property
+    def exact(self) -> bool:
+        """True while quantiles are computed from the series themselves rather than histograms"""
+        return self._counts is None
+
+    @property
+    def count(self) -> np.ndarray:
+        """Number of series reaching each timestep"""
+        return self._count
+
+    @property
+    def minimum(self) -> np.ndarray:
+        return self._minimum
+
+    @property
+    def maximum(self) -> np.ndarray:
+        return self._maximum
+
+    @property
+    def nbytes(self) -> int:
+        """Bytes held by the series kept and the histograms"""
+        arrays = [self._count, self._minimum, self._maximum] + self._series
+        if self._counts is not None:
+            arrays += [self._counts, self._low, self._width]
+        return sum(array.nbytes for array in arrays)
+
+    def _order_statistic(self, counts: np.ndarray, cumulative: np.ndarray, rank: np.ndarray) -> np.ndarray:
+
+        """Estimate the rank'th (0-based) smallest value at each timestep, spreading each bin's values evenly across it."""
+
+        steps = np.arange(len(rank))
+        index = np.minimum(np.sum(cumulative <= rank[:, np.newaxis], axis=1), self._bins - 1)
+        before = np.where(index > 0, cumulative[steps, np.maximum(index - 1, 0)], 0.0)
+        within = counts[steps, index]
+        with np.errstate(divide="ignore", invalid="ignore"):
+            position = np.where(within > 0, (rank - before + 0.5) / within, 0.5)
+
+        return self._low + (index + position) * self._width
+
+    def quantiles(self, q: Union[float, list[float]]) -> np.ndarray:
+
+        """
+        Return a (len(q) x timesteps) array of the quantiles q (each 0 <= q <= 1) at each
+        timestep, NaN where no series reach the timestep.
+        """
+
+        q = np.atleast_1d(np.asarray(q, dtype=np.float64))
+        assert np.all((q >= 0) & (q <= 1)), "quantiles must be in [0, 1]"
+
+        if self._counts is None:
+            if not self._series:
+                return np.full((len(q), len(self)), np.nan)
+            stacked, _ = stack_series(self._series, len(self))
+            with warnings.catch_warnings():
+                warnings.simplefilter("ignore", RuntimeWarning)     # timesteps no series reach
+                return np.nanquantile(stacked, q, axis=0)
+
+        counts = self._counts.astype(np.float64)
+        cumulative = np.cumsum(counts, axis=1)
+        last = np.maximum(cumulative[:, -1] - 1, 0)
+        result = np.empty((len(q), len(last)))
+        for row, fraction in enumerate(q):
+            # linear interpolation between order statistics, as np.quantile()
+            rank = fraction * last
+            below = np.floor(rank)
+            above = np.minimum(below + 1, last)
+            weight = rank - below
+            value = (1 - weight) * self._order_statistic(counts, cumulative, below) + weight * self._order_statistic(counts, cumulative, above)
+            value = np.where(rank <= 0, self._minimum, np.where(rank >= last, self._maximum, value))
+            result[row] = np.clip(value, self._minimum, self._maximum)
+        result[:, cumulative[:, -1] == 0] = np.nan
+
+        return result
+
+    @property
+    def median(self) -> np.ndarray:
+        return self.quantiles(0.5)[0]
+
+    def band(self, level: float = 0.9) -> tuple[np.ndarray, np.ndarray]:
+
+        """Return the (lower, upper) quantiles of the central interval holding level (e.g., 0.9 for 5% - 95%) of the series."""
+
+        assert 0 < level < 1, "level must be in (0, 1)"
+        low, high = self.quantiles([(1 - level) / 2, (1 + level) / 2])
+
+        return low, high
+
+
+def simulation_directories(experiment_dir: Union[str, Path]) -> list[str]:
+
+    """Return the names of the simulation subdirectories of an experiment directory."""
+
+    return sorted(entry.name for entry in os.scandir(experiment_dir) if entry.is_dir())
+
+
+def _aggregate_batch(paths: list[str], channels: list[str], cache, accumulator: Callable = ChannelStatistics) -> tuple[dict, int]:
+
+    """Fold the given channels of each report into new accumulators, skipping missing reports."""
+
+    stats = {channel: accumulator() for channel in channels}
+    read = 0
+    for path in paths:
+        if not os.path.exists(path):
+            continue
+        report = ChannelReport(path, channels=channels, cache=cache)
+        for channel in channels:
+            if channel not in report.channels:
+                raise ValueError(f"Can't find channel {channel} in {path}. Did find {ChannelReport.read_header(path)[1].keys()}.")
+            stats[channel].add(report[channel].data)
+        read += 1
+
+    return stats, read
+
+
+def aggregate(experiment_dir: Union[str, Path],
+              channels: list[str],
+              groups: dict[str, list[str]] = None,
+              report: str = "InsetChart.json",
+              workers: int = None,
+              batch_size: int = 64,
+              cache: Union[bool, str, Path] = False) -> dict[str, dict[str, ChannelStatistics]]:
+
+    """
+    Aggregate channels of a report across the simulations of an experiment.
+
+        experiment_dir/
+            sim_id/
+                InsetChart.json
+
+    Args:
+        experiment_dir: directory with a subdirectory per simulation
+        channels:       names of channels to aggregate
+        groups:         optional simulation ids (subdirectory names) keyed on group name, e.g.,
+                        sweep value, default is all simulations in a group named "ref"
+        report:         report filename within each simulation directory
+        workers:        number of worker processes, <= 1 reads reports in this process
+        batch_size:     number of reports folded per task in a worker process
+        cache:          passed to ChannelReport, see emod_api.channelreports.cache
+
+    Returns:
+        ChannelStatistics keyed on group name and channel name
+    """
+
+    return _aggregate(experiment_dir, channels, groups, report, workers, batch_size, cache, ChannelStatistics)
+
+
+def aggregate_quantiles(experiment_dir: Union[str, Path],
+                        channels: list[str],
+                        groups: dict[str, list[str]] = None,
+                        report: str = "InsetChart.json",
+                        workers: int = None,
+                        batch_size: int = 64,
+                        cache: Union[bool, str, Path] = False,
+                        bins: int = 256,
+                        buffer: int = 128,
+                        exact: bool = False) -> dict[str, dict[str, ChannelQuantiles]]:
+
+    """
+    Accumulate per-timestep quantiles of channels of a report across the simulations of an
+    experiment, e.g., for median and prediction interval bands. See aggregate() for the
+    experiment layout and ChannelQuantiles for bins, buffer, and exact.
+
+    Returns:
+        ChannelQuantiles keyed on group name and channel name
+    """
+
+    accumulator = partial(ChannelQuantiles, bins=bins, buffer=buffer, exact=exact)
+
+    return _aggregate(experiment_dir, channels, groups, report, workers, batch_size, cache, accumulator)
+
+
+def _aggregate(experiment_dir, channels, groups, report, workers, batch_size, cache, accumulator: Callable) -> dict:
+
+    if isinstance(channels, str):
+        channels = [channels]
+    if groups is None:
+        groups = {_DEFAULT_GROUP: simulation_directories(experiment_dir)}
+
+    tasks = []
+    for group, sims in groups.items():
+        paths = [os.path.join(experiment_dir, str(sim), report) for sim in sims]
+        tasks.extend((group, paths[start:start + batch_size]) for start in range(0, len(paths), batch_size))
+
+    results = {group: {channel: accumulator() for channel in channels} for group in groups}
+    read = 0
+
+    def fold(group, batch_result):
+        nonlocal read
+        stats, count = batch_result
+        for channel in channels:
+            results[group][channel].merge(stats[channel])
+        read += count
+        return
+
+    if workers is not None and workers <= 1:
+        for group, paths in tasks:
+            fold(group, _aggregate_batch(paths, channels, cache, accumulator))
+    else:
+        with ProcessPoolExecutor(max_workers=workers) as executor:
+            futures = [(group, executor.submit(_aggregate_batch, paths, channels, cache, accumulator)) for group, paths in tasks]
+            for group, future in futures:
+                fold(group, future.result())
+
+    if read == 0:
+        raise ValueError(f"No {report} files with channel data for {channels} in {experiment_dir}.")
+
+    return results
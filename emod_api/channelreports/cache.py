@@ -0,0 +1,168 @@
+#!/usr/bin/env python3
+
+"""
+Binary sidecar cache for channel reports (InsetChart.json, PropertyReport.json, etc.).
+
+A sidecar holds the report header, channel names and units as JSON followed by the
+(channels x timesteps) channel data as a raw array which is memory mapped on load.
+Sidecars record the path, size, and modification time of their source report and the
+dtype of their data and are ignored (and rebuilt) when any of these no longer match.
+
+Use ``ChannelReport(filename, cache=True)`` to read through the cache (sidecar next to
+the report) or ``cache=<directory>`` to keep sidecars in a separate directory.
+
+Pre-warm the cache for an experiment directory with
+
+    python -m emod_api.channelreports.cache <directory> [-p InsetChart.json ...] [-w 8]
+"""
+
+import argparse
+from concurrent.futures import ProcessPoolExecutor
+from pathlib import Path
+from typing import Union
+
+import numpy as np
+
+from emod_api import sidecar
+
+_MAGIC = b"EMODCRC1"
+_SUFFIX = ".cache"
+
+DEFAULT_PATTERNS = ["InsetChart.json", "PropertyReport*.json"]
+
+
+def sidecar_path(filename: Union[str, Path], cache_dir: Union[str, Path, None] = None) -> Path:
+
+    """
+    Return the sidecar filename for the given report, next to the report by default
+    or in cache_dir, named by a hash of the report's absolute path.
+    """
+
+    return sidecar.sidecar_path(filename, _SUFFIX, cache_dir)
+
+
+def read(filename: Union[str, Path], dtype=np.float64, cache_dir: Union[str, Path, None] = None):
+
+    """
+    Return (header dictionary, dictionary of units keyed on channel name, memory mapped
+    data, list of integer flags) from the sidecar for the given report or None if there
+    is no valid sidecar.
+
+    Rows of data are in channel name order. The memory map is copy-on-write, changes
+    are not written back to the sidecar. Integer flags are True for channels whose
+    integral values were integers in the report (see write()).
+    """
+
+    path = sidecar_path(filename, cache_dir)
+    found = sidecar.read_metadata(path, _MAGIC)
+    if found is None:
+        return None
+
+    metadata, offset = found
+    if metadata["key"] != sidecar.source_key(filename) or metadata["dtype"] != np.dtype(dtype).str:
+        return None
+
+    shape = tuple(metadata["shape"])
+    if shape[0] * shape[1] == 0:
+        data = np.empty(shape, dtype=dtype)
+    else:
+        data = np.memmap(path, dtype=np.dtype(metadata["dtype"]), mode="c", offset=offset, shape=shape)
+    units = dict(zip(metadata["channels"], metadata["units"]))
+    ints = metadata.get("ints", [False] * len(units))
+
+    return metadata["header"], units, data, ints
+
+
+def write(filename: Union[str, Path], header: dict, units: dict, data: np.ndarray, cache_dir: Union[str, Path, None] = None,
+          ints: list[bool] = None) -> Path:
+
+    """
+    Write the sidecar for the given report.
+
+    Args:
+        filename:  source report
+        header:    report header as a dictionary
+        units:     units keyed on channel name, in channel name order
+        data:      (channels x timesteps) array, rows in channel name order
+        cache_dir: optional directory for the sidecar, default is next to the report
+        ints:      optional flag for each channel, True if its integral values were integers
+                   in the report (so they are written back as integers)
+
+    Returns:
+        sidecar filename
+    """
+
+    assert data.ndim == 2 and data.shape[0] == len(units), "data must have one row per channel"
+    metadata = {
+        "key": sidecar.source_key(filename),
+        "header": header,
+        "channels": list(units),
+        "units": list(units.values()),
+        "dtype": data.dtype.str,
+        "shape": list(data.shape),
+        "ints": [bool(flag) for flag in ints] if ints is not None else [False] * len(units),
+    }
+
+    def fill(file, temporary, offset):
+        file.write(np.ascontiguousarray(data).tobytes())
+
+    return sidecar.write(sidecar_path(filename, cache_dir), _MAGIC, metadata, data.nbytes, fill, filename)
+
+
+def _warm(filename: str, dtype, cache_dir) -> str:
+
+    from emod_api.channelreports.channels import ChannelReport
+
+    ChannelReport(filename, dtype=dtype, cache=cache_dir if cache_dir is not None else True)
+
+    return filename
+
+
+def prewarm(directory: Union[str, Path],
+            patterns: list[str] = None,
+            dtype=np.float64,
+            cache_dir: Union[str, Path, None] = None,
+            workers: int = None) -> list[str]:
+
+    """
+    Build (or refresh) sidecars for all reports under directory matching any of patterns.
+
+    Args:
+        directory: experiment directory, searched recursively
+        patterns:  report filename patterns, default is DEFAULT_PATTERNS
+        dtype:     dtype of cached data
+        cache_dir: optional directory for sidecars, default is next to each report
+        workers:   number of worker processes, <= 1 runs in this process
+
+    Returns:
+        list of report filenames processed
+    """
+
+    patterns = DEFAULT_PATTERNS if patterns is None else patterns
+    filenames = sorted({str(path) for pattern in patterns for path in Path(directory).rglob(pattern)})
+
+    if workers is not None and workers <= 1:
+        return [_warm(filename, dtype, cache_dir) for filename in filenames]
+
+    with ProcessPoolExecutor(max_workers=workers) as executor:
+        return list(executor.map(_warm, filenames, [dtype] * len(filenames), [cache_dir] * len(filenames)))
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Pre-warm channel report sidecar caches for an experiment directory.")
+    parser.add_argument("directory", help="experiment directory, searched recursively")
+    parser.add_argument("-p", "--pattern", action="append", default=None, help=f"report filename pattern (may be repeated) {DEFAULT_PATTERNS}")
+    parser.add_argument("-d", "--cache-dir", default=None, help="directory for sidecars [next to each report]")
+    parser.add_argument("-f", "--float32", action="store_true", help="cache data as float32 rather than float64")
+    parser.add_argument("-w", "--workers", type=int, default=None, help="number of worker processes [CPU count]")
+    args = parser.parse_args()
+
+    dtype = np.float32 if args.float32 else np.float64
+    filenames = prewarm(args.directory, args.pattern, dtype, args.cache_dir, args.workers)
+    print(f"Cached {len(filenames)} report(s).")
+
+    return
+
+
+if __name__ == "__main__":
+    main()
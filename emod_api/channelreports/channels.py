@@ -5,8 +5,16 @@
 from datetime import datetime
 import json
 import csv
+import gzip
+import mmap
+import re
 from pathlib import Path
 from typing import Union
+import warnings
+
+import numpy as np
+
+from emod_api.channelreports import cache as _cache
 
 _CHANNELS = "Channels"
 _DTK_VERSION = "DTK_Version"
@@ -36,6 +44,284 @@ _DATA = "Data"
 _HEADER = "Header"
 
 
+def _is_selected(title: str, channels: list[str]) -> bool:
+
+    """
+    A channel is selected by an entry in channels which is its exact name, its name without
+    property report IP:value qualifiers ("Infected" selects "Infected:QualityOfCare:High"),
+    or a prefix ending with "*" ("New *" selects "New Infections").
+    """
+
+    for name in channels:
+        if title == name or title.startswith(f"{name}:"):
+            return True
+        if name.endswith("*") and title.startswith(name[:-1]):
+            return True
+
+    return False
+
+
+# characters which only appear in JSON numbers written as floats (fraction, exponent, NaN, Infinity)
+_FLOAT_CHARACTERS = np.frombuffer(b".eEN", dtype=np.uint8)
+
+
+def _integral(data: np.ndarray) -> np.ndarray:
+
+    """Mask of the values of data which can be written as JSON integers."""
+
+    with np.errstate(invalid="ignore"):
+        return np.isfinite(data) & (np.abs(data) < 1e16) & (np.trunc(data) == data)
+
+
+def _int_values(ints: np.ndarray, data: np.ndarray):
+
+    """
+    Summarize how the values of a channel were written in the source file, given a mask of values written
+    as JSON integers: None - all as floats, True - every integral value as an integer (EMOD reports), or
+    the mask itself. Channel writers use this to write values as they were read, see _int_mask().
+    """
+
+    if not ints.any():
+        return None
+    if np.array_equal(ints, _integral(data)):
+        return True
+
+    return ints
+
+
+def _int_tokens(values: list):
+
+    """How the values of a JSON Data array, as from json.load(), were written, see _int_values()."""
+
+    ints = np.fromiter((type(value) is int for value in values), dtype=bool, count=len(values))
+
+    return _int_values(ints, np.asarray(values, dtype=np.float64))
+
+
+def _int_mask(data: np.ndarray, ints) -> Union[np.ndarray, None]:
+
+    """Mask of the values of data to write as integers, None if all are written as floats."""
+
+    if ints is None or (ints is not True and len(ints) != len(data)):
+        return None
+    mask = _integral(data)
+
+    return mask if ints is True else mask & ints
+
+
+class _ReportScanner(object):
+
+    """
+    Incremental reader for channel report JSON which only decodes what is asked for.
+
+    The file is memory mapped and walked token by token, so the Data arrays of channels
+    which are not selected are skipped without being read into Python objects.
+    """
+
+    _SPECIAL = re.compile(rb'["\[\]{}]')
+    _SCALAR = re.compile(rb'[^,}\]\s]+')
+
+    def __init__(self, buffer) -> None:
+        self._buffer = buffer
+        self._position = 0
+        self._ints = None
+        return
+
+    @staticmethod
+    def scan(filename: str, channels: Union[list[str], None], dtype=np.float64, ints: bool = False):
+
+        """
+        Return the header dictionary, the number of channels in the file, and a dictionary of
+        (units, data) keyed on channel title. Data is a NumPy array for selected channels
+        (all channels if channels is None) and None for all others.
+
+        With ints, also return a dictionary keyed on selected channel title of how its values
+        were written (see _int_values()).
+        """
+
+        with open(filename, "rb") as file:
+            with mmap.mmap(file.fileno(), 0, access=mmap.ACCESS_READ) as buffer:
+                scanner = _ReportScanner(buffer)
+                scanner._ints = {} if ints else None
+                header, count, found = scanner._report(filename, channels, dtype)
+
+        return (header, count, found, scanner._ints) if ints else (header, count, found)
+
+    def _report(self, filename, channels, dtype):
+
+        header = None
+        found = None
+        count = 0
+        self._expect(b"{")
+        for key in self._members():
+            if key == _HEADER:
+                header = self._value()
+            elif key == _CHANNELS:
+                found = {}
+                self._expect(b"{")
+                for title in self._members():
+                    count += 1
+                    wanted = channels is None or _is_selected(title, channels)
+                    found[title] = self._channel(title, wanted, dtype)
+            else:
+                self._skip()
+
+        assert header is not None, f"'{filename}' missing '{_HEADER}' object."
+        assert found is not None, f"'{filename}' missing '{_CHANNELS}' object."
+
+        return header, count, found
+
+    def _channel(self, title, wanted, dtype):
+
+        units = data = None
+        has_data = False
+        self._expect(b"{")
+        for key in self._members():
+            if key == _UNITS:
+                units = self._value()
+            elif key == _DATA and wanted:
+                start = self._skip() + 1
+                text = self._buffer[start:self._position - 1]
+                data = np.fromstring(text.decode("ascii"), dtype=dtype, sep=",")
+                if self._ints is not None:
+                    # values are integers unless they have a character only floats have
+                    characters = np.frombuffer(text, dtype=np.uint8)
+                    floats = np.flatnonzero(np.isin(characters, _FLOAT_CHARACTERS))
+                    ints = np.ones(len(data), dtype=bool)
+                    ints[np.searchsorted(np.flatnonzero(characters == ord(",")), floats)] = False
+                    self._ints[title] = _int_values(ints, data)
+                has_data = True
+            elif key == _DATA:
+                self._skip()
+                has_data = True
+            else:
+                self._skip()
+
+        assert units is not None, f"Channel '{title}' missing '{_UNITS}' entry."
+        assert has_data, f"Channel '{title}' missing '{_DATA}' entry."
+
+        return units, data
+
+    def _members(self):
+
+        """Yield the keys of the object whose opening brace has been consumed, leaving the position at each value."""
+
+        if self._peek() == ord("}"):
+            self._position += 1
+            return
+        while True:
+            key = self._string()
+            self._expect(b":")
+            yield key
+            if self._peek() == ord(","):
+                self._position += 1
+            else:
+                self._expect(b"}")
+                return
+
+    def _peek(self) -> int:
+
+        buffer = self._buffer
+        position = self._position
+        while buffer[position] in b" \t\r\n":
+            position += 1
+        self._position = position
+
+        return buffer[position]
+
+    def _expect(self, token: bytes) -> None:
+
+        if self._peek() != token[0]:
+            raise ValueError(f"Expected '{token.decode()}' at offset {self._position}.")
+        self._position += 1
+
+        return
+
+    def _string(self) -> str:
+
+        start = self._position
+        self._expect(b'"')
+        self._skip_string()
+
+        return json.loads(self._buffer[start:self._position])
+
+    def _value(self):
+
+        start = self._skip()
+
+        return json.loads(self._buffer[start:self._position])
+
+    def _skip_string(self) -> None:
+
+        """Move past the string whose opening quote has been consumed."""
+
+        buffer = self._buffer
+        end = buffer.find(b'"', self._position)
+        while end > 0 and buffer[end - 1] == ord("\\"):
+            # count backslashes, an even number escape each other and not the quote
+            escapes = 1
+            while buffer[end - 1 - escapes] == ord("\\"):
+                escapes += 1
+            if escapes % 2 == 0:
+                break
+            end = buffer.find(b'"', end + 1)
+        if end < 0:
+            raise ValueError(f"Unterminated string at offset {self._position}.")
+        self._position = end + 1
+
+        return
+
+    def _skip(self) -> int:
+
+        """Move past the next value and return its starting offset."""
+
+        buffer = self._buffer
+        first = self._peek()
+        start = self._position
+
+        if first == ord('"'):
+            self._position += 1
+            self._skip_string()
+        elif first == ord("["):
+            # fast path for arrays of numbers (channel data)
+            end = buffer.find(b"]", start)
+            if end > 0 and buffer.find(b"[", start + 1, end) < 0 and buffer.find(b'"', start, end) < 0 and buffer.find(b"{", start, end) < 0:
+                self._position = end + 1
+            else:
+                self._skip_nested()
+        elif first == ord("{"):
+            self._skip_nested()
+        else:
+            match = self._SCALAR.match(buffer, start)
+            if match is None:
+                raise ValueError(f"Unexpected '{chr(first)}' at offset {start}.")
+            self._position = match.end()
+
+        return start
+
+    def _skip_nested(self) -> None:
+
+        depth = 0
+        position = self._position
+        while True:
+            match = self._SPECIAL.search(self._buffer, position)
+            if match is None:
+                raise ValueError(f"Unterminated value at offset {self._position}.")
+            token = match.group()
+            position = match.end()
+            if token == b'"':
+                self._position = position
+                self._skip_string()
+                position = self._position
+            elif token in (b"[", b"{"):
+                depth += 1
+            else:
+                depth -= 1
+                if depth == 0:
+                    self._position = position
+                    return
+
+
 class Header(object):
 
     # Allow callers to send an arbitrary dictionary, potentially, with extra key:value pairs.
@@ -179,10 +465,19 @@ class Header(object):
 
 class Channel(object):
 
-    def __init__(self, title: str, units: str, data: list) -> None:
+    def __init__(self, title: str, units: str, data: Union[list, np.ndarray], dtype=np.float64, ints=None) -> None:
+        """
+        Channel data is stored as a contiguous NumPy array of the given dtype (float64 or float32).
+
+        ints records which values were integers in the source, so they are written back as integers
+        (see _int_values()), by default the ints in a list of data.
+        """
         self._title = title
         self._units = units
-        self._data = data
+        if ints is None and isinstance(data, (list, tuple)):
+            ints = _int_tokens(data)
+        self._data = np.ascontiguousarray(data, dtype=dtype)
+        self._ints = ints
         return
 
     @property
@@ -204,7 +499,7 @@ class Channel(object):
         return
 
     @property
-    def data(self):
+    def data(self) -> np.ndarray:
         return self._data
 
     def __getitem__(self, item):
@@ -216,17 +511,165 @@ class Channel(object):
         self._data[key] = value
         return
 
+    def __array__(self, dtype=None, copy=None) -> np.ndarray:
+        return self._data if dtype is None else self._data.astype(dtype)
+
+    @property
+    def nbytes(self) -> int:
+        """Bytes of channel data"""
+        return self._data.nbytes
+
+    # element-wise arithmetic with channels, arrays, or scalars returns a NumPy array, see ChannelReport.add_channel()
+
+    def __add__(self, other) -> np.ndarray:
+        return self._data + _values(other)
+
+    def __radd__(self, other) -> np.ndarray:
+        return _values(other) + self._data
+
+    def __sub__(self, other) -> np.ndarray:
+        return self._data - _values(other)
+
+    def __rsub__(self, other) -> np.ndarray:
+        return _values(other) - self._data
+
+    def __mul__(self, other) -> np.ndarray:
+        return self._data * _values(other)
+
+    def __rmul__(self, other) -> np.ndarray:
+        return _values(other) * self._data
+
+    def __truediv__(self, other) -> np.ndarray:
+        return self._data / _values(other)
+
+    def __rtruediv__(self, other) -> np.ndarray:
+        return _values(other) / self._data
+
     def as_dictionary(self) -> dict:
-        return {self.title: {_UNITS: self.units, _DATA: list(self.data)}}
+        return {self.title: {_UNITS: self.units, _DATA: self.values()}}
+
+    def values(self) -> list:
+        """Channel data as a list of Python numbers, integers where the source had integers."""
+        return _python_values(self._data, _int_mask(self._data, self._ints))
+
+
+def _python_values(data: np.ndarray, mask: Union[np.ndarray, None]) -> list:
+
+    """Values of data as Python floats, or ints where mask is set."""
+
+    if mask is None or not mask.any():
+        return data.tolist()
+    if mask.all():
+        return data.astype(np.int64).tolist()
+
+    values = data.astype(object)
+    values[mask] = data[mask].astype(np.int64).astype(object)
+
+    return values.tolist()
+
+
+def _values(operand):
+
+    """Data of a Channel or ChannelReport, other operands (arrays, scalars) as is."""
+
+    if isinstance(operand, Channel):
+        return operand.data
+    if isinstance(operand, ChannelReport):
+        return operand.as_matrix()
+
+    return operand
+
+
+class _JsonLayout(object):
+
+    """
+    Encode JSON piecewise with the same layout as json.dump() for a given indent and separators.
+    """
+
+    def __init__(self, indent, separators) -> None:
+
+        if separators is None:
+            separators = (", ", ": ") if indent is None else (",", ": ")
+        self.item_separator, self.key_separator = separators
+        self._indent = indent if indent is None or isinstance(indent, str) else " " * indent
+
+        return
+
+    def newline(self, level: int) -> str:
+        return "" if self._indent is None else "\n" + self._indent * level
+
+    def key(self, key) -> str:
+        return json.dumps(key if isinstance(key, str) else json.dumps(key)) + self.key_separator
+
+    def value(self, value, level: int) -> str:
+        """Encode value nested at the given level."""
+        text = json.dumps(value, indent=self._indent, separators=(self.item_separator, self.key_separator))
+        # newlines in json output are only layout, newlines in strings are escaped
+        return text if self._indent is None else text.replace("\n", self.newline(level))
+
+    def floats(self, data: np.ndarray, level: int, ints: Union[np.ndarray, None] = None) -> str:
+        """
+        Encode an array of floats, nested at the given level, as json encodes the Python floats from data.tolist(),
+        or the Python ints where the ints mask (see _int_mask()) is set.
+        """
+        if len(data) == 0:
+            return "[]"
+        separator = self.item_separator + self.newline(level)
+        if ints is not None and ints.all():
+            text = separator.join(map(int.__repr__, data.astype(np.int64).tolist()))
+        elif ints is not None and ints.any():
+            encode = float.__repr__ if np.isfinite(data).all() else _float_string
+            text = separator.join(int.__repr__(int(value)) if integer else encode(value)
+                                  for value, integer in zip(data.tolist(), ints.tolist()))
+        elif np.all(np.abs(data) < 1e16) and np.array_equal(np.trunc(data), data) and not np.signbit(data[data == 0]).any():
+            # integral values (counts) - int formatting is faster and repr(float(n)) is repr(n) + ".0" in this range
+            text = (".0" + separator).join(map(int.__repr__, data.astype(np.int64).tolist())) + ".0"
+        else:
+            encode = float.__repr__ if np.isfinite(data).all() else _float_string
+            text = separator.join(map(encode, data.tolist()))
+        return "[" + self.newline(level) + text + self.newline(level - 1) + "]"
+
+
+def _float_string(value: float) -> str:
+
+    if value != value:
+        return "NaN"
+    if value == float("inf"):
+        return "Infinity"
+    if value == -float("inf"):
+        return "-Infinity"
+
+    return float.__repr__(value)
 
 
 class ChannelReport(object):
 
-    def __init__(self, filename: str = None, **kwargs):
+    def __init__(self, filename: str = None, dtype=np.float64, channels: list[str] = None, cache: Union[bool, str, Path] = False, **kwargs):
+
+        """
+        Create an empty report (header values from kwargs) or read one from filename.
+
+        Args:
+            filename: optional channel report (e.g., InsetChart.json or PropertyReport.json) to read
+            dtype:    NumPy dtype for channel data, float64 (default) or float32
+            channels: optional list of channels to read from filename, by name or prefix (see
+                      _is_selected()), data for other channels is skipped rather than parsed
+            cache:    read filename through a binary sidecar (see emod_api.channelreports.cache),
+                      True keeps the sidecar next to filename, a directory keeps it there
+        """
+
+        self._dtype = np.dtype(dtype)
+        self._matrix = None     # (channels x timesteps) storage shared by the channels, see as_matrix()
+        self._rows = []         # (title, channel, row view) for each row of _matrix
 
         if filename is not None:
             assert isinstance(filename, str), "filename must be a string"
-            self._from_file(filename)
+            if cache:
+                self._from_cache(filename, channels, None if cache is True else cache)
+            elif channels is None:
+                self._from_file(filename)
+            else:
+                self._from_file_selected(filename, channels)
         else:
             self._header = Header(**kwargs)
             self._channels = {}
@@ -328,8 +771,259 @@ class ChannelReport(object):
         """Return Channel object by channel name/title"""
         return self._channels[item]
 
+    @property
+    def dtype(self) -> np.dtype:
+        return self._dtype
+
+    @property
+    def nbytes(self) -> int:
+
+        """
+        Bytes of channel data held by this report: the shared (channels x timesteps) array
+        (see as_matrix()) plus any channels added or replaced since. Data read through a
+        cache is memory mapped and counted at its full size although pages are only
+        loaded as they are read.
+        """
+
+        shared = self._matrix.nbytes if self._matrix is not None else 0
+        rows = {id(row) for _, _, row in self._rows}
+
+        return shared + sum(channel.nbytes for channel in self._channels.values() if id(channel.data) not in rows)
+
+    @staticmethod
+    def read_header(filename: Union[str, Path]) -> tuple[Header, dict[str, str]]:
+
+        """
+        Read only the header, channel names, and channel units of a channel report.
+
+        Channel data is skipped rather than parsed, so this is much faster than reading the
+        report, e.g., to check that all simulations of an experiment have the same channels
+        and number of time steps.
+
+        Args:
+            filename: channel report (e.g., InsetChart.json or PropertyReport.json) to read
+
+        Returns:
+            tuple of the report Header and a dictionary of units keyed on channel name
+        """
+
+        assert isinstance(filename, (str, Path)), "filename must be a string or Path"
+        filename = str(filename)
+        header_dict, count, found = _ReportScanner.scan(filename, [])
+        assert _CHANNELS in header_dict, f"'{filename}' missing '{_HEADER}/{_CHANNELS}' key."
+        assert header_dict[_CHANNELS] == count, (
+            f"'{filename}': "
+            + f"'{_HEADER}/{_CHANNELS}' ({header_dict[_CHANNELS]}) does not match number of {_CHANNELS} ({count})."
+        )
+
+        return Header(**header_dict), {title: found[title][0] for title in sorted(found)}
+
+    def as_matrix(self, channel_names: list[str] = None) -> np.ndarray:
+
+        """
+        Return channel data as a (channels x timesteps) NumPy array.
+
+        With the default, all channels in channel_names order, the array is a view of the
+        storage shared by the Channel objects, so no data is copied and changes to the array
+        are visible through the channels (and vice versa). A selection of channels which
+        are adjacent in channel_names order is also a view, any other selection is a copy.
+
+        Args:
+            channel_names: optional list of channels (by name) to return, in row order
+        """
+
+        self._consolidate()
+
+        if channel_names is None:
+            return self._matrix
+
+        index = {title: row for row, (title, _, _) in enumerate(self._rows)}
+        rows = [index[name] for name in channel_names]
+        if rows and rows == list(range(rows[0], rows[0] + len(rows))):
+            return self._matrix[rows[0]:rows[0] + len(rows)]
+
+        return self._matrix[rows]
+
+    def add_channel(self, title: str, units: str, data: Union[list, np.ndarray]) -> Channel:
+
+        """
+        Add (or replace) a channel, e.g., a derived channel:
+
+            report.add_channel("Prevalence", "fraction", report["Infected"] / report["Statistical Population"])
+        """
+
+        self._channels[title] = Channel(title, units, data, self._dtype)
+
+        return self._channels[title]
+
+    def _derived(self, matrix: np.ndarray, **header) -> "ChannelReport":
+
+        """New report with the given (channels x timesteps) data for this report's channels and updated header values."""
+
+        header = {**self._header.as_dictionary(), _CHANNELS: len(self._rows), _TIMESTEPS: matrix.shape[1], **header}
+        report = ChannelReport(dtype=self._dtype, **header)
+        report._matrix = np.ascontiguousarray(matrix, dtype=self._dtype)
+        for row, (title, channel, _) in enumerate(self._rows):
+            report._channels[title] = Channel(title, channel.units, report._matrix[row], self._dtype)
+            report._rows.append((title, report._channels[title], report._channels[title].data))
+
+        return report
+
+    def _arithmetic(self, other, operation) -> "ChannelReport":
+
+        self._consolidate()
+        if isinstance(other, ChannelReport):
+            assert other.channel_names == self.channel_names, "Reports must have the same channels."
+            assert other.as_matrix().shape == self._matrix.shape, "Reports must have the same number of time steps."
+
+        return self._derived(operation(self._matrix, _values(other)))
+
+    # element-wise arithmetic with reports (same channels and time steps), arrays, or scalars returns a new report
+
+    def __add__(self, other) -> "ChannelReport":
+        return self._arithmetic(other, np.add)
+
+    def __radd__(self, other) -> "ChannelReport":
+        return self._arithmetic(other, lambda a, b: np.add(b, a))
+
+    def __sub__(self, other) -> "ChannelReport":
+        return self._arithmetic(other, np.subtract)
+
+    def __rsub__(self, other) -> "ChannelReport":
+        return self._arithmetic(other, lambda a, b: np.subtract(b, a))
+
+    def __mul__(self, other) -> "ChannelReport":
+        return self._arithmetic(other, np.multiply)
+
+    def __rmul__(self, other) -> "ChannelReport":
+        return self._arithmetic(other, lambda a, b: np.multiply(b, a))
+
+    def __truediv__(self, other) -> "ChannelReport":
+        return self._arithmetic(other, np.true_divide)
+
+    def __rtruediv__(self, other) -> "ChannelReport":
+        return self._arithmetic(other, lambda a, b: np.true_divide(b, a))
+
+    def resample(self, interval: int, how: str = "sum", origin: int = None, partial: bool = True) -> "ChannelReport":
+
+        """
+        Rebin channels into intervals of simulation time, e.g., weekly rollups of daily channels.
+
+        Time step i is at time Start_Time + i * Simulation_Timestep and falls in the bin
+        [origin + k * interval, origin + (k + 1) * interval). The first bin kept must not start
+        before time 0 (Start_Time >= 0), so an origin which puts a partial bin there is rejected,
+        use partial=False or an origin which is Start_Time modulo interval.
+
+        Args:
+            interval: bin width in simulation time, a multiple of Simulation_Timestep
+            how:      "sum" (e.g., for incidence channels) or "mean" (e.g., for prevalence channels)
+            origin:   time at which a bin starts, default is Start_Time
+            partial:  keep first and last bins which don't have interval / Simulation_Timestep steps
+
+        Returns:
+            new report with Simulation_Timestep = interval and Start_Time = start of the first bin
+        """
+
+        assert how in ("sum", "mean"), f"how must be 'sum' or 'mean', not '{how}'"
+        assert interval > 0 and interval % self.step_size == 0, f"interval ({interval}) must be a multiple of Simulation_Timestep ({self.step_size})"
+
+        matrix = self.as_matrix()
+        origin = self.start_time if origin is None else origin
+        times = self.start_time + np.arange(matrix.shape[1]) * self.step_size
+        bins = (times - origin) // interval
+        starts = np.flatnonzero(np.r_[True, np.diff(bins) != 0])
+        counts = np.diff(np.r_[starts, len(bins)])
+        sums = np.add.reduceat(matrix, starts, axis=1, dtype=np.float64)
+        if how == "mean":
+            sums /= counts
+        if not partial:
+            full = counts == interval // self.step_size
+            assert full.any(), "No complete bins, use partial=True or a smaller interval."
+            sums, starts = sums[:, full], starts[full]
+
+        start = int(origin + bins[starts[0]] * interval)
+        assert start >= 0, f"origin ({origin}) puts the first bin at time {start} < 0, use partial=False or a different origin"
+
+        return self._derived(sums, **{_SIMULATION_TIMESTEP: interval, _START_TIME: start})
+
+    def rolling(self, window: int, how: str = "mean") -> "ChannelReport":
+
+        """
+        Trailing rolling sum or mean over window time steps. The first window - 1 values are
+        over the available (fewer) time steps.
+
+        Returns:
+            new report with the same header values
+        """
+
+        assert how in ("sum", "mean"), f"how must be 'sum' or 'mean', not '{how}'"
+        assert window >= 1, "window must be >= 1"
+
+        matrix = self.as_matrix()
+        cumulative = np.cumsum(matrix, axis=1, dtype=np.float64)
+        sums = cumulative.copy()
+        sums[:, window:] -= cumulative[:, :-window]
+        if how == "mean":
+            sums /= np.minimum(np.arange(1, matrix.shape[1] + 1), window)
+
+        return self._derived(sums)
+
+    @staticmethod
+    def combine(reports: list["ChannelReport"], how: str = "mean") -> "ChannelReport":
+
+        """
+        Element-wise sum or mean of reports with the same channels and time steps (e.g., replicates).
+
+        Returns:
+            new report with the header values of the first report
+        """
+
+        assert how in ("sum", "mean"), f"how must be 'sum' or 'mean', not '{how}'"
+        assert len(reports) > 0, "No reports to combine."
+
+        first = reports[0]
+        total = first.as_matrix().astype(np.float64)
+        for report in reports[1:]:
+            assert report.channel_names == first.channel_names, "Reports must have the same channels."
+            assert report.as_matrix().shape == total.shape, "Reports must have the same number of time steps."
+            total += report.as_matrix()
+        if how == "mean":
+            total /= len(reports)
+
+        return first._derived(total)
+
+    def _consolidate(self) -> None:
+
+        """Make sure every channel's data is a row of self._matrix, copying channels added since the last call."""
+
+        titles = self.channel_names
+        if self._matrix is not None and len(self._rows) == len(titles) and all(
+            title == name and self._channels[name] is channel and channel.data is row
+            for (title, channel, row), name in zip(self._rows, titles)
+        ):
+            return
+
+        counts = set([len(self._channels[title].data) for title in titles])
+        assert len(counts) <= 1, f"Channels do not all have the same number of values ({counts})"
+        count = counts.pop() if counts else self.num_time_steps
+
+        self._matrix = np.empty((len(titles), count), dtype=self._dtype)
+        self._rows = []
+        for row, title in enumerate(titles):
+            channel = self._channels[title]
+            self._matrix[row] = channel.data
+            channel._data = self._matrix[row]
+            self._rows.append((title, channel, channel.data))
+
+        return
+
     def write_file(self, filename: str, indent: int = 0, separators=(",", ":")) -> None:
-        """Write inset chart to specified text file."""
+        """
+        Write inset chart to specified text file.
+
+        Output is identical to json.dump() of {"Header": ..., "Channels": {title: Channel.as_dictionary()...}}
+        with the given indent and separators but each channel is encoded and written in turn.
+        """
 
         # in case this was generated locally, lets do some consistency checks
         assert len(self._channels) > 0, "Report has no channels."
@@ -341,13 +1035,25 @@ class ChannelReport(object):
         self._header.num_channels = len(self._channels)
         self.num_time_steps = len(self._channels[self.channel_names[0]].data)
 
-        with open(filename, "w", encoding="utf-8") as file:
-            channels = {}
-            for _, channel in self.channels.items():
-                # https://stackoverflow.com/questions/38987/how-do-i-merge-two-dictionaries-in-a-single-expression
-                channels = {**channels, **channel.as_dictionary()}
-            chart = {_HEADER: self.header.as_dictionary(), _CHANNELS: channels}
-            json.dump(chart, file, indent=indent, separators=separators)
+        # channels are keyed on their title in the file
+        channels = {}
+        for channel in self.channels.values():
+            channels[channel.title] = channel
+
+        layout = _JsonLayout(indent, separators)
+        with open(filename, "w", encoding="utf-8", buffering=1 << 20) as file:
+            file.write("{" + layout.newline(1) + layout.key(_HEADER))
+            file.write(layout.value(self.header.as_dictionary(), 1))
+            file.write(layout.item_separator + layout.newline(1) + layout.key(_CHANNELS) + "{")
+            for index, (title, channel) in enumerate(channels.items()):
+                if index > 0:
+                    file.write(layout.item_separator)
+                file.write(layout.newline(2) + layout.key(title) + "{")
+                file.write(layout.newline(3) + layout.key(_UNITS) + layout.value(channel.units, 3))
+                file.write(layout.item_separator + layout.newline(3) + layout.key(_DATA))
+                file.write(layout.floats(channel.data, 4, _int_mask(channel.data, channel._ints)))
+                file.write(layout.newline(2) + "}")
+            file.write(layout.newline(1) + "}" + layout.newline(0) + "}")
 
         return
 
@@ -391,12 +1097,80 @@ class ChannelReport(object):
             self._header = Header(**header_dict)
             self._channels = {}
 
+            # channel data goes straight into rows of one (channels x timesteps) array
             channels = jason[_CHANNELS]
-            for title, channel in channels.items():
+            titles = sorted(channels)
+            self._matrix = np.empty((len(titles), self._header.num_time_steps), dtype=self._dtype)
+            for row, title in enumerate(titles):
+                channel = channels[title]
                 validate_channel(channel, title, self._header)
-                units = channel[_UNITS]
-                data = channel[_DATA]
-                self._channels[title] = Channel(title, units, data)
+                self._matrix[row] = channel[_DATA]
+                self._channels[title] = Channel(title, channel[_UNITS], self._matrix[row], self._dtype, _int_tokens(channel[_DATA]))
+                self._rows.append((title, self._channels[title], self._channels[title].data))
+            # keep the file's channel order, for writing
+            self._channels = {title: self._channels[title] for title in channels}
+
+        return
+
+    def _from_file_selected(self, filename: str, channels: list[str]) -> None:
+
+        if isinstance(channels, str):
+            channels = [channels]
+
+        header_dict, count, found, ints = _ReportScanner.scan(filename, channels, self._dtype, ints=True)
+        assert _CHANNELS in header_dict, f"'{filename}' missing '{_HEADER}/{_CHANNELS}' key."
+        assert _TIMESTEPS in header_dict, f"'{filename}' missing '{_HEADER}/{_TIMESTEPS}' key."
+        assert header_dict[_CHANNELS] == count, (
+            f"'{filename}': "
+            + f"'{_HEADER}/{_CHANNELS}' ({header_dict[_CHANNELS]}) does not match number of {_CHANNELS} ({count})."
+        )
+
+        self._header = Header(**header_dict)
+        self._channels = {}
+
+        titles = sorted(title for title, (_, data) in found.items() if data is not None)
+        self._matrix = np.empty((len(titles), self._header.num_time_steps), dtype=self._dtype)
+        for row, title in enumerate(titles):
+            units, data = found[title]
+            assert (
+                len(data) == self._header.num_time_steps
+            ), f"Channel '{title}' data values ({len(data)}) does not match header Time_Steps ({self._header.num_time_steps})."
+            self._matrix[row] = data
+            self._channels[title] = Channel(title, units, self._matrix[row], self._dtype, ints[title])
+            self._rows.append((title, self._channels[title], self._channels[title].data))
+        self._channels = {title: self._channels[title] for title in found if title in self._channels}
+
+        return
+
+    def _from_cache(self, filename: str, channels: list[str], cache_dir: Union[str, Path, None]) -> None:
+
+        cached = _cache.read(filename, self._dtype, cache_dir)
+        if cached is None:
+            self._from_file(filename)
+            units = {title: channel.units for title, channel, _ in self._rows}
+            # only "integral values are integers" is kept, other channels are written back as floats
+            ints = [channel._ints is True for _, channel, _ in self._rows]
+            try:
+                _cache.write(filename, self._header.as_dictionary(), units, self._matrix, cache_dir, ints)
+            except OSError as ex:
+                warnings.warn(f"Could not write cache for '{filename}': {ex}")
+            header_dict, data = self._header.as_dictionary(), self._matrix
+        else:
+            header_dict, units, data, ints = cached
+
+        self._header = Header(**header_dict)
+        self._channels = {}
+        self._rows = []
+
+        if isinstance(channels, str):
+            channels = [channels]
+        titles = list(units)
+        rows = [row for row, title in enumerate(titles) if channels is None or _is_selected(title, channels)]
+        self._matrix = data if len(rows) == len(titles) else data[rows]
+        for row, source in enumerate(rows):
+            title = titles[source]
+            self._channels[title] = Channel(title, units[title], self._matrix[row], self._dtype, True if ints[source] else None)
+            self._rows.append((title, self._channels[title], self._channels[title].data))
 
         return
 
@@ -406,6 +1180,8 @@ class ChannelReport(object):
         Write each channel from the report to a row, CSV style, in the given file.
 
         Channel name goes in the first column, channel data goes into subsequent columns.
+        The data is gathered into one matrix and written in bulk. Filenames ending in ".gz"
+        are written gzip compressed.
 
         Args:
             filename: string or path specifying destination file
@@ -416,17 +1192,32 @@ class ChannelReport(object):
         if channel_names is None:
             channel_names = self.channel_names
 
-        if not transpose:  # default
-            with open(filename, "w") as g_f:
-                csv_obj = csv.writer(g_f, dialect='unix', quoting=csv.QUOTE_MINIMAL)
-                for cname in channel_names:
-                    csv_obj.writerow([cname] + list(self[cname]))
+        matrix = self.as_matrix(channel_names)
+        masks = [_int_mask(row, self._channels[name]._ints) for name, row in zip(channel_names, matrix)]
+        if matrix.dtype == np.float64:
+            # Python floats format as float64 NumPy scalars do, integers where the source had integers
+            values = [_python_values(row, mask) for row, mask in zip(matrix, masks)]
+        else:
+            # float32 data needs NumPy's formatting
+            values = matrix.astype(str).tolist()
+            for row, data, mask in zip(values, matrix, masks):
+                if mask is not None:
+                    for column in np.flatnonzero(mask).tolist():
+                        row[column] = str(int(data[column]))
+        if transpose:
+            values = [list(column) for column in zip(*values)]
+
+        if str(filename).endswith(".gz"):
+            g_f = gzip.open(filename, "wt")
+        else:
+            g_f = open(filename, "w", buffering=1 << 20)
 
-        else:  # transposed
-            with open(filename, "w") as g_f:
-                csv_obj = csv.writer(g_f, dialect='unix', quoting=csv.QUOTE_MINIMAL)
+        with g_f:
+            csv_obj = csv.writer(g_f, dialect='unix', quoting=csv.QUOTE_MINIMAL)
+            if not transpose:  # default
+                csv_obj.writerows([cname] + row for cname, row in zip(channel_names, values))
+            else:  # transposed
                 csv_obj.writerow(channel_names)
-                for row_idx in range(self.num_time_steps):
-                    csv_obj.writerow([self[cname][row_idx] for cname in channel_names])
+                csv_obj.writerows(values)
 
         return
@@ -0,0 +1,136 @@
+#!/usr/bin/env python3
+
+"""
+Downsampling of long time series for plotting.
+
+A figure can only show about as many distinct x positions as it is wide in pixels, so
+handing matplotlib every point of a multi-decade daily series (times hundreds of traces)
+costs rendering time and file size without changing the picture. These functions pick a
+subset of the points which draws (nearly) the same line.
+
+    minmax: the first minimum and first maximum of each of about points/2 equal buckets, so every
+            peak and trough survives - the default, exact to the pixel for line plots
+    lttb:   Largest-Triangle-Three-Buckets (Steinarsson, 2013), one point per bucket chosen
+            to preserve the visual shape of the series
+
+Both return indices into the series, so the same selection can be applied to x values.
+
+    from emod_api.channelreports.downsample import downsample
+    x, y = downsample(report["Infected"].data, 2000)
+"""
+
+from typing import Optional
+
+import numpy as np
+
+METHODS = ["minmax", "lttb"]
+
+
+def minmax_indices(data: np.ndarray, points: int) -> np.ndarray:
+
+    """
+    Return sorted indices of the first and last values and the minimum and maximum of each of
+    (points - 2) // 2 buckets of data. Buckets of only NaN contribute no indices.
+
+    Args:
+        data:   1-D array
+        points: maximum number of indices to return
+
+    Returns:
+        sorted array of indices, all indices if data has no more than points values
+    """
+
+    data = np.asarray(data)
+    count = len(data)
+    buckets = (points - 2) // 2
+    if count <= points or buckets < 1:
+        return np.arange(count)
+
+    edges = np.linspace(0, count, buckets + 1).astype(np.int64)[:-1]
+    bucket = np.repeat(np.arange(buckets), np.diff(np.append(edges, count)))
+    indices = [np.array([0, count - 1])]
+    # fmin/fmax ignore NaN, so a bucket's extreme is found wherever it has a valid value
+    for reduce in (np.fmin, np.fmax):
+        extremes = reduce.reduceat(data, edges)
+        matches = np.flatnonzero(data == extremes[bucket])
+        _, first = np.unique(bucket[matches], return_index=True)
+        indices.append(matches[first])
+
+    return np.unique(np.concatenate(indices))
+
+
+def lttb_indices(data: np.ndarray, points: int, x: Optional[np.ndarray] = None) -> np.ndarray:
+
+    """
+    Return sorted indices of points values of data chosen by Largest-Triangle-Three-Buckets:
+    the first and last values plus, from each of points - 2 buckets, the value forming the
+    largest triangle with the previously chosen value and the mean of the next bucket.
+
+    Args:
+        data:   1-D array of finite values
+        points: number of indices to return, at least 3
+        x:      optional x values for data, default is the index
+
+    Returns:
+        sorted array of indices, all indices if data has no more than points values
+    """
+
+    data = np.asarray(data, dtype=np.float64)
+    count = len(data)
+    if count <= points or points < 3:
+        return np.arange(count)
+
+    x = np.arange(count, dtype=np.float64) if x is None else np.asarray(x, dtype=np.float64)
+    # points - 2 buckets over data[1:-1], each at least one value wide since count > points
+    edges = np.linspace(1, count - 1, points - 1).astype(np.int64)
+    selected = np.empty(points, dtype=np.int64)
+    selected[0] = 0
+    selected[-1] = count - 1
+
+    anchor = 0
+    for bucket in range(points - 2):
+        start, stop = edges[bucket], edges[bucket + 1]
+        if bucket + 2 < len(edges):
+            next_x = x[stop:edges[bucket + 2]].mean()
+            next_y = data[stop:edges[bucket + 2]].mean()
+        else:
+            next_x, next_y = x[-1], data[-1]
+        # twice the area of each triangle (anchor, candidate, next bucket mean)
+        areas = np.abs((x[anchor] - next_x) * (data[start:stop] - data[anchor]) - (x[anchor] - x[start:stop]) * (next_y - data[anchor]))
+        anchor = start + int(np.argmax(areas))
+        selected[bucket + 1] = anchor
+
+    return selected
+
+
+def downsample(data: np.ndarray,
+               points: Optional[int],
+               method: str = "minmax",
+               x: Optional[np.ndarray] = None) -> tuple[np.ndarray, np.ndarray]:
+
+    """
+    Downsample a series for plotting.
+
+    Args:
+        data:   1-D array
+        points: maximum number of points to keep, None keeps all points
+        method: "minmax" or "lttb"
+        x:      optional x values for data, default is the index
+
+    Returns:
+        tuple of (x values, data values) of the points kept
+    """
+
+    data = np.asarray(data)
+    x = np.arange(len(data)) if x is None else np.asarray(x)
+    if points is None or len(data) <= points:
+        return x, data
+
+    if method == "minmax":
+        indices = minmax_indices(data, points)
+    elif method == "lttb":
+        indices = lttb_indices(data, points, x)
+    else:
+        raise ValueError(f"Unknown downsampling method '{method}', use one of {METHODS}.")
+
+    return x[indices], data[indices]
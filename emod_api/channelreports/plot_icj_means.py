@@ -1,14 +1,17 @@
 import json
 import numpy as np
-import matplotlib.pyplot as plt
 import os
-import sqlite3
+from typing import Union
+
+from emod_api.channelreports.smoothing import stack_series, smooth
+from emod_api.results_catalog import open_catalog, parse_value
 
 
 def collect(exp_id: str,
             chan: str = "Infected",
             tag: str = None,
-            smoothing: bool = True) -> dict:
+            smoothing: Union[bool, str] = True,
+            **kwargs) -> dict:
     """
     Collect all the time series data for a given channel for a given experiment from InsetChart.json
     files in local subdirectory that have been downoaded from COMPS, assuming following structure.
@@ -22,9 +25,12 @@ def collect(exp_id: str,
         chan:   Channel name
         tag:    key=value. Using results.db (sqlite3, from emodpy), limit results to just where key=value.
                 If value is set to SWEEP, find all values for key and plot all values separately (but with mean/spread from other tags).
+        smoothing: True for a 7 step moving average, False for none, or a method of emod_api.channelreports.smoothing.smooth()
+                ("moving_average", "exponential", or "loess"), applied to all series of a group in one pass.
+        kwargs: parameters for the smoothing method, e.g., window=14
 
     Returns:
-        Array of channel data for further processing.
+        Array of channel data for further processing. Series which ended early are padded with NaN (use np.nanmean() etc.).
     """
 
     chan_data = {}
@@ -35,31 +41,15 @@ def collect(exp_id: str,
 
         groupby_key = tag.split("=")[0]
         groupby_value = tag.split("=")[1]
-        db = os.path.join("latest_experiment", "results.db")
-        con = sqlite3.connect(db)
-        cur = con.cursor()
-        if groupby_value == "SWEEP":
-            query = f"SELECT sim_id, {groupby_key} FROM results"
-            all_results = cur.execute(query)
-            for result in all_results:
-                sim_id = result[0]
-                groupby_value = result[1]
-                if groupby_value not in groupby_values:
-                    groupby_values[groupby_value] = list()
-                groupby_values[groupby_value].append(sim_id)
-        else: # select only sim_id's where gb key == value
-            query = f"SELECT sim_id FROM results where {groupby_key} = {groupby_value}"
-            all_results = cur.execute(query)
-            groupby_values["ref"] = list()
-            for result in all_results:
-                sim_id = result[0]
-                groupby_values["ref"].append(sim_id)
+        with open_catalog(os.path.join("latest_experiment", "results.db")) as catalog:
+            catalog.ensure_index(groupby_key)
+            if groupby_value == "SWEEP":
+                groupby_values = catalog.groups(groupby_key)
+            else: # select only sim_id's where gb key == value
+                groupby_values["ref"] = catalog.sim_ids(groupby_key, parse_value(groupby_value))
     else:
-        groupby_values["ref"] = os.listdir(exp_id)
-        groupby_values["ref"].remove("results.db")
-
-    def moving_average(x, w=7):
-        return np.convolve(x, np.ones(w), 'valid') / w
+        with open_catalog(os.path.join(exp_id, "results.db")) as catalog:
+            groupby_values["ref"] = catalog.all_sim_ids()
 
     max_len = 0
     # poi = param of interest
@@ -77,8 +67,6 @@ def collect(exp_id: str,
             if chan not in icj["Channels"]:
                 raise ValueError(f"Can't find channel {chan} in file. Did find {icj['Channels'].keys()}.")
             new_data = np.asarray(icj["Channels"][chan]["Data"])
-            if smoothing:
-                new_data = moving_average(new_data)
             chan_data[value].append(new_data)
             if len(new_data) > max_len:
                 max_len = len(new_data)
@@ -86,15 +74,16 @@ def collect(exp_id: str,
         raise ValueError(f"No InsetChart.json files with channel data for {chan} and experiment {exp_id}.")
     """
     If users run simulations that end when prevalence is zero, the length of the time series can vary
-    We need to get them all the same to calc the mean.
+    We need to get them all the same to calc the mean, so pad with NaN (zeros would skew the mean).
+    Smoothing runs on all series of a group at once and ignores the padding.
     """
+    method = "moving_average" if smoothing is True else smoothing
     data_for_plotting = {}
     for poi in chan_data:
-        data_for_plotting[poi] = []
-        for data in chan_data[poi]:
-            if len(data) < max_len:
-                data = np.pad(data, (0, max_len - len(data)))
-            data_for_plotting[poi].append(data)
+        stacked, mask = stack_series(chan_data[poi], max_len)
+        if method:
+            stacked = smooth(stacked, mask, method, **kwargs)
+        data_for_plotting[poi] = list(stacked)
 
     return data_for_plotting
 
@@ -103,6 +92,8 @@ def display(chan_data, save=False, chan_name="Infected", exp_id=None):
     """
     Plot mean and std dev of the array/list of time series-es in chan_data.
     """
+    import matplotlib.pyplot as plt
+
     mean_chan_data = None
     spread_chan_data = None
     fig, ax = plt.subplots(1)
@@ -112,13 +103,13 @@ def display(chan_data, save=False, chan_name="Infected", exp_id=None):
         prev_list = chan_data[poi_chan_data]
         if len(prev_list) == 0:
             raise ValueError("Input channel data array seems to have no data.")
-        mean_chan_data = np.mean(np.array(prev_list), axis=0)
+        mean_chan_data = np.nanmean(np.array(prev_list), axis=0)
         if len(chan_data) == 1 and save:
             ref_json = {"Channels": {"Channel": {"Data": []}}}
             ref_json["Channels"]["Channel"]["Data"] = list(mean_chan_data)
             with open("mean_ref.json", "w") as fp:
                 json.dump(ref_json, fp, indent=4)
-        spread_chan_data = np.std(np.array(prev_list), axis=0)
+        spread_chan_data = np.nanstd(np.array(prev_list), axis=0)
 
         t = np.arange(len(mean_chan_data))
         ax.plot(t, mean_chan_data, label=poi_chan_data)
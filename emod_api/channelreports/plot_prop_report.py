@@ -7,7 +7,6 @@ from functools import reduce
 import json
 from pathlib import Path
 
-import matplotlib.pyplot as plt
 import numpy as np
 
 from emod_api.channelreports.utils import read_json_file, get_report_channels, accumulate_channel_data, save_to_csv, plot_traces
@@ -20,7 +19,8 @@ def main(args: argparse.Namespace):
     Plot specified property report with the given options.
     """
 
-    json_data = read_json_file(args.filename)
+    dtype = np.dtype(getattr(args, "dtype", None) or np.float32)
+    json_data = read_json_file(args.filename, dtype=dtype)
     channel_data = get_report_channels(json_data)
     channel_keys = sorted(channel_data)
 
@@ -38,7 +38,7 @@ def main(args: argparse.Namespace):
     if args.normalize and ("Statistical Population" not in args.channels):
         args.channels.append("Statistical Population")
 
-    trace_values = accumulate_channel_data(args.channels, args.verbose, args.groupby, channel_data)
+    trace_values = accumulate_channel_data(args.channels, args.verbose, args.groupby, channel_data, dtype=dtype)
 
     if args.csv is None:
         call_plot_traces(args, trace_values)
@@ -96,12 +96,16 @@ def call_plot_traces(args: argparse.Namespace,
         traces = trace_values
         norms = None
 
-    figure = plot_traces(traces, norms, args.overlay, args.channels, args.filename, args.legend)
+    max_points = getattr(args, "max_points", 4000)
+    figure = plot_traces(traces, norms, args.overlay, args.channels, args.filename, args.legend,
+                         max_points=max_points if max_points else None,
+                         method=getattr(args, "downsample", None) or "minmax")
 
     if args.saveFigure:
         print("Saving figure 'propertyReport.png'...")
         figure.savefig('propertyReport.png')
 
+    import matplotlib.pyplot as plt
     plt.show()
 
     return
@@ -176,6 +180,9 @@ def process_cmd_line() -> argparse.Namespace:
     parser.add_argument('--no-legend', action="store_false", dest="legend")     # Note args.legend default to True, passing --no-legend sets args.legend to False
     parser.add_argument('-l', '--list', action="store_true", help="List channels and IP keys found in the report. No plotting is performed with this option.")
     parser.add_argument("--csv", type=Path, default=None, help="Write data for selected channel(s) to given file.")
+    parser.add_argument("--max-points", type=int, default=4000, help="downsample traces to at most this many points for plotting, 0 plots every point [4000]")
+    parser.add_argument("--downsample", choices=["minmax", "lttb"], default="minmax", help="downsampling method [minmax]")
+    parser.add_argument("--dtype", choices=["float32", "float64"], default="float32", help="precision of channel data [float32]")
     parser.add_argument("-t", "--transpose", action="store_true", help="write channels as columns rather than rows (only in effect with '--csv' option)")
 
     args = parser.parse_args()
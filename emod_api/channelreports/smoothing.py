@@ -0,0 +1,153 @@
+#!/usr/bin/env python3
+
+"""
+Batched smoothing of many time series at once, e.g., a channel from every simulation of an experiment.
+
+Series are stacked into one (series x timesteps) array, padded with NaN where a series ended early,
+and smoothed along the time axis in a single vectorized pass. Padding is excluded from every
+smoother and stays NaN, so means across series (np.nanmean) are not skewed by padding.
+"""
+
+from typing import Optional
+
+import numpy as np
+
+METHODS = ["moving_average", "exponential", "loess"]
+
+
+def stack_series(series: list[np.ndarray], length: Optional[int] = None) -> tuple[np.ndarray, np.ndarray]:
+
+    """
+    Stack series of different lengths into a (series x timesteps) float64 array padded with NaN.
+
+    Args:
+        series: list of 1-D arrays
+        length: optional number of timesteps, default is the length of the longest series
+
+    Returns:
+        tuple of the padded array and a boolean mask of valid (not padding) values
+    """
+
+    lengths = np.array([len(data) for data in series], dtype=np.int64)
+    length = int(lengths.max(initial=0)) if length is None else length
+    mask = np.arange(length) < lengths[:, np.newaxis]
+    stacked = np.full((len(series), length), np.nan)
+    stacked[mask] = np.concatenate([np.asarray(data, dtype=np.float64)[:length] for data in series]) if len(series) else []
+
+    return stacked, mask
+
+
+def _window_sums(values: np.ndarray, window: int) -> np.ndarray:
+
+    """Sum of each trailing window of values along the time axis, result[:, i] is the sum of values[:, i:i + window]."""
+
+    cumulative = np.zeros((values.shape[0], values.shape[1] + 1))
+    np.cumsum(values, axis=1, out=cumulative[:, 1:])
+
+    return cumulative[:, window:] - cumulative[:, :-window]
+
+
+def moving_average(data: np.ndarray, mask: Optional[np.ndarray] = None, window: int = 7) -> np.ndarray:
+
+    """
+    Moving average with np.convolve(..., 'valid') semantics applied to each series: the result
+    has window - 1 fewer timesteps and result[:, i] is the mean of data[:, i:i + window]. Windows
+    which include padding are NaN.
+    """
+
+    mask = ~np.isnan(data) if mask is None else mask
+    if data.shape[1] < window:
+        return np.full((data.shape[0], 0), np.nan)
+
+    sums = _window_sums(np.where(mask, data, 0.0), window)
+    counts = _window_sums(mask.astype(np.float64), window)
+
+    return np.where(counts == window, sums / window, np.nan)
+
+
+def exponential(data: np.ndarray, mask: Optional[np.ndarray] = None, alpha: float = 0.3) -> np.ndarray:
+
+    """
+    Exponentially weighted moving average, y[t] = alpha * x[t] + (1 - alpha) * y[t - 1], starting
+    from y[0] = x[0]. The recursion runs over timesteps, vectorized across series.
+    """
+
+    assert 0.0 < alpha <= 1.0, "alpha must be in (0, 1]"
+    mask = ~np.isnan(data) if mask is None else mask
+    smoothed = np.full(data.shape, np.nan)
+    if data.shape[1] == 0:
+        return smoothed
+
+    current = np.where(mask[:, 0], data[:, 0], np.nan)
+    smoothed[:, 0] = current
+    for step in range(1, data.shape[1]):
+        valid = mask[:, step]
+        current = np.where(valid, alpha * data[:, step] + (1.0 - alpha) * current, current)
+        smoothed[valid, step] = current[valid]
+
+    return smoothed
+
+
+def loess(data: np.ndarray, mask: Optional[np.ndarray] = None, window: int = 15) -> np.ndarray:
+
+    """
+    LOESS-like smoother: at each timestep, a local linear fit with tricube weights over the
+    surrounding window (odd) timesteps. Padding gets zero weight so series ends are fit from
+    the available values only. Accumulates weighted sums one window offset at a time, each
+    across the whole array.
+    """
+
+    assert window >= 3 and window % 2 == 1, "window must be odd and >= 3"
+    mask = ~np.isnan(data) if mask is None else mask
+    half = window // 2
+    values = np.where(mask, data, 0.0)
+    weights = mask.astype(np.float64)
+
+    s0 = np.zeros(data.shape)     # sum w
+    s1 = np.zeros(data.shape)     # sum w * u
+    s2 = np.zeros(data.shape)     # sum w * u^2
+    t0 = np.zeros(data.shape)     # sum w * y
+    t1 = np.zeros(data.shape)     # sum w * u * y
+    steps = data.shape[1]
+    for offset in range(-half, half + 1):
+        kernel = (1.0 - (abs(offset) / (half + 1)) ** 3) ** 3
+        target = slice(max(0, -offset), min(steps, steps - offset))
+        source = slice(max(0, offset), min(steps, steps + offset))
+        w = kernel * weights[:, source]
+        wy = w * values[:, source]
+        s0[:, target] += w
+        s1[:, target] += w * offset
+        s2[:, target] += w * offset * offset
+        t0[:, target] += wy
+        t1[:, target] += wy * offset
+
+    with np.errstate(divide="ignore", invalid="ignore"):
+        determinant = s0 * s2 - s1 * s1
+        linear = (s2 * t0 - s1 * t1) / determinant
+        # fall back to the weighted mean where a line can't be fit (e.g., a single valid value)
+        constant = t0 / s0
+        smoothed = np.where(determinant > 1e-9 * s0 * s2, linear, constant)
+
+    return np.where(mask, smoothed, np.nan)
+
+
+def smooth(data: np.ndarray, mask: Optional[np.ndarray] = None, method: str = "moving_average", **kwargs) -> np.ndarray:
+
+    """
+    Smooth each row of a (series x timesteps) array with one of METHODS.
+
+    Args:
+        data:   (series x timesteps) array, e.g., from stack_series()
+        mask:   optional boolean mask of valid values, default is not NaN
+        method: "moving_average" (window=7), "exponential" (alpha=0.3), or "loess" (window=15)
+        kwargs: parameters for the method
+
+    Returns:
+        smoothed array, NaN where data is padding (moving_average is window - 1 timesteps shorter)
+    """
+
+    smoothers = {"moving_average": moving_average, "exponential": exponential, "loess": loess}
+    if method not in smoothers:
+        raise ValueError(f"Unknown smoothing method '{method}', use one of {METHODS}.")
+
+    return smoothers[method](np.asarray(data, dtype=np.float64), mask, **kwargs)
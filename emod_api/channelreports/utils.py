@@ -2,14 +2,19 @@
 Helper functions, primarily for property reports, which are channel reports.
 """
 
+from concurrent.futures import ProcessPoolExecutor
 import json
 from pathlib import Path
-from typing import Union, Optional
+from typing import Union, Optional, TYPE_CHECKING
 
-import matplotlib.pyplot as plt
 import numpy as np
 
-from emod_api.channelreports.channels import ChannelReport
+from emod_api.channelreports import cache as _cache
+from emod_api.channelreports.channels import ChannelReport, Channel, _ReportScanner
+from emod_api.channelreports.downsample import downsample
+
+if TYPE_CHECKING:
+    import matplotlib.pyplot as plt     # imported by the plotting functions, reading and writing reports shouldn't pay for it
 
 __all__ = [
     "property_report_to_csv",
@@ -18,9 +23,13 @@ __all__ = [
     "_validate_property_report_channels",
     "_validate_property_report_ips",
     "accumulate_channel_data",
+    "PropertyReportIndex",
+    "merge_property_reports",
     "__get_trace_name",
     "save_to_csv",
+    "reports_to_csv",
     "plot_traces",
+    "render_figures",
     "__index_for",
     "__title_for"]
 
@@ -29,7 +38,8 @@ def property_report_to_csv(source_file: Union[str, Path],
                            csv_file: Union[str, Path],
                            channels: Optional[list[str]] = None,
                            groupby: Optional[list[str]] = None,
-                           transpose: bool = False) -> None:
+                           transpose: bool = False,
+                           dtype=np.float32) -> None:
 
     """
     Write a property report to a CSV formatted file.
@@ -43,9 +53,10 @@ def property_report_to_csv(source_file: Union[str, Path],
         groupby:     list of IPs into which to aggregate remaining IPs, None indicates no grouping, [] indicates _all_ aggregated
         csv_file:    filename of CSV formatted result
         transpose:   write channels as columns rather than rows
+        dtype:       NumPy dtype for channel data, float32 (default) or float64
     """
 
-    json_data = read_json_file(Path(source_file))
+    json_data = read_json_file(Path(source_file), dtype=dtype)
     channel_data = get_report_channels(json_data)
 
     if channels is None:
@@ -59,17 +70,39 @@ def property_report_to_csv(source_file: Union[str, Path],
     _validate_property_report_channels(channels, channel_data)
     _validate_property_report_ips(groupby, channel_data)
 
-    trace_values = accumulate_channel_data(channels, False, groupby, channel_data)
+    trace_values = accumulate_channel_data(channels, False, groupby, channel_data, dtype=dtype)
 
     save_to_csv(trace_values, csv_file, transpose)
 
     return
 
 
-def read_json_file(filename: Union[str, Path]) -> dict:
+def read_json_file(filename: Union[str, Path], channels: Optional[list[str]] = None, dtype=None) -> dict:
+
+    """
+    Read a channel (property) report.
+
+    Args:
+        filename: report to read
+        channels: optional list of channels to keep, by name or prefix, e.g. ["Infected"] keeps
+                  every "Infected:IP:value,..." sub-channel. Data for other channels is skipped
+                  rather than parsed and is not in the result.
+        dtype:    optional NumPy dtype, e.g. np.float32, for "Data" arrays, float64 if only channels is given
+
+    Returns:
+        report as a dictionary, "Data" is the list from the file if neither channels nor dtype is
+        given, otherwise a NumPy array
+    """
 
-    with Path(filename).open("r", encoding="utf-8") as file:
-        json_data = json.load(file)
+    if channels is None and dtype is None:
+        with Path(filename).open("r", encoding="utf-8") as file:
+            json_data = json.load(file)
+    else:
+        header, _, found = _ReportScanner.scan(str(filename), channels, dtype if dtype is not None else np.float64)
+        json_data = {
+            "Header": header,
+            "Channels": {title: {"Units": units, "Data": data} for title, (units, data) in found.items() if data is not None}
+        }
 
     return json_data
 
@@ -100,9 +133,9 @@ def _validate_property_report_channels(channels, channel_data) -> None:
 def _validate_property_report_ips(groupby, channel_data) -> None:
 
     if groupby:
-        first = next(iter(channel_data))
-        ip_string = first.split(":", 1)[1]
-        ips = [kvp.split(":")[0] for kvp in ip_string.split(",")]
+        ips = []
+        for ip_string in {key.split(":", 1)[1] for key in channel_data if ":" in key}:
+            ips.extend(kvp.split(":")[0] for kvp in ip_string.split(",") if kvp.split(":")[0] not in ips)
         not_found = [ip for ip in groupby if ip not in ips]
         if not_found:
             print("Valid IPs:")
@@ -112,7 +145,7 @@ def _validate_property_report_ips(groupby, channel_data) -> None:
     return
 
 
-def accumulate_channel_data(channels: list[str], verbose: bool, groupby: list[str], channel_data: dict) -> dict[str, np.ndarray]:
+def accumulate_channel_data(channels: list[str], verbose: bool, groupby: list[str], channel_data: dict, dtype=np.float32) -> dict[str, np.ndarray]:
 
     """
     Extract selected channel(s) from property report data.
@@ -125,35 +158,252 @@ def accumulate_channel_data(channels: list[str], verbose: bool, groupby: list[st
         verbose:        output some "debugging"/progress information if true
         groupby:        IP(s) under which to aggregate other IP:value pairs
         channel_data:   data for channels keyed on channel name
+        dtype:          NumPy dtype for aggregated data, float32 (default) or float64
 
     Returns:
         tuple of dictionary of aggregated data, keyed on channel name, and of Numpy array of normalization values
     """
 
-    trace_values = {}
-    pool_keys = sorted(channel_data)
+    index = PropertyReportIndex(channel_data, channels=channels, dtype=dtype)
+
+    if verbose:
+        print(f"Processing {len(index.keys)} channel(s) of {index.channel_names} ({index.nbytes / 2**20:.1f} MiB)")
+        print(f"IPs: {index.ips}")
+
+    trace_values = index.group_by(groupby)
+
+    if verbose:
+        print(f"Aggregated into {len(trace_values)} trace(s): {list(trace_values)}")
+
+    return trace_values
+
+
+class PropertyReportIndex(object):
+
+    """
+    Property report channels parsed once into a multi-index with their data in one 2-D array.
+
+    Each property report channel key, e.g., "Infected:Age_Bin:Age_Bin_Property_From_0_To_20,QualityOfCare:High",
+    is split into its channel name and IP:value pairs. Row i of data holds the data for keys[i],
+    names[i] is the index of its channel name in channel_names, and codes[i, j] is the index of
+    its value for ips[j] in values[ips[j]] (-1 if the key doesn't have ips[j]).
+    """
+
+    def __init__(self, channel_data: dict, channels: Optional[list[str]] = None, dtype=np.float32) -> None:
+
+        """
+        Args:
+            channel_data: property report channels, keyed on channel key
+            channels:     optional channel names to index, default is all channels
+            dtype:        dtype for data
+        """
+
+        keys = sorted(key for key in channel_data if channels is None or key.split(":", 1)[0] in channels)
+        lengths = {len(channel_data[key]["Data"]) for key in keys}
+        assert len(lengths) <= 1, f"Channels do not all have the same number of values ({lengths})"
+        data = np.empty((len(keys), lengths.pop() if lengths else 0), dtype=dtype)
+        for row, key in enumerate(keys):
+            data[row] = channel_data[key]["Data"]
+        self._index(keys, data)
+
+        return
+
+    @classmethod
+    def from_report(cls, report: ChannelReport) -> "PropertyReportIndex":
+
+        """Index the channels of a ChannelReport, data is the report's as_matrix() (not a copy)."""
+
+        index = cls.__new__(cls)
+        index._index(report.channel_names, report.as_matrix())
+
+        return index
+
+    def _index(self, keys: list[str], data: np.ndarray) -> None:
+
+        """Parse sorted channel keys into the multi-index, row i of data is the data for keys[i]."""
+
+        self.keys = keys
+        self.ips = []
+
+        name_codes = {}
+        value_codes = {}
+        names = []
+        pairs = []
+        for key in self.keys:
+            name, _, ip_string = key.partition(":")
+            names.append(name_codes.setdefault(name, len(name_codes)))
+            row = []
+            for kvp in ip_string.split(",") if ip_string else []:
+                ip, _, value = kvp.partition(":")
+                if ip not in value_codes:
+                    self.ips.append(ip)
+                    value_codes[ip] = {}
+                row.append((ip, value_codes[ip].setdefault(value, len(value_codes[ip]))))
+            pairs.append(row)
+
+        self.channel_names = list(name_codes)
+        self.values = {ip: list(codes) for ip, codes in value_codes.items()}
+        self.names = np.array(names, dtype=np.int32)
+        self.codes = np.full((len(self.keys), len(self.ips)), -1, dtype=np.int32)
+        columns = {ip: column for column, ip in enumerate(self.ips)}
+        for row, kvps in enumerate(pairs):
+            for ip, code in kvps:
+                self.codes[row, columns[ip]] = code
+        self.data = data
+
+        return
 
-    name_ip_pairs = map(lambda key: tuple(key.split(":", 1)), pool_keys)
-    name_ip_pairs_to_process = filter(lambda p: p[0] in channels, name_ip_pairs)
-    for (channel_title, key_value_pairs) in name_ip_pairs_to_process:
+    @property
+    def nbytes(self) -> int:
+        """Bytes of data and index arrays"""
+        return self.data.nbytes + self.names.nbytes + self.codes.nbytes
 
-        if verbose:
-            print(f"Processing channel '{channel_title}:{key_value_pairs}'")
+    def group_by(self, groupby: Optional[list[str]], channels: Optional[list[str]] = None) -> dict[str, np.ndarray]:
 
-        key_value_pairs = key_value_pairs.split(',')
-        trace_name = __get_trace_name(channel_title, key_value_pairs, groupby)
-        trace_data = np.array(channel_data[f"{channel_title}:{','.join(key_value_pairs)}"]['Data'], dtype=np.float32)
+        """
+        Sum channel data over all IP:value combinations except for the IPs in groupby.
 
-        if trace_name not in trace_values:
-            if verbose:
-                print(f"New trace: '{trace_name}'")
-            trace_values[trace_name] = trace_data
+        Args:
+            groupby:  IP(s) under which to aggregate other IP:value pairs, None indicates no
+                      grouping (a trace per channel key), [] indicates _all_ aggregated
+            channels: optional channel names to aggregate, default is all indexed channels
+
+        Returns:
+            dictionary of aggregated data keyed on trace name (see __get_trace_name()), in the
+            order each trace first appears in sorted channel keys
+        """
+
+        rows = np.arange(len(self.keys))
+        if channels is not None:
+            wanted = [code for code, name in enumerate(self.channel_names) if name in channels]
+            rows = rows[np.isin(self.names, wanted)]
+
+        if groupby is None:
+            return {self.keys[row]: self.data[row].copy() for row in rows}
+
+        # every distinct (channel, grouped IP values) combination is a trace
+        columns = [column for column, ip in enumerate(self.ips) if ip in groupby]
+        combinations = np.column_stack([self.names[rows], self.codes[rows][:, columns]])
+        _, first, inverse = np.unique(combinations, axis=0, return_index=True, return_inverse=True)
+        inverse = inverse.reshape(-1)
+
+        order = np.argsort(inverse, kind="stable")
+        starts = np.flatnonzero(np.r_[True, np.diff(inverse[order]) != 0])
+        sums = np.add.reduceat(self.data[rows[order]], starts, axis=0) if len(rows) else self.data[:0]
+
+        trace_values = {}
+        for group in np.argsort(first, kind="stable"):
+            trace_values[_trace_name_for_key(self.keys[rows[first[group]]], groupby)] = sums[group]
+
+        return trace_values
+
+
+def _check_same_layout(index: PropertyReportIndex, reference: PropertyReportIndex, path: str, reference_path: str) -> None:
+
+    """Raise ValueError, naming the differences, unless index has the same channel keys and time steps as reference."""
+
+    if index.keys != reference.keys:
+        channels = sorted(set(index.channel_names) ^ set(reference.channel_names))
+        ips = {}
+        for ip in sorted(set(index.ips) | set(reference.ips)):
+            values = sorted(set(index.values.get(ip, ["<missing>"])) ^ set(reference.values.get(ip, ["<missing>"])))
+            if values:
+                ips[ip] = values
+        keys = sorted(set(index.keys) ^ set(reference.keys))
+        raise ValueError(f"'{path}' does not have the same channels as '{reference_path}': differing channels {channels}, "
+                         f"differing IP values {ips}, {len(keys)} differing channel keys, e.g., {keys[:3]}.")
+
+    if index.data.shape != reference.data.shape:
+        raise ValueError(f"'{path}' has {index.data.shape[1]} time steps, '{reference_path}' has {reference.data.shape[1]}.")
+
+    return
+
+
+def _merge_batch(paths: list[str], dtype, cache) -> tuple:
+
+    """Sum the reports in paths into an index of the first report, return (first path, header, units, index, count)."""
+
+    total = None
+    for path in paths:
+        report = ChannelReport(str(path), dtype=dtype, cache=cache)
+        index = PropertyReportIndex.from_report(report)
+        if total is None:
+            first, header, units = path, report.header.as_dictionary(), {title: report[title].units for title in index.keys}
+            total = index
+            total.data = np.array(index.data, dtype=dtype)  # own copy, not the (possibly memory mapped) report data
         else:
-            if verbose:
-                print(f"Add to trace: '{trace_name}'")
-            trace_values[trace_name] += trace_data
+            _check_same_layout(index, total, path, first)
+            total.data += index.data
 
-    return trace_values
+    return first, header, units, total, len(paths)
+
+
+def merge_property_reports(paths: list[Union[str, Path]],
+                           op: str = "sum",
+                           workers: Optional[int] = None,
+                           filename: Union[str, Path, None] = None,
+                           dtype=np.float64,
+                           cache: Union[bool, str, Path] = False,
+                           batch_size: int = 16) -> ChannelReport:
+
+    """
+    Merge property reports with the same channels and IPs, e.g., from the cores of a
+    multi-core simulation (op="sum") or from replicates of a sweep (op="mean").
+
+    Reports are read and summed in batches in a process pool. Every report is checked
+    against the first: a ValueError names the channels or IP values which differ.
+
+    Args:
+        paths:      property report filenames
+        op:         "sum" or "mean"
+        workers:    number of worker processes, <= 1 reads reports in this process
+        filename:   optional filename to write the merged report to
+        dtype:      NumPy dtype for channel data
+        cache:      read reports through their binary sidecars (see emod_api.channelreports.cache)
+                    and, with filename, write a sidecar for the merged report too
+        batch_size: number of reports summed per task in a worker process
+
+    Returns:
+        merged report as a ChannelReport, header from the first report
+    """
+
+    if op not in ("sum", "mean"):
+        raise ValueError(f"Unknown merge operation '{op}', use 'sum' or 'mean'.")
+    paths = [str(path) for path in paths]
+    if not paths:
+        raise ValueError("No property reports to merge.")
+
+    batches = [paths[start:start + batch_size] for start in range(0, len(paths), batch_size)]
+    if workers is not None and workers <= 1:
+        results = [_merge_batch(batch, dtype, cache) for batch in batches]
+    else:
+        with ProcessPoolExecutor(max_workers=workers) as executor:
+            results = list(executor.map(_merge_batch, batches, [dtype] * len(batches), [cache] * len(batches)))
+
+    first, header, units, total, _ = results[0]
+    for path, _, _, index, _ in results[1:]:
+        _check_same_layout(index, total, path, first)
+        total.data += index.data
+    if op == "mean":
+        total.data /= len(paths)
+
+    merged = ChannelReport(dtype=dtype, **header)
+    for row, key in enumerate(total.keys):
+        merged.add_channel(key, units[key], total.data[row])
+
+    if filename is not None:
+        merged.write_file(str(filename))
+        if cache:
+            _cache.write(filename, merged.header.as_dictionary(), units, merged.as_matrix(), None if cache is True else cache)
+
+    return merged
+
+
+def _trace_name_for_key(key: str, groupby: list[str]) -> str:
+
+    channel_title, _, ip_string = key.partition(":")
+
+    return __get_trace_name(channel_title, ip_string.split(","), groupby)
 
 
 def __get_trace_name(channel_title: str, key_value_pairs: list[str], groupby: list[str]) -> str:
@@ -210,22 +460,68 @@ def save_to_csv(trace_values: dict[str, np.ndarray],
         transpose:    write channels as columns rather than rows
     """
 
-    report = ChannelReport()
+    # keep the dtype of the traces (float32 from accumulate_channel_data()) so values are formatted the same
+    dtypes = {np.asarray(data).dtype for data in trace_values.values()}
+    dtype = dtypes.pop() if len(dtypes) == 1 else np.float64
+    report = ChannelReport(dtype=dtype)
 
     for channel, data in trace_values.items():
-        report.channels[channel] = data
+        report.channels[channel] = Channel(channel, "", data, dtype)
 
     report.to_csv(Path(filename), transpose=transpose)  # by default, use _all_ the channels we just added
 
     return
 
 
+def _report_to_csv(filename: str, transpose: bool, compress: bool) -> Path:
+
+    destination = Path(filename).with_suffix(".csv.gz" if compress else ".csv")
+    ChannelReport(filename).to_csv(destination, transpose=transpose)
+
+    return destination
+
+
+def reports_to_csv(directory: Union[str, Path],
+                   patterns: Optional[list[str]] = None,
+                   transpose: bool = False,
+                   compress: bool = False,
+                   workers: Optional[int] = None) -> list[Path]:
+
+    """
+    Convert every channel report under directory (e.g., an experiment) to CSV, in parallel.
+
+    Each report is written next to the source file, e.g., sim_id/InsetChart.json to sim_id/InsetChart.csv.
+
+    Args:
+        directory: directory to search, recursively, for reports
+        patterns:  report filename patterns, default is ["InsetChart.json", "PropertyReport*.json"]
+        transpose: write channels as columns rather than rows
+        compress:  write gzip compressed .csv.gz files
+        workers:   number of worker processes, <= 1 converts in this process
+
+    Returns:
+        list of CSV filenames written
+    """
+
+    patterns = ["InsetChart.json", "PropertyReport*.json"] if patterns is None else patterns
+    filenames = sorted({str(path) for pattern in patterns for path in Path(directory).rglob(pattern)})
+
+    if workers is not None and workers <= 1:
+        return [_report_to_csv(filename, transpose, compress) for filename in filenames]
+
+    with ProcessPoolExecutor(max_workers=workers) as executor:
+        count = len(filenames)
+        return list(executor.map(_report_to_csv, filenames, [transpose] * count, [compress] * count))
+
+
 def plot_traces(trace_values: dict[str, np.ndarray],
                 norm_values: Union[int, np.ndarray, None],
                 overlay: bool,
                 channels: list[str],
                 title: str,
-                legend: bool) -> plt.Figure:
+                legend: bool,
+                max_points: Optional[int] = 4000,
+                method: str = "minmax") -> "plt.Figure":
 
     """
     Plot trace data. One subplot per channel unless overlaying all variations of rolled-up IP(s) is requested.
@@ -240,11 +536,15 @@ def plot_traces(trace_values: dict[str, np.ndarray],
         channels:     selection of channel names to plot
         title:        plot title
         legend:       whether or not to include a legend on plots
+        max_points:   downsample traces longer than this before plotting, None plots every point
+        method:       downsampling method, "minmax" or "lttb", see emod_api.channelreports.downsample
 
     Returns:
         plt.Figure
     """
 
+    import matplotlib.pyplot as plt
+
     if len(trace_values) == 0:
         print("Didn't find requested channel(s) in property report.")
         return
@@ -265,11 +565,11 @@ def plot_traces(trace_values: dict[str, np.ndarray],
     for trace_name in trace_keys:
         plot_index = __index_for(trace_name, channels, trace_keys, normalize, overlay)
         plt.subplot(plot_count, 1, plot_index)
-        plt.plot(trace_values[trace_name], label=trace_name)
+        plt.plot(*downsample(trace_values[trace_name], max_points, method), label=trace_name)
         if normalize:
             plt.subplot(plot_count, 1, plot_index + 1)
             plt.ylim((0.0, 1.0))    # yes, this takes a tuple
-            plt.plot(trace_values[trace_name] / norm_values, label=trace_name)
+            plt.plot(*downsample(trace_values[trace_name] / norm_values, max_points, method), label=trace_name)
 
     # make it pretty
     _ = plt.subplot(plot_count, 1, 1)
@@ -291,6 +591,53 @@ def plot_traces(trace_values: dict[str, np.ndarray],
     return figure
 
 
+def _use_agg() -> None:
+
+    import matplotlib
+
+    matplotlib.use("Agg")   # headless, workers don't need (or have) a display
+
+    return
+
+
+def _render_figure(function, kwargs: dict, filename: str, dpi) -> str:
+
+    import matplotlib.pyplot as plt
+
+    figure = function(**kwargs)
+    figure.savefig(filename, dpi=dpi if dpi is not None else "figure")
+    plt.close(figure)
+
+    return filename
+
+
+def render_figures(tasks: list[tuple], workers: int = None, dpi: Optional[int] = None) -> list[str]:
+
+    """
+    Render many figures headless (Agg backend) in parallel processes and save them to disk.
+    With workers <= 1 figures are rendered with this process's current backend, which is left unchanged.
+
+    Args:
+        tasks:   list of (function, keyword arguments, output filename), function must be
+                 importable (module level), e.g. plot_traces, and return a matplotlib Figure
+        workers: number of worker processes, <= 1 renders in this process
+        dpi:     optional resolution override, default is each figure's own
+
+    Returns:
+        list of filenames written
+
+    Example:
+        render_figures([(plot_traces, {"trace_values": traces, ..., "title": name}, f"{name}.png") for ...], workers=8)
+    """
+
+    if workers is not None and workers <= 1:
+        return [_render_figure(function, kwargs, filename, dpi) for function, kwargs, filename in tasks]
+
+    with ProcessPoolExecutor(max_workers=workers, initializer=_use_agg) as executor:
+        futures = [executor.submit(_render_figure, function, kwargs, str(filename), dpi) for function, kwargs, filename in tasks]
+        return [future.result() for future in futures]
+
+
 def __index_for(trace_name: str, channels: list[str], trace_keys: list[str], normalize: bool, overlay: bool) -> int:
 
     if overlay:
@@ -1,9 +1,6 @@
 import math
 import numpy as np
 
-from scipy import sparse as sp
-from scipy.sparse import linalg as la
-
 from emod_api.demographics.age_distribution import AgeDistribution
 
 
@@ -55,6 +52,10 @@ def _computeAgeDist(bval, mvecX, mvecY, fVec, max_yr=90):
     author: Kurt Frey
     """
 
+    # scipy is slow to import and only needed here
+    from scipy import sparse as sp
+    from scipy.sparse import linalg as la
+
     bin_size = 30
     day_to_year = 365
 
@@ -14,6 +14,8 @@ import sys
 import pylab
 from math import sqrt, ceil
 
+from emod_api.channelreports.downsample import downsample
+
 
 def plotOneFromDisk():
     with open(sys.argv[1]) as ref_sim:
@@ -118,7 +120,12 @@ def plotCompareFromDisk(
         plt.close()
 
 
-def plotBunch(all_data, plot_name, baseline_data=None, closefig=True):
+def plotBunch(all_data, plot_name, baseline_data=None, closefig=True, max_points=2000):
+    """
+    Plot (up to 36) channels of several reports, one subplot per channel, and save the figure.
+    Series longer than max_points are downsampled (min/max per bucket) before plotting, None
+    plots every point.
+    """
     num_chans = all_data[0]["Header"]["Channels"]
     plt.suptitle(plot_name)
     plt.figure(figsize=(20, 15))
@@ -147,8 +154,7 @@ def plotBunch(all_data, plot_name, baseline_data=None, closefig=True):
                 x_data = np.arange(0, x_len * tstep, tstep)
                 plots.append(
                     subplot.plot(
-                        x_data,
-                        baseline_data["Channels"][chan_title]["Data"],
+                        *downsample(baseline_data["Channels"][chan_title]["Data"], max_points, x=x_data),
                         "r-",
                         linewidth=2,
                     )
@@ -167,8 +173,7 @@ def plotBunch(all_data, plot_name, baseline_data=None, closefig=True):
 
                 plots.append(
                     subplot.plot(
-                        x_data,
-                        all_data[sim_idx]["Channels"][chan_title]["Data"],
+                        *downsample(all_data[sim_idx]["Channels"][chan_title]["Data"], max_points, x=x_data),
                         colors[sim_idx % len(colors)] + "-",
                     )
                 )
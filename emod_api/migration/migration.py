@@ -11,11 +11,6 @@ from warnings import warn
 import numpy as np
 import csv
 
-from emod_api.demographics.demographics import Demographics
-
-# for from_demog_and_param_gravity()
-from geographiclib.geodesic import Geodesic
-
 
 class Layer(dict):
 
@@ -650,6 +645,8 @@ utility functions emodpy-utils?
 
 
 def from_demog_and_param_gravity(demographics_file_path, gravity_params, id_ref, migration_type=Migration.LOCAL):
+    # the demographics package is heavy and only needed to build migration from a gravity model
+    from emod_api.demographics.demographics import Demographics
     demog = Demographics.from_file(demographics_file_path)
     return _from_demog_and_param_gravity(demog, gravity_params, id_ref, migration_type)
 
@@ -679,6 +676,9 @@ def _from_demog_and_param_gravity(demographics, gravity_params, id_ref, migratio
 
         excluded_nodes = set(kwargs["exclude_nodes"]) if "exclude_nodes" in kwargs else set()
 
+        # for from_demog_and_param_gravity()
+        from geographiclib.geodesic import Geodesic
+
         mig = Migration()
         geodesic = Geodesic.WGS84
 
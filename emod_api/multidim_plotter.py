@@ -1,8 +1,5 @@
 import os
-import matplotlib.pyplot as plt
-from matplotlib import cm
-from mpl_toolkits.mplot3d import Axes3D
-import sqlite3
+from emod_api.results_catalog import open_catalog
 
 """
 Plot EMOD output data from an experiment found in an SQLite db created by emodpy.
@@ -25,6 +22,10 @@ def plot_from_sql(x_tag: str,
         exp_id: Optional experiment id. If omitted, 'latest_experiment' is used.
     """
 
+    import matplotlib.pyplot as plt
+    from matplotlib import cm
+    from mpl_toolkits.mplot3d import Axes3D
+
     fig = plt.figure()
     ax = Axes3D(fig)
 
@@ -32,16 +33,14 @@ def plot_from_sql(x_tag: str,
         db = os.path.join(str(exp_id), "results.db")
     else:
         db = os.path.join("latest_experiment", "results.db")
-    con = sqlite3.connect(db)
-    cur = con.cursor()
     x_tag = x_tag.replace(' ', '_').replace('-', '_')
     y_tag = y_tag.replace(' ', '_').replace('-', '_')
-    query = f"select {x_tag}, {y_tag}, avg({output}) from results group by {x_tag}, {y_tag};"
     try:
-        cur.execute(query)
-        results = cur.fetchall()
+        with open_catalog(db) as catalog:
+            catalog.ensure_index(x_tag, y_tag)
+            results = catalog.averages(x_tag, y_tag, output)
     except Exception as ex:
-        print(f"Encountered fatal exception {ex} when executing query {query} on db {db}.")
+        print(f"Encountered fatal exception {ex} when querying averages of {output} by {x_tag}, {y_tag} on db {db}.")
         return
 
     x = []
@@ -0,0 +1,190 @@
+"""
+Access to the results.db (SQLite) that emodpy writes for an experiment: one row per simulation,
+with a sim_id column, a column per swept tag, and output columns.
+
+Queries are parameterized (tag names are checked against the table's columns and quoted)
+and query results are cached, for the life of the catalog, until the database file changes.
+Queries never write to the database, call ensure_index() to index the swept tag columns which
+are filtered or grouped on. The connection is closed with close() or at the end of a with block.
+
+    from emod_api.results_catalog import open_catalog
+    with open_catalog("latest_experiment/results.db") as catalog:
+        catalog.ensure_index("Base_Infectivity")           # writes to results.db, if it can
+        groups = catalog.groups("Base_Infectivity")        # {value: [sim_id, ...]}
+        sims = catalog.sim_ids("Base_Infectivity", 0.3, tolerance=1e-4)
+"""
+
+import os
+import sqlite3
+from typing import Union
+
+_TABLE = "results"
+_SIM_ID = "sim_id"
+
+
+def open_catalog(db: str) -> "ResultsCatalog":
+
+    """Open a catalog for the given results.db, use it in a with statement to close it when done."""
+
+    return ResultsCatalog(os.path.abspath(db))
+
+
+def parse_value(text: str) -> Union[int, float, str]:
+
+    """Convert a tag value from the command line, e.g., from "key=value", to a number where possible."""
+
+    for convert in (int, float):
+        try:
+            return convert(text)
+        except ValueError:
+            pass
+
+    return text
+
+
+class ResultsCatalog(object):
+
+    def __init__(self, db: str) -> None:
+
+        if not os.path.exists(db):
+            raise FileNotFoundError(f"Results database '{db}' not found.")
+        self._db = db
+        self._connection = sqlite3.connect(db, check_same_thread=False)
+        self._stamp = None
+        self._cache = {}
+        self._columns = {}
+        self._indexed = set()
+        self._refresh()
+
+        return
+
+    def _file_stamp(self) -> tuple:
+
+        stat = os.stat(self._db)
+
+        return stat.st_size, stat.st_mtime_ns
+
+    def _refresh(self) -> None:
+
+        """Clear cached results if the database file has changed."""
+
+        stamp = self._file_stamp()
+        if stamp != self._stamp:
+            self._stamp = stamp
+            self._cache.clear()
+            self._indexed.clear()
+            self._columns = {row[1]: (row[2] or "").upper() for row in self._connection.execute(f"PRAGMA table_info({_TABLE})")}
+
+        return
+
+    @property
+    def columns(self) -> list[str]:
+        return list(self._columns)
+
+    def _quote(self, column: str) -> str:
+
+        if column not in self._columns:
+            raise ValueError(f"'{column}' is not a column of {self._db}, found {self.columns}.")
+
+        return '"' + column.replace('"', '""') + '"'
+
+    def _is_numeric(self, column: str) -> bool:
+
+        """True if SQLite stores numbers written to column as numbers (INTEGER, REAL, or NUMERIC affinity)."""
+
+        declared = self._columns[column]
+
+        return bool(declared) and not any(kind in declared for kind in ("CHAR", "CLOB", "TEXT", "BLOB"))
+
+    def ensure_index(self, *columns: str) -> None:
+
+        """
+        Create an index on each column, if it doesn't exist, so filtering and grouping on it doesn't scan the table.
+        This writes to the database, it does nothing if the database is read-only.
+        """
+
+        self._refresh()
+        for column in columns:
+            if column in self._indexed:
+                continue
+            quoted = self._quote(column)
+            name = '"' + f"idx_{_TABLE}_{column}".replace('"', '""') + '"'
+            try:
+                self._connection.execute(f"CREATE INDEX IF NOT EXISTS {name} ON {_TABLE} ({quoted})")
+                self._connection.commit()
+            except sqlite3.OperationalError:
+                pass    # read-only database, queries still work without the index
+            self._indexed.add(column)
+        self._stamp = self._file_stamp()    # the index changed the file, cached results are still valid
+
+        return
+
+    def _query(self, key: tuple, sql: str, parameters: tuple = ()) -> list:
+
+        self._refresh()
+        if key not in self._cache:
+            self._cache[key] = self._connection.execute(sql, parameters).fetchall()
+
+        return self._cache[key]
+
+    def all_sim_ids(self) -> list[str]:
+
+        rows = self._query(("all",), f"SELECT {self._quote(_SIM_ID)} FROM {_TABLE}")
+
+        return [row[0] for row in rows]
+
+    def sim_ids(self, tag: str, value, tolerance: float = None) -> list[str]:
+
+        """
+        Return the ids of simulations with tag equal to value, or within tolerance of a numeric value.
+        """
+
+        column = self._quote(tag)
+        if tolerance is None:
+            sql = f"SELECT {self._quote(_SIM_ID)} FROM {_TABLE} WHERE {column} = ?"
+            parameters = (value,)
+        elif not self._is_numeric(tag):
+            # numbers stored as text (TEXT or untyped columns) compare as text, cast them for the range test
+            sql = f"SELECT {self._quote(_SIM_ID)} FROM {_TABLE} WHERE ABS(CAST({column} AS REAL) - ?) <= ?"
+            parameters = (float(value), tolerance)
+        else:
+            sql = f"SELECT {self._quote(_SIM_ID)} FROM {_TABLE} WHERE {column} BETWEEN ? AND ?"
+            parameters = (float(value) - tolerance, float(value) + tolerance)
+        rows = self._query(("sim_ids", tag, value, tolerance), sql, parameters)
+
+        return [row[0] for row in rows]
+
+    def groups(self, tag: str) -> dict:
+
+        """Return the ids of simulations grouped by (keyed on) each value of tag, in value order."""
+
+        column = self._quote(tag)
+        rows = self._query(("groups", tag), f"SELECT {column}, {self._quote(_SIM_ID)} FROM {_TABLE} ORDER BY {column}")
+        groups = {}
+        for value, sim_id in rows:
+            groups.setdefault(value, []).append(sim_id)
+
+        return groups
+
+    def averages(self, x_tag: str, y_tag: str, output: str) -> list[tuple]:
+
+        """Return (x, y, mean output) for each combination of x_tag and y_tag values."""
+
+        x, y, z = self._quote(x_tag), self._quote(y_tag), self._quote(output)
+        sql = f"SELECT {x}, {y}, AVG({z}) FROM {_TABLE} GROUP BY {x}, {y}"
+
+        return self._query(("averages", x_tag, y_tag, output), sql)
+
+    def close(self) -> None:
+
+        self._connection.close()
+        self._cache.clear()
+
+        return
+
+    def __enter__(self) -> "ResultsCatalog":
+        return self
+
+    def __exit__(self, *exc_info) -> None:
+        self.close()
+        return
@@ -0,0 +1,132 @@
+#!/usr/bin/python
+
+"""
+Compare compression engines and levels on the chunks of serialized population files,
+reporting compressed size against compression and decompression throughput, to help
+pick an engine for a use case.  Remember that EMOD can only read NONE, LZ4 (any level),
+and SNAPPY compressed files.
+
+    python -m emod_api.serialization.codec_benchmark state-00365.dtk [state-00730.dtk ...]
+"""
+
+import argparse
+import os
+import time
+import emod_api.serialization.dtk_file_support as support
+import emod_api.serialization.dtk_file_tools as dft
+
+
+DEFAULT_CODECS = [
+    (dft.NONE, None),
+    (dft.LZ4, None),
+    (dft.LZ4, 4),
+    (dft.LZ4, 9),
+    (dft.LZ4, 12),
+    (dft.SNAPPY, None),
+    (dft.ZSTD, 1),
+    (dft.ZSTD, 3),
+    (dft.ZSTD, 9),
+    (dft.ZSTD, 19),
+]
+
+
+def available_codecs(codecs=None):
+    """
+    Return the (engine, level) pairs from codecs (default: DEFAULT_CODECS) which
+    are supported by the installed packages.
+    """
+    codecs = DEFAULT_CODECS if codecs is None else codecs
+    unavailable = set()
+    if not support.SNAPPY_SUPPORT:
+        unavailable.add(dft.SNAPPY)
+    if not support.ZSTD_SUPPORT:
+        unavailable.add(dft.ZSTD)
+    return [(engine, level) for engine, level in codecs if engine not in unavailable]
+
+
+def uncompressed_chunks(filename):
+    """
+    Return the uncompressed contents of each chunk in the given file.
+    """
+    dtk_file = dft.read(filename)
+    if dtk_file.version <= 5:
+        return [dft.uncompress(chunk, dtk_file.compression) for chunk in dtk_file.chunks]
+
+    chunks = [dtk_file._sim_chunk] + dtk_file._node_chunks + dtk_file._human_chunks
+    contents = []
+    for chunk in chunks:
+        chunk.store()   # the first human collection for each node is loaded when the file is read
+        contents.append(dft.uncompress(chunk.chunk, dft._compression_type_v6_to_old(chunk.v6_compression_str)))
+    return contents
+
+
+def benchmark(filenames, codecs=None, repeat=3):
+    """
+    Compress and decompress every chunk of the given files with each codec.
+
+    Args:
+        filenames (list of str): The serialized population files to use.
+        codecs (list of (str, int)): The (engine, level) pairs to compare, default is
+            every pair in DEFAULT_CODECS supported by the installed packages.
+        repeat (int): Time the best of this many runs.
+
+    Returns:
+        A list with a dictionary for each codec with 'engine', 'level', 'emod_readable',
+        'uncompressed_bytes', 'compressed_bytes', 'ratio', 'compress_mb_per_s', and
+        'decompress_mb_per_s' entries.
+    """
+    chunks = []
+    for filename in filenames:
+        chunks.extend(uncompressed_chunks(filename))
+    uncompressed_bytes = sum(len(chunk) for chunk in chunks)
+    megabytes = uncompressed_bytes / 1e6
+
+    results = []
+    for engine, level in available_codecs(codecs):
+        compress_time = decompress_time = float('inf')
+        for _ in range(repeat):
+            start = time.perf_counter()
+            compressed = [dft.compress(chunk, engine, level) for chunk in chunks]
+            compress_time = min(compress_time, time.perf_counter() - start)
+            start = time.perf_counter()
+            for chunk in compressed:
+                dft.uncompress(chunk, engine)
+            decompress_time = min(decompress_time, time.perf_counter() - start)
+        compressed_bytes = sum(len(chunk) for chunk in compressed)
+        results.append({
+            'engine': engine,
+            'level': level,
+            'emod_readable': engine in dft.EMOD_ENGINES,
+            'uncompressed_bytes': uncompressed_bytes,
+            'compressed_bytes': compressed_bytes,
+            'ratio': uncompressed_bytes / compressed_bytes if compressed_bytes else 0.0,
+            'compress_mb_per_s': megabytes / compress_time if compress_time else float('inf'),
+            'decompress_mb_per_s': megabytes / decompress_time if decompress_time else float('inf'),
+        })
+
+    return results
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Compare compression engines on serialized population files.')
+    parser.add_argument('filenames', nargs='+', help='serialized population file(s)')
+    parser.add_argument('-r', '--repeat', type=int, default=3, help='time the best of this many runs [3]')
+    args = parser.parse_args()
+
+    missing = [filename for filename in args.filenames if not os.path.isfile(filename)]
+    if missing:
+        parser.error(f"file(s) not found: {', '.join(missing)}")
+
+    results = benchmark(args.filenames, repeat=args.repeat)
+    print(f"{'engine':<8}{'level':>6}{'EMOD':>6}{'bytes':>14}{'ratio':>8}{'comp MB/s':>12}{'decomp MB/s':>13}")
+    for result in results:
+        level = '-' if result['level'] is None else result['level']
+        print(f"{result['engine']:<8}{level:>6}{'yes' if result['emod_readable'] else 'no':>6}"
+              f"{result['compressed_bytes']:>14,}{result['ratio']:>8.2f}"
+              f"{result['compress_mb_per_s']:>12.1f}{result['decompress_mb_per_s']:>13.1f}")
+
+    return
+
+
+if __name__ == '__main__':
+    main()
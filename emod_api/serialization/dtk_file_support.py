@@ -1,6 +1,13 @@
 #!/usr/bin/python
 
+import copy
+import json
+import re
+import threading
+from collections.abc import MutableMapping
+
 import lz4.block
+import numpy as np
 
 try:
     import snappy
@@ -8,12 +15,18 @@ try:
 except Exception:
     SNAPPY_SUPPORT = False
 
+try:
+    import zstandard
+    ZSTD_SUPPORT = True
+except Exception:
+    ZSTD_SUPPORT = False
+
 
 # noinspection PyCamelCase
 class Uncompressed(object):
 
     @classmethod
-    def compress(cls, data):
+    def compress(cls, data, level=None):
         return data
 
     @classmethod
@@ -22,10 +35,17 @@ class Uncompressed(object):
 
 
 class EllZeeFour(object):
+    """
+    LZ4 block compression.  A level (1-12) selects LZ4 high compression mode which
+    is slower to compress, but still produces standard LZ4 blocks that EMOD can read.
+    """
 
     @classmethod
-    def compress(cls, data):
-        return lz4.block.compress(data if type(data) is bytes else data.encode())
+    def compress(cls, data, level=None):
+        data = data if type(data) is bytes else data.encode()
+        if level:
+            return lz4.block.compress(data, mode='high_compression', compression=level)
+        return lz4.block.compress(data)
 
     @classmethod
     def uncompress(cls, data):
@@ -35,7 +55,7 @@ class EllZeeFour(object):
 class Snappy(object):
 
     @classmethod
-    def compress(cls, data):
+    def compress(cls, data, level=None):
         if SNAPPY_SUPPORT:
             return snappy.compress(data)
         raise UserWarning("Snappy [de]compression not available.")
@@ -47,6 +67,27 @@ class Snappy(object):
         raise UserWarning("Snappy [de]compression not available.")
 
 
+class Zstandard(object):
+    """
+    Zstandard compression (requires the zstandard package).  Files using it can
+    only be read by Python tooling - EMOD cannot read them.
+    """
+    DEFAULT_LEVEL = 3
+
+    @classmethod
+    def compress(cls, data, level=None):
+        if ZSTD_SUPPORT:
+            data = data if type(data) is bytes else data.encode()
+            return zstandard.ZstdCompressor(level=level or cls.DEFAULT_LEVEL).compress(data)
+        raise UserWarning("Zstandard [de]compression not available.")
+
+    @classmethod
+    def uncompress(cls, data):
+        if ZSTD_SUPPORT:
+            return zstandard.ZstdDecompressor().decompress(data)
+        raise UserWarning("Zstandard [de]compression not available.")
+
+
 class SerialObject(dict):
     # noinspection PyDefaultArgument
     def __init__(self, dictionary={}):
@@ -59,3 +100,433 @@ class NullPtr(SerialObject):
     def __init__(self):
         nullptr = {'__class__': 'nullptr'}
         super(NullPtr, self).__init__(nullptr)
+
+
+class KeyTable(object):
+    """
+    An ordered set of keys shared by every CompactObject with the same keys, e.g.
+    all the humans in a collection.  Tables for objects which have gained or lost
+    a key are cached so those objects share tables as well.
+    """
+    __slots__ = ('keys', 'index', '_registry')
+
+    def __init__(self, keys, registry):
+        self.keys = keys
+        self.index = {key: position for position, key in enumerate(keys)}
+        self._registry = registry
+        return
+
+    @classmethod
+    def lookup(cls, keys, registry):
+        table = registry.get(keys)
+        if table is None:
+            table = cls(keys, registry)
+            registry[keys] = table
+        return table
+
+    def with_key(self, key):
+        return KeyTable.lookup(self.keys + (key,), self._registry)
+
+    def without_key(self, key):
+        return KeyTable.lookup(tuple(k for k in self.keys if k != key), self._registry)
+
+
+class CompactObject(MutableMapping):
+    """
+    A compact alternative to SerialObject.  The keys live in a KeyTable shared with
+    all the other objects with the same keys and only the values are stored per object.
+    Supports the same item and attribute access as SerialObject, including updates,
+    and serializes back to the same JSON.
+    """
+    __slots__ = ('_table', '_values')
+
+    def __init__(self, table, values):
+        object.__setattr__(self, '_table', table)
+        object.__setattr__(self, '_values', values)
+        return
+
+    def __getitem__(self, key):
+        return self._values[self._table.index[key]]
+
+    def __setitem__(self, key, value):
+        position = self._table.index.get(key)
+        if position is None:
+            object.__setattr__(self, '_table', self._table.with_key(key))
+            self._values.append(value)
+        else:
+            self._values[position] = value
+        return
+
+    def __delitem__(self, key):
+        position = self._table.index[key]
+        object.__setattr__(self, '_table', self._table.without_key(key))
+        del self._values[position]
+        return
+
+    def __getattr__(self, name):
+        if name in CompactObject.__slots__:     # not yet set, e.g. while unpickling
+            raise AttributeError(name)
+        try:
+            return self[name]
+        except KeyError:
+            raise AttributeError(name) from None
+
+    def __setattr__(self, name, value):
+        self[name] = value
+        return
+
+    def __delattr__(self, name):
+        try:
+            del self[name]
+        except KeyError:
+            raise AttributeError(name) from None
+        return
+
+    def __getstate__(self):
+        return self._table, self._values
+
+    def __setstate__(self, state):
+        # bypass __setattr__, which would add the slots as keys
+        object.__setattr__(self, '_table', state[0])
+        object.__setattr__(self, '_values', state[1])
+        return
+
+    def __iter__(self):
+        return iter(self._table.keys)
+
+    def __len__(self):
+        return len(self._values)
+
+    def __contains__(self, key):
+        return key in self._table.index
+
+    def __repr__(self):
+        return repr(self.as_dictionary())
+
+    def __copy__(self):
+        return CompactObject(self._table, list(self._values))
+
+    def __deepcopy__(self, memo):
+        return CompactObject(self._table, copy.deepcopy(self._values, memo))
+
+    def keys(self):
+        return list(self._table.keys)
+
+    def values(self):
+        return list(self._values)
+
+    def items(self):
+        return list(zip(self._table.keys, self._values))
+
+    def as_dictionary(self):
+        """
+        Return a (shallow) dictionary with the same keys and values.
+        """
+        return dict(zip(self._table.keys, self._values))
+
+
+def compact_object_hook():
+    """
+    Return an object_pairs_hook for json.loads() which builds CompactObjects
+    sharing key tables for all the objects parsed with it.
+    """
+    registry = {}
+
+    def hook(pairs):
+        if not pairs:
+            return CompactObject(KeyTable.lookup((), registry), [])
+        keys, values = zip(*pairs)
+        table = registry.get(keys)
+        if table is None:
+            table = KeyTable.lookup(keys, registry)
+        obj = new_object(CompactObject)
+        set_table(obj, table)
+        set_values(obj, list(values))
+        return obj
+
+    new_object = object.__new__
+    set_table = CompactObject._table.__set__
+    set_values = CompactObject._values.__set__
+
+    return hook
+
+
+def serialize_default(obj):
+    """
+    The default function for json.dumps() so CompactObjects and LazyHumans serialize like dictionaries.
+    """
+    if isinstance(obj, CompactObject):
+        return obj.as_dictionary()
+    if isinstance(obj, LazyHuman):
+        return obj.materialize()
+    raise TypeError(f"Object of type {type(obj).__name__} is not JSON serializable")
+
+
+_MISSING = object()
+_NOT_SCALAR = object()
+_WHITESPACE = re.compile(r'[ \t\n\r]*')
+
+
+class LazyHumanCollection(object):
+    """
+    The humans in one serialized human collection, located but not yet parsed.
+
+    Use LazyHumanCollection.scan() to find the span of each human with a single,
+    vectorized pass over the uncompressed collection.  Top-level scalar fields,
+    e.g. m_age, are read for every human in the collection at once the first time
+    any human asks for them.  Anything else parses just the one human.
+
+    Args:
+        text (str): The uncompressed JSON for the collection.
+        starts (np.ndarray): The offset of the start of each human.
+        ends (np.ndarray): The offset just past the end of each human.
+        braces (np.ndarray): The offsets of the braces which are not in strings.
+        depths (np.ndarray): The object nesting depth just after each of those braces.
+        quotes (np.ndarray): The offsets of the quotes in the text.
+        object_hook (callable): The function used to build parsed objects.
+    """
+    HUMAN_DEPTH = 2     # {"human_collection":[{...human...}, ...]}
+
+    def __init__(self, text, starts, ends, braces, depths, quotes, object_hook=SerialObject):
+        self._text = text
+        self._starts = starts
+        self._ends = ends
+        self._braces = braces
+        self._depths = depths
+        self._quotes = quotes
+        self._object_hook = object_hook
+        self._columns = {}
+        self._decoder = json.JSONDecoder()
+        self.modified = False
+        self.humans = [LazyHuman(self, index) for index in range(len(starts))]
+        return
+
+    @classmethod
+    def scan(cls, data, object_hook=SerialObject):
+        """
+        Find the humans in the given uncompressed collection.  Returns None if the
+        collection cannot be scanned safely, i.e. it has non-ASCII characters or
+        escaped characters in strings, so the caller should parse it normally.
+        """
+        if not data.isascii() or b'\\' in data:
+            return None
+
+        buffer = np.frombuffer(data, dtype=np.uint8)
+        quotes = np.flatnonzero(buffer == ord('"'))
+        opens = buffer == ord('{')
+        braces = np.flatnonzero(opens | (buffer == ord('}')))
+        braces = braces[(np.searchsorted(quotes, braces) % 2) == 0]     # ignore braces in strings
+        steps = np.where(opens[braces], 1, -1)
+        depths = np.cumsum(steps)
+        starts = braces[(steps == 1) & (depths == cls.HUMAN_DEPTH)]
+        ends = braces[(steps == -1) & (depths == cls.HUMAN_DEPTH - 1)] + 1
+        if len(starts) != len(ends):
+            return None
+
+        return cls(data.decode('ascii'), starts, ends, braces, depths, quotes, object_hook)
+
+    def __len__(self):
+        return len(self.humans)
+
+    def column(self, key):
+        """
+        Return a list with the value of the given top-level field for each human.
+        Humans without the field have a _MISSING entry and humans where the field
+        is an object or an array have a _NOT_SCALAR entry.
+        """
+        if key in self._columns:
+            return self._columns[key]
+
+        column = [_MISSING] * len(self.humans)
+        pattern = re.compile(re.escape(json.dumps(key)) + r'[ \t\n\r]*:')
+        matches = np.array([match.span() for match in pattern.finditer(self._text)], dtype=np.int64).reshape((-1, 2))
+        if len(matches) > 0:
+            offsets = matches[:, 0]
+            outside_strings = (np.searchsorted(self._quotes, offsets) % 2) == 0
+            depths = self._depths[np.searchsorted(self._braces, offsets) - 1]
+            keep = outside_strings & (depths == self.HUMAN_DEPTH)
+            indices = np.searchsorted(self._starts, offsets[keep], side='right') - 1
+            for index, colon_end in zip(indices.tolist(), matches[keep, 1].tolist()):
+                position = _WHITESPACE.match(self._text, colon_end).end()
+                if self._text[position] in '{[':
+                    column[index] = _NOT_SCALAR
+                else:
+                    column[index] = self._decoder.raw_decode(self._text, position)[0]
+
+        self._columns[key] = column
+        return column
+
+    def parse(self, index, modified=True):
+        """
+        Parse and return the full object for the human at the given index.
+        Pass modified=False if the object will not be kept as this human, e.g. when pickling.
+        """
+        if modified:
+            self.modified = True    # parsed objects can be changed in place
+        text = self._text[self._starts[index]:self._ends[index]]
+        if self._object_hook is SerialObject:
+            return json.loads(text, object_hook=SerialObject)
+        return json.loads(text, object_pairs_hook=self._object_hook)
+
+    def unchanged(self, humans):
+        """
+        Return True if the given list is still exactly the unparsed humans of this collection.
+        """
+        if self.modified or len(humans) != len(self.humans):
+            return False
+        return all(human is original for human, original in zip(humans, self.humans))
+
+
+class LazyHuman(MutableMapping):
+    """
+    One human in a LazyHumanCollection.  Top-level scalar fields are read without
+    parsing the human.  Any other access parses the human, after which it behaves
+    exactly like the parsed object.
+    """
+    __slots__ = ('_collection', '_index', '_object')
+
+    def __init__(self, collection, index):
+        object.__setattr__(self, '_collection', collection)
+        object.__setattr__(self, '_index', index)
+        object.__setattr__(self, '_object', None)
+        return
+
+    def materialize(self):
+        """
+        Return the parsed object for this human, parsing it if necessary.
+        """
+        if self._object is None:
+            object.__setattr__(self, '_object', self._collection.parse(self._index))
+        return self._object
+
+    def __getitem__(self, key):
+        if self._object is None and isinstance(key, str):
+            value = self._collection.column(key)[self._index]
+            if value is _MISSING:
+                raise KeyError(key)
+            if value is not _NOT_SCALAR:
+                return value
+        return self.materialize()[key]
+
+    def __setitem__(self, key, value):
+        self.materialize()[key] = value
+        return
+
+    def __delitem__(self, key):
+        del self.materialize()[key]
+        return
+
+    def __getattr__(self, name):
+        if name in LazyHuman.__slots__:     # not yet set, e.g. while unpickling
+            raise AttributeError(name)
+        try:
+            return self[name]
+        except KeyError:
+            raise AttributeError(name) from None
+
+    def __setattr__(self, name, value):
+        self[name] = value
+        return
+
+    def __delattr__(self, name):
+        try:
+            del self[name]
+        except KeyError:
+            raise AttributeError(name) from None
+        return
+
+    def __getstate__(self):
+        # pickle the parsed human, not the whole collection
+        if self._object is None:
+            return None, None, self._collection.parse(self._index, modified=False)
+        return None, None, self._object
+
+    def __setstate__(self, state):
+        # bypass __setattr__, which would set the slots as keys of the human
+        for name, value in zip(LazyHuman.__slots__, state):
+            object.__setattr__(self, name, value)
+        return
+
+    def __contains__(self, key):
+        if self._object is None and isinstance(key, str):
+            return self._collection.column(key)[self._index] is not _MISSING
+        return key in self.materialize()
+
+    def __iter__(self):
+        return iter(self.materialize())
+
+    def __len__(self):
+        return len(self.materialize())
+
+    def __repr__(self):
+        return repr(self.materialize())
+
+    def __copy__(self):
+        return copy.copy(self.materialize())
+
+    def __deepcopy__(self, memo):
+        return copy.deepcopy(self.materialize(), memo)
+
+
+class IoStatistics(object):
+    """
+    Collects timing and size information for each chunk read, uncompressed, parsed,
+    serialized, compressed, or written by dtk_file_tools while it is active.
+    Use dtk_file_tools.instrument() to activate one.
+
+    Each event is a dictionary with 'operation', 'chunk', and 'seconds' entries
+    plus the sizes that apply to the operation: 'bytes' (read, write),
+    'compressed_bytes', and/or 'uncompressed_bytes'.
+
+    Args:
+        callback (callable): Optional function called with each event as it is recorded.
+    """
+    def __init__(self, callback=None):
+        self._callback = callback
+        self._events = []
+        self._lock = threading.Lock()
+        return
+
+    def record(self, operation, chunk, seconds, **sizes):
+        """
+        Record one event.
+        """
+        event = {'operation': operation, 'chunk': chunk, 'seconds': seconds, **sizes}
+        with self._lock:
+            self._events.append(event)
+        if self._callback is not None:
+            self._callback(event)
+        return
+
+    @property
+    def events(self):
+        """
+        Return the list of recorded events in the order they occurred.
+        """
+        return self._events
+
+    def totals(self):
+        """
+        Return the number of events, total seconds, and total sizes for each operation.
+        """
+        totals = {}
+        for event in self._events:
+            total = totals.setdefault(event['operation'], {'count': 0, 'seconds': 0.0})
+            total['count'] += 1
+            for key, value in event.items():
+                if key in ('seconds', 'bytes', 'compressed_bytes', 'uncompressed_bytes'):
+                    total[key] = total.get(key, 0) + value
+        return totals
+
+    def as_dictionary(self):
+        return {'totals': self.totals(), 'events': list(self._events)}
+
+    def to_json(self, filename=None, indent=2):
+        """
+        Return the statistics as JSON text and, optionally, write them to the given file.
+        """
+        text = json.dumps(self.as_dictionary(), indent=indent)
+        if filename is not None:
+            with open(filename, 'w', encoding='utf-8') as handle:
+                handle.write(text)
+        return text
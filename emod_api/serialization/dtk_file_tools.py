@@ -9,14 +9,20 @@ Support for three formats of serialized population files:
 5. "Emod info added": emod_info added to header
 6. "Per-node/human compression and chunk sizes": sim_compression, sim_chunk_size, node_compressions,
    node_chunk_sizes, human_compressions, human_node_suids, human_chunk_sizes added to header
+
+Files can also be compressed with ZSTD (requires the zstandard package) for storage and
+transfer, but EMOD cannot read them.  Use NONE, LZ4 (any level), or SNAPPY for files EMOD will load.
 """
 
 import copy
 import gc
-from collections.abc import MutableMapping
+from collections.abc import Mapping, MutableMapping
+from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor
+from contextlib import contextmanager
 import json
 import os
 import time
+import warnings
 import emod_api.serialization.dtk_file_support as support
 
 
@@ -30,14 +36,19 @@ MAX_VERSION = 6
 NONE = 'NONE'
 LZ4 = 'LZ4'
 SNAPPY = 'SNAPPY'
+ZSTD = 'ZSTD'
+
+__engines__ = {LZ4: support.EllZeeFour, SNAPPY: support.Snappy, NONE: support.Uncompressed, ZSTD: support.Zstandard}
 
-__engines__ = {LZ4: support.EllZeeFour, SNAPPY: support.Snappy, NONE: support.Uncompressed}
+# compression engines EMOD itself can read
+EMOD_ENGINES = (NONE, LZ4, SNAPPY)
 
 # V6 compression strings are fixed to always be three characters so that
 # the header size is predictable regardless of compression type used.
 V6_COMPRESSION_STR_NONE = "NON"
 V6_COMPRESSION_STR_LZ4 = "LZ4"
 V6_COMPRESSION_STR_SNAPPY = "SNA"
+V6_COMPRESSION_STR_ZSTD = "ZST"
 
 
 def _determine_v6_compression_type(data):
@@ -56,6 +67,8 @@ def _compression_type_v6_to_old(compression_str):
         return LZ4
     elif compression_str == V6_COMPRESSION_STR_SNAPPY:
         return SNAPPY
+    elif compression_str == V6_COMPRESSION_STR_ZSTD:
+        return ZSTD
     else:
         raise RuntimeError(f"Unknown/unsupported compression scheme '{compression_str}'")
 
@@ -67,6 +80,8 @@ def _compression_type_old_to_v6(compression_str):
         return V6_COMPRESSION_STR_LZ4
     elif compression_str == SNAPPY:
         return V6_COMPRESSION_STR_SNAPPY
+    elif compression_str == ZSTD:
+        return V6_COMPRESSION_STR_ZSTD
     else:
         raise RuntimeError(f"Unknown/unsupported compression scheme '{compression_str}'")
 
@@ -78,13 +93,86 @@ def uncompress(data, engine):
         raise RuntimeError(f"Unknown/unsupported compression scheme '{engine}'")
 
 
-def compress(data, engine):
+def compress(data, engine, level=None):
     if engine in __engines__:
-        return __engines__[engine].compress(data)
+        return __engines__[engine].compress(data, level)
     else:
         raise RuntimeError(f"Unknown/unsupported compression scheme '{engine}'")
 
 
+# -----------------------------------------------------------------------------
+# --- instrumentation
+# -----------------------------------------------------------------------------
+
+_statistics = None
+
+
+@contextmanager
+def instrument(callback=None):
+    """
+    Record the sizes and timing of each chunk read, uncompressed, parsed, serialized,
+    compressed, and written while the context is active.  Work done in worker
+    processes, e.g. by read_many() with fields, is not recorded.
+
+    Args:
+        callback (callable): Optional function called with each event as it is recorded.
+
+    Examples:
+        Find out whether loading a file is bound by disk, LZ4, or JSON::
+
+            with dft.instrument() as stats:
+                dtk = dft.read("state-00365.dtk")
+                ages = [human.m_age for node in dtk.nodes for human in node.individualHumans]
+            print(stats.totals())
+            stats.to_json("io_statistics.json")
+    """
+    global _statistics
+    previous = _statistics
+    statistics = support.IoStatistics(callback)
+    _statistics = statistics
+    try:
+        yield statistics
+    finally:
+        _statistics = previous
+
+
+def _record(operation, chunk, start, **sizes):
+    if _statistics is not None:
+        _statistics.record(operation, chunk, time.perf_counter() - start, **sizes)
+    return
+
+
+def _uncompress_chunk(data, engine, chunk):
+    start = time.perf_counter()
+    uncompressed = uncompress(data, engine)
+    _record('decompress', chunk, start, compressed_bytes=len(data), uncompressed_bytes=len(uncompressed))
+    return uncompressed
+
+
+def _compress_chunk(data, engine, chunk, level=None):
+    start = time.perf_counter()
+    compressed = compress(data, engine, level)
+    _record('compress', chunk, start, uncompressed_bytes=len(data), compressed_bytes=len(compressed))
+    return compressed
+
+
+def _parse_chunk(text, chunk, compact=False):
+    start = time.perf_counter()
+    if compact:
+        json_data = json.loads(text, object_pairs_hook=support.compact_object_hook())
+    else:
+        json_data = json.loads(text, object_hook=support.SerialObject)
+    _record('parse', chunk, start, uncompressed_bytes=len(text))
+    return json_data
+
+
+def _serialize_chunk(json_data, chunk):
+    start = time.perf_counter()
+    text = json.dumps(json_data, separators=(',', ':'), default=support.serialize_default)
+    _record('serialize', chunk, start, uncompressed_bytes=len(text))
+    return text
+
+
 # -----------------------------------------------------------------------------
 # --- DtkHeader
 # -----------------------------------------------------------------------------
@@ -133,16 +221,16 @@ class DtkFile(object):
                 index += 1
 
         def __getitem__(self, index):
-            data = str(uncompress(self.__parent__.chunks[index], self.__parent__.compression), 'utf-8')
+            data = str(_uncompress_chunk(self.__parent__.chunks[index], self.__parent__.compression, f"chunk:{index}"), 'utf-8')
             return data
 
         def __setitem__(self, index, value):
-            data = compress(value.encode(), self.__parent__.compression)
+            data = _compress_chunk(value.encode(), self.__parent__.compression, f"chunk:{index}")
             self.__parent__.chunks[index] = data
             return
 
         def append(self, item):
-            data = compress(item, self.__parent__.compression)
+            data = _compress_chunk(item, self.__parent__.compression, f"chunk:{len(self)}")
             self.__parent__.chunks.append(data)
 
         def __len__(self):
@@ -163,18 +251,18 @@ class DtkFile(object):
         def __getitem__(self, index):
             try:
                 contents = self.__parent__.contents[index]
-                item = json.loads(contents, object_hook=support.SerialObject)
+                item = _parse_chunk(contents, f"chunk:{index}", self.__parent__._compact)
             except Exception:
                 raise UserWarning(f"Could not parse JSON in chunk {index}")
             return item
 
         def __setitem__(self, index, value):
-            contents = json.dumps(value, separators=(',', ':'))
+            contents = _serialize_chunk(value, f"chunk:{index}")
             self.__parent__.contents[index] = contents
             return
 
         def append(self, item):
-            contents = json.dumps(item, separators=(',', ':'))
+            contents = _serialize_chunk(item, f"chunk:{len(self)}")
             self.__parent__.contents.append(contents)
             return
 
@@ -182,8 +270,9 @@ class DtkFile(object):
             length = len(self.__parent__.chunks)
             return length
 
-    def __init__(self, header):
+    def __init__(self, header, compact=False):
         self.__header__ = header
+        self._compact = compact
         self._chunks = [None for index in range(header.chunkcount)]
         self.contents = self.Contents(self)
         self.objects = self.Objects(self)
@@ -289,13 +378,13 @@ class DtkFile(object):
 
 class DtkFileV1(DtkFile):
 
-    def __init__(self, header=None, filename='', handle=None):
+    def __init__(self, header=None, filename='', handle=None, compact=False):
         if header is None:
             header = DtkHeader()
         header.version = 1
-        super(DtkFileV1, self).__init__(header)
+        super(DtkFileV1, self).__init__(header, compact)
         if handle is not None:
-            self.chunks[0] = handle.read(header.chunksizes[0])
+            self.chunks[0] = __read_chunk__(handle, header.chunksizes[0], "chunk:0")
             self._nodes = [entry.node for entry in self.simulation.nodes]
         return
 
@@ -343,13 +432,13 @@ class DtkFileV2(DtkFile):
             length = self.__parent__.chunk_count - 1
             return length
 
-    def __init__(self, header=None, filename='', handle=None):
+    def __init__(self, header=None, filename='', handle=None, compact=False):
         if header is None:
             header = DtkHeader()
         header.version = 2
-        super(DtkFileV2, self).__init__(header)
+        super(DtkFileV2, self).__init__(header, compact)
         for index, size in enumerate(header.chunksizes):
-            self.chunks[index] = handle.read(size)
+            self.chunks[index] = __read_chunk__(handle, size, f"chunk:{index}")
             if len(self.chunks[index]) != size:
                 raise UserWarning(
                     f"Only read {len(self.chunks[index])} bytes of {size} for chunk {index} of file '{filename}'")
@@ -403,13 +492,13 @@ class DtkFileV3(DtkFile):
             length = self.__parent__.chunk_count - 1
             return length
 
-    def __init__(self, header=None, filename='', handle=None):
+    def __init__(self, header=None, filename='', handle=None, compact=False):
         if header is None:
             header = DtkHeader()
         header.version = 3
-        super(DtkFileV3, self).__init__(header)
+        super(DtkFileV3, self).__init__(header, compact)
         for index, size in enumerate(header.chunksizes):
-            self.chunks[index] = handle.read(size)
+            self.chunks[index] = __read_chunk__(handle, size, f"chunk:{index}")
             if len(self.chunks[index]) != size:
                 raise UserWarning(f"Only read {len(self.chunks[index])} bytes of {size} for chunk {index} of file '{filename}'")
         self._nodes = self.NodesV3(self)
@@ -448,10 +537,10 @@ class DtkFileV3(DtkFile):
 
 class DtkFileV4(DtkFileV3):
 
-    def __init__(self, header=None, filename='', handle=None):
+    def __init__(self, header=None, filename='', handle=None, compact=False):
         if header is None:
             header = DtkHeader()
-        super(DtkFileV4, self).__init__(header, filename, handle)
+        super(DtkFileV4, self).__init__(header, filename, handle, compact)
         header.version = 4
         return
 
@@ -463,7 +552,7 @@ class DtkFileV4(DtkFileV3):
 
 
 class DtkFileV5(DtkFileV4):
-    def __init__(self, header=None, filename='', handle=None):
+    def __init__(self, header=None, filename='', handle=None, compact=False):
         if header is None:
             header = DtkHeader()
             version5_params = {
@@ -481,7 +570,7 @@ class DtkFileV5(DtkFileV4):
                 }
             }
             header.update(version5_params)
-        super(DtkFileV5, self).__init__(header, filename, handle)
+        super(DtkFileV5, self).__init__(header, filename, handle, compact)
         header.version = 5
         return
 
@@ -568,6 +657,7 @@ class DtkFileV6(object):
             node_suid (int): The SUID of the node the chunk belongs to.
             chunk_size (int): The size of the chunk in bytes.
             chunk (bytes): The compressed chunk data.
+            compact (bool): Parse the JSON into CompactObjects rather than SerialObjects.
         """
         def __init__(self,
                      filename,
@@ -575,7 +665,8 @@ class DtkFileV6(object):
                      v6_compression_str,
                      node_suid,
                      chunk_size,
-                     chunk):
+                     chunk,
+                     compact=False):
             if chunk is None and chunk_size != 0:
                 msg = f"Chunk is None but chunk size is {chunk_size} for {obj_type_str} chunk of file '{filename}'"
                 raise UserWarning(msg)
@@ -584,10 +675,14 @@ class DtkFileV6(object):
                 raise UserWarning(msg)
 
             self._v6_compression_str = v6_compression_str
+            self._obj_type_str = obj_type_str
             self._node_suid = node_suid
             self._chunk_size = chunk_size
             self._chunk = chunk
             self._json = None
+            self._compact = compact
+            self._engine = None
+            self._level = None
             return
 
         def get_json(self):
@@ -596,17 +691,23 @@ class DtkFileV6(object):
             """
             if self._json is None:
                 old_compression_type = _compression_type_v6_to_old(self._v6_compression_str)
-                uncomp_data = str(uncompress(self._chunk, old_compression_type), 'utf-8')
-                try:
-                    json_data = json.loads(uncomp_data, object_hook=support.SerialObject)
-                except Exception:
-                    raise UserWarning(f"Could not parse JSON in chunk with size {self._chunk_size}")
-                self._json = json_data
-                self._chunk = None
-                self._chunk_size = 0
-                gc.collect()
+                self._load(_uncompress_chunk(self._chunk, old_compression_type, self.label))
             return self._json
 
+        def _load(self, uncomp_data):
+            """
+            Parse the given uncompressed chunk data and release the compressed chunk.
+            """
+            try:
+                json_data = _parse_chunk(str(uncomp_data, 'utf-8'), self.label, self._compact)
+            except Exception:
+                raise UserWarning(f"Could not parse JSON in chunk with size {self._chunk_size}")
+            self._json = json_data
+            self._chunk = None
+            self._chunk_size = 0
+            gc.collect()
+            return
+
         def set_json(self, json_data):
             """
             Replace the existing JSON with the provided JSON dictionary.
@@ -621,15 +722,38 @@ class DtkFileV6(object):
             Compress and store the JSON dictionary as a chunk.
             """
             if self._chunk is None:
-                json_data = json.dumps(self._json, separators=(',', ':'))
+                json_data = _serialize_chunk(self._json, self.label)
                 self._v6_compression_str = _determine_v6_compression_type(json_data)
+                if (self._engine is not None) and (self._engine != LZ4 or self._v6_compression_str == V6_COMPRESSION_STR_LZ4):
+                    self._v6_compression_str = _compression_type_old_to_v6(self._engine)
                 old_compression_type = _compression_type_v6_to_old(self._v6_compression_str)
-                self._chunk = compress(json_data.encode(), old_compression_type)
+                self._chunk = _compress_chunk(json_data.encode(), old_compression_type, self.label, self._level)
                 self._chunk_size = len(self._chunk)
                 self._json = None
                 gc.collect()
             return
 
+        def set_compression(self, engine, level=None):
+            """
+            Use the given engine (NONE, LZ4, SNAPPY, ZSTD, or None to choose like EMOD)
+            and level when storing the chunk.  Already compressed data is re-compressed
+            without parsing it.
+            """
+            self._engine = engine
+            self._level = level
+            if self._chunk is not None:
+                self._v6_compression_str, self._chunk = self._recompress(self._v6_compression_str, self._chunk)
+                self._chunk_size = len(self._chunk)
+            return
+
+        def _recompress(self, v6_compression_str, chunk):
+            data = _uncompress_chunk(chunk, _compression_type_v6_to_old(v6_compression_str), self.label)
+            new_compression_str = _determine_v6_compression_type(data)
+            if (self._engine is not None) and (self._engine != LZ4 or new_compression_str == V6_COMPRESSION_STR_LZ4):
+                new_compression_str = _compression_type_old_to_v6(self._engine)
+            new_chunk = _compress_chunk(data, _compression_type_v6_to_old(new_compression_str), self.label, self._level)
+            return new_compression_str, new_chunk
+
         @property
         def v6_compression_str(self):
             """
@@ -644,6 +768,15 @@ class DtkFileV6(object):
             """
             return self._node_suid
 
+        @property
+        def label(self):
+            """
+            Return a short description of the chunk, e.g. 'sim' or 'human:3', for instrumentation.
+            """
+            if self._node_suid < 0:
+                return self._obj_type_str
+            return f"{self._obj_type_str}:{self._node_suid}"
+
         @property
         def chunk_size(self):
             """
@@ -670,6 +803,9 @@ class DtkFileV6(object):
             num_humans (int): The number of humans in the collection.
             chunk_size (int): The size of the chunk in bytes.
             chunk (bytes): The compressed chunk data.
+            compact (bool): Parse the humans into CompactObjects rather than SerialObjects.
+            lazy (bool): Only locate the humans when the chunk is loaded and parse each one
+                as it is needed.  See support.LazyHumanCollection.
         """
         def __init__(self,
                      filename,
@@ -678,23 +814,74 @@ class DtkFileV6(object):
                      node_suid,
                      num_humans,
                      chunk_size,
-                     chunk):
+                     chunk,
+                     compact=False,
+                     lazy=False):
             super(DtkFileV6.HumanCollectionChunkV6, self).__init__(filename,
                                                                    obj_type_str,
                                                                    v6_compression_str,
                                                                    node_suid,
                                                                    chunk_size,
-                                                                   chunk)
+                                                                   chunk,
+                                                                   compact)
             self._num_humans = num_humans
+            self._lazy = lazy
+            self._lazy_collection = None
+            self._lazy_chunk = None
             return
 
         def get_json(self):
             """
             Return an list of JSON IndividualHuman dictionaries.
             """
+            if self._lazy and self._json is None:
+                self._scan()
             json_data = super(DtkFileV6.HumanCollectionChunkV6, self).get_json()
             return json_data['human_collection']
 
+        def _scan(self):
+            """
+            Locate the humans in the chunk without parsing them.  If the chunk cannot
+            be scanned, parse it normally.
+            """
+            old_compression_type = _compression_type_v6_to_old(self._v6_compression_str)
+            uncomp_data = _uncompress_chunk(self._chunk, old_compression_type, self.label)
+            start = time.perf_counter()
+            object_hook = support.compact_object_hook() if self._compact else support.SerialObject
+            collection = support.LazyHumanCollection.scan(uncomp_data, object_hook)
+            if collection is not None:
+                _record('parse', self.label, start, uncompressed_bytes=len(uncomp_data))
+                self._lazy_collection = collection
+                self._lazy_chunk = (self._v6_compression_str, self._chunk)
+                self._json = {'human_collection': list(collection.humans)}
+                self._chunk = None
+                self._chunk_size = 0
+            else:
+                self._load(uncomp_data)     # without uncompressing the chunk again
+            return
+
+        def set_compression(self, engine, level=None):
+            super(DtkFileV6.HumanCollectionChunkV6, self).set_compression(engine, level)
+            if self._lazy_chunk is not None:
+                self._lazy_chunk = self._recompress(*self._lazy_chunk)
+            return
+
+        def store(self):
+            """
+            Compress and store the humans as a chunk.  If the chunk was scanned and none
+            of its humans have been parsed or replaced, the original chunk is kept.
+            """
+            if (self._chunk is None) and (self._lazy_collection is not None) and \
+                    self._lazy_collection.unchanged(self._json['human_collection']):
+                self._v6_compression_str, self._chunk = self._lazy_chunk
+                self._chunk_size = len(self._chunk)
+                self._json = None
+            else:
+                super(DtkFileV6.HumanCollectionChunkV6, self).store()
+            self._lazy_collection = None
+            self._lazy_chunk = None
+            return
+
         def set_json(self, human_list):
             """
             Replace the existing JSON with the provided list of IndividualHuman dictionaries.
@@ -869,6 +1056,7 @@ class DtkFileV6(object):
                 num_humans=0,
                 chunk_size=0,
                 chunk=None)
+            human_chunk.set_compression(self.__parent__._engine, self.__parent__._level)
             human_chunk.set_json(json_dict_list)
             self.__parent__._human_chunks.append(human_chunk)
             self._human_list._add_human_chunk(human_chunk)
@@ -1027,7 +1215,7 @@ class DtkFileV6(object):
             self._num_humans += 1
             self._human_chunk_list[self._human_chunk_index]._num_humans += 1
 
-    def __init__(self, header=None, filename='', handle=None):
+    def __init__(self, header=None, filename='', handle=None, compact=False, lazy=False):
         """
         Initialize a DtkFileV6 object from the provided header and file handle.
         This should read the file and create chunk objects for the simulation, nodes,
@@ -1037,6 +1225,9 @@ class DtkFileV6(object):
             header (DtkHeaderV6): The header for the file.
             filename (str): The name of the file being read (for error messages).
             handle (file-like object): The file handle to read the data from.
+            compact (bool): Decode humans into CompactObjects, which share their keys
+                with the other humans in the collection, rather than SerialObjects.
+            lazy (bool): Decode humans lazily, see read().
         """
         if header is None:
             header = DtkHeaderV6()
@@ -1045,10 +1236,12 @@ class DtkFileV6(object):
         self._node_chunks = []
         self._human_chunks = []
         self._nodes = DtkFileV6.NodeListV6(self)
+        self._engine = None
+        self._level = None
 
         if handle is not None:
             sim_chunk_size = int(header.sim_chunk_size, 16)
-            sim_chunk_data = handle.read(sim_chunk_size)
+            sim_chunk_data = __read_chunk__(handle, sim_chunk_size, "sim")
             self._sim_chunk = DtkFileV6.Chunk(filename,
                                               "sim",
                                               header.sim_compression,
@@ -1060,7 +1253,7 @@ class DtkFileV6(object):
                 v6_compression_str = header.node_compressions[index]
                 node_suid = int(header.node_suids[index], 16)
                 chunk_size = int(size_string, 16)
-                chunk_data = handle.read(chunk_size)
+                chunk_data = __read_chunk__(handle, chunk_size, f"node:{node_suid}")
                 node_chunk = DtkFileV6.Chunk(filename,
                                              "node",
                                              v6_compression_str,
@@ -1076,14 +1269,16 @@ class DtkFileV6(object):
                 node_suid = int(node_suid_str, 16)
                 num_humans = int(num_humans_str, 16)
                 chunk_size = int(size_string, 16)
-                chunk_data = handle.read(chunk_size)
+                chunk_data = __read_chunk__(handle, chunk_size, f"human:{node_suid}")
                 human_chunk = DtkFileV6.HumanCollectionChunkV6(filename,
                                                                "human",
                                                                v6_compression_str,
                                                                node_suid,
                                                                num_humans,
                                                                chunk_size,
-                                                               chunk_data)
+                                                               chunk_data,
+                                                               compact,
+                                                               lazy)
                 self._human_chunks.append(human_chunk)
 
             for node_chunk in self._node_chunks:
@@ -1110,6 +1305,24 @@ class DtkFileV6(object):
     def header(self):
         return self.__header__
 
+    def set_compression(self, engine, level=None):
+        """
+        Compress every chunk with the given engine and level from now on.
+
+        Args:
+            engine (str): NONE, LZ4, SNAPPY, ZSTD, or None to let each chunk choose
+                like EMOD does (LZ4 unless the chunk is too large for LZ4).
+                Note that EMOD cannot read ZSTD compressed files.
+            level (int): Compression level, e.g. 1-12 for LZ4 high compression mode
+                or 1-22 for ZSTD.  None uses the engine's default.
+        """
+        self._engine = engine
+        self._level = level
+        for chunk in [self._sim_chunk] + self._node_chunks + self._human_chunks:
+            if chunk is not None:
+                chunk.set_compression(engine, level)
+        return
+
     # Optional header entries
     @property
     def author(self):
@@ -1141,6 +1354,15 @@ class DtkFileV6(object):
     def version(self):
         return self.__header__.version
 
+    @property
+    def emod_readable(self):
+        """
+        Return False if any chunk uses a compression engine EMOD cannot read.
+        """
+        chunks = [self._sim_chunk] + self._node_chunks + self._human_chunks
+        return all(_compression_type_v6_to_old(chunk.v6_compression_str) in EMOD_ENGINES
+                   for chunk in chunks if chunk is not None and chunk.v6_compression_str is not None)
+
     @property
     def nodes(self):
         """
@@ -1197,30 +1419,152 @@ class DtkFileV6(object):
 # -----------------------------------------------------------------------------
 
 
-def read(filename):
-
+def read(filename, compact=False, lazy=False):
+    """
+    Read a serialized population file.
+
+    Args:
+        filename (str): The serialized population file to read.
+        compact (bool): Decode objects into CompactObjects, which share a key table with
+            the other objects in the same chunk (V6: human collection), rather than
+            SerialObjects.  This greatly reduces the memory used by decoded humans and
+            supports the same item and attribute access.
+        lazy (bool): V6 files only.  Locate the humans in each collection with one quick
+            scan and only parse a human when it is needed.  Top-level scalar fields,
+            e.g. m_age or m_is_infected, are read for the whole collection at once without
+            parsing any humans and collections with no parsed humans are not re-compressed
+            when stored, which makes scans of a few fields several times faster.
+
+    Returns:
+        A DtkFileV1 ... DtkFileV6 object depending on the version of the file.
+    """
     new_file = None
     with open(filename, 'rb') as handle:
         __check_magic_number__(handle)
         header = __read_header__(handle)
         if header.version == 1:
-            new_file = DtkFileV1(header, filename=filename, handle=handle)
+            new_file = DtkFileV1(header, filename=filename, handle=handle, compact=compact)
         elif header.version == 2:
-            new_file = DtkFileV2(header, filename=filename, handle=handle)
+            new_file = DtkFileV2(header, filename=filename, handle=handle, compact=compact)
         elif header.version == 3:
-            new_file = DtkFileV3(header, filename=filename, handle=handle)
+            new_file = DtkFileV3(header, filename=filename, handle=handle, compact=compact)
         elif header.version == 4:
-            new_file = DtkFileV4(header, filename=filename, handle=handle)
+            new_file = DtkFileV4(header, filename=filename, handle=handle, compact=compact)
         elif header.version == 5:
-            new_file = DtkFileV5(header, filename=filename, handle=handle)
+            new_file = DtkFileV5(header, filename=filename, handle=handle, compact=compact)
         elif header.version == 6:
-            new_file = DtkFileV6(header, filename=filename, handle=handle)
+            new_file = DtkFileV6(header, filename=filename, handle=handle, compact=compact, lazy=lazy)
         else:
             raise UserWarning(f'Unknown serialized population file version: {header.version}')
 
     return new_file
 
 
+def read_many(filenames, workers=None, fields=None):
+    """
+    Read several serialized population files concurrently, e.g. the state-*.dtk
+    files from each simulation of a calibration sweep.
+
+    Without fields, only a summary of each file is returned.  V6 summaries come
+    straight from the file header, so the files are read in a thread pool.
+    With fields, each file is read, uncompressed, and parsed in its own worker
+    process and only the requested human fields are sent back, so the work scales
+    with the number of cores and the full populations never reach this process.
+
+    Args:
+        filenames (list of str): The serialized population files to read.
+        workers (int): The maximum number of workers. None uses one per CPU,
+            1 reads the files serially in this process.
+        fields (list of str): Optional IndividualHuman fields to extract, e.g.
+            ['m_age', 'suid.id'].  Nested fields are separated by '.'.
+
+    Returns:
+        A list with one dictionary per file, in the same order as filenames.  Each
+        dictionary has 'filename', 'version', 'num_nodes', and 'num_humans' entries.
+        If fields were given, it also has a 'columns' dictionary with a 'node_suid'
+        list and one list per field, with one entry per human (None if the human
+        does not have the field).
+    """
+    filenames = list(filenames)
+    if workers is None:
+        workers = os.cpu_count() or 1
+
+    if fields is None:
+        function = _summarize_file
+        arguments = [(filename,) for filename in filenames]
+        executor_class = ThreadPoolExecutor
+    else:
+        fields = list(fields)
+        function = _project_human_fields
+        arguments = [(filename, fields) for filename in filenames]
+        executor_class = ProcessPoolExecutor
+
+    if workers <= 1 or len(filenames) <= 1:
+        return [function(*args) for args in arguments]
+
+    with executor_class(max_workers=min(workers, len(filenames))) as executor:
+        results = list(executor.map(function, *zip(*arguments)))
+
+    return results
+
+
+def _summarize_file(filename):
+    """
+    Return the version, number of nodes, and number of humans in the given file.
+    Only the header is read for V6 files.
+    """
+    with open(filename, 'rb') as handle:
+        __check_magic_number__(handle)
+        header = __read_header__(handle)
+
+    summary = {'filename': filename, 'version': header.version}
+    if header.version == 6:
+        summary['num_nodes'] = len(header.node_suids)
+        summary['num_humans'] = sum(int(count, 16) for count in header.human_num_humans)
+    else:
+        dtk_file = read(filename)
+        summary['num_nodes'] = len(dtk_file.nodes)
+        summary['num_humans'] = sum(len(node.individualHumans) for node in dtk_file.nodes)
+
+    return summary
+
+
+def _project_human_fields(filename, fields):
+    """
+    Return the summary for the given file along with a column of values for each
+    of the given human fields.
+    """
+    dtk_file = read(filename, lazy=True)
+    paths = [field.split('.') for field in fields]
+    columns = {'node_suid': []}
+    columns.update({field: [] for field in fields})
+
+    if dtk_file.version == 6:
+        # go straight to the human collections so the nodes are not parsed and re-compressed
+        collections = ((chunk.node_suid, chunk.get_json()) for chunk in dtk_file._human_chunks)
+        num_nodes = len(dtk_file._node_chunks)
+    else:
+        collections = ((node.suid.id, node.individualHumans) for node in dtk_file.nodes)
+        num_nodes = len(dtk_file.nodes)
+
+    for node_suid, humans in collections:
+        for human in humans:
+            columns['node_suid'].append(node_suid)
+            for field, path in zip(fields, paths):
+                value = human
+                for key in path:
+                    value = value.get(key) if isinstance(value, Mapping) else None
+                columns[field].append(value)
+
+    summary = {'filename': filename,
+               'version': dtk_file.version,
+               'num_nodes': num_nodes,
+               'num_humans': len(columns['node_suid']),
+               'columns': columns}
+
+    return summary
+
+
 def __check_magic_number__(handle):
     magic = handle.read(4).decode()
     if magic != IDTK:
@@ -1266,6 +1610,13 @@ def __read_header__(handle):
     return header
 
 
+def __read_chunk__(handle, size, label):
+    start = time.perf_counter()
+    chunk = handle.read(size)
+    _record('read', label, start, bytes=len(chunk))
+    return chunk
+
+
 def __check_header_size__(header_size):
     if header_size <= 0:
         raise UserWarning(f"Invalid header size: {header_size}")
@@ -1334,6 +1685,13 @@ def write(dtk_file, filename):
 
     dtk_file._sync_header()
 
+    if dtk_file.version <= 5:
+        emod_readable = dtk_file.compression in EMOD_ENGINES
+    else:
+        emod_readable = dtk_file.emod_readable
+    if not emod_readable:
+        warnings.warn(f"'{filename}' uses {ZSTD} compression and can only be read by Python tools, not EMOD.", stacklevel=2)
+
     with open(filename, 'wb') as handle:
         __write_magic_number__(handle)
         print(f"Writing file: {filename}")
@@ -1347,11 +1705,11 @@ def write(dtk_file, filename):
         if dtk_file.version <= 5:
             __write_chunks__(dtk_file.chunks, handle)
         else:
-            handle.write(dtk_file._sim_chunk._chunk)
+            __write_chunk__(dtk_file._sim_chunk._chunk, handle, dtk_file._sim_chunk.label)
             for node_chunk in dtk_file._node_chunks:
-                handle.write(node_chunk._chunk)
+                __write_chunk__(node_chunk._chunk, handle, node_chunk.label)
             for human_chunk in dtk_file._human_chunks:
-                handle.write(human_chunk._chunk)
+                __write_chunk__(human_chunk._chunk, handle, human_chunk.label)
 
     return
 
@@ -1373,6 +1731,13 @@ def __write_header__(string, handle):
 
 
 def __write_chunks__(chunks, handle):
-    for chunk in chunks:
-        handle.write(chunk if type(chunk) is bytes else chunk.encode())
+    for index, chunk in enumerate(chunks):
+        __write_chunk__(chunk if type(chunk) is bytes else chunk.encode(), handle, f"chunk:{index}")
+    return
+
+
+def __write_chunk__(chunk, handle, label):
+    start = time.perf_counter()
+    handle.write(chunk)
+    _record('write', label, start, bytes=len(chunk))
     return
@@ -2,7 +2,7 @@
 import difflib
 import emod_api.serialization.dtk_file_tools as dft
 
-from collections.abc import Iterable
+from collections.abc import Iterable, Mapping
 from typing import Union
 
 COUNTER = 0
@@ -13,6 +13,8 @@ class SerializedPopulation:
 
     Args:
         file: serialized population file
+        compact: decode humans into compact objects which share their keys, uses much less memory
+        lazy: only parse humans as they are needed (V6 files), much faster when reading a few fields
 
     Examples:
         Create an instance of SerializedPopulation::
@@ -21,10 +23,10 @@ class SerializedPopulation:
 
      """
 
-    def __init__(self, file: str):
+    def __init__(self, file: str, compact: bool = False, lazy: bool = False):
         self.next_infection_suid = None
         self.next_infection_suid_initialized = False
-        self.dtk = dft.read(file)
+        self.dtk = dft.read(file, compact=compact, lazy=lazy)
 
     @property
     def nodes(self):
@@ -169,7 +171,7 @@ def find(name: str,
             # list or keys of a dict, works in all cases but misses objects in
             # dicts
             find(name, key, level)
-        if isinstance(handle, dict):
+        if isinstance(handle, Mapping):
             find(name, handle[key], level)  # check if string is key for a dict
 
 
@@ -199,7 +201,7 @@ def get_parameters(handle: Union[str, Iterable],
     for _, d in enumerate(handle):
         level = currentlevel + " " + d if isinstance(d, str) else currentlevel
         param.update(get_parameters(d, level))
-        if isinstance(handle, dict):
+        if isinstance(handle, Mapping):
             param.update(get_parameters(handle[d], level))
 
     return param
@@ -0,0 +1,112 @@
+"""
+Binary sidecar files: derived data kept next to (or in a cache directory for) a source file.
+
+A sidecar starts with a magic string naming its format, then the length of, and offset of the
+data after, a JSON metadata block, then the metadata, then the data, aligned for memory mapping.
+The metadata holds the key (path, size, and modification time) of the source file so stale
+sidecars are detected. Sidecars are written to a temporary file and renamed so concurrent
+readers never see a partial sidecar.
+
+Each format uses its own magic string and suffix, e.g., ".cache" for channel report caches
+(emod_api.channelreports.cache) and ".nodemajor" for node-major spatial reports
+(emod_api.spatialreports.spatial).
+"""
+
+import hashlib
+import json
+import os
+from pathlib import Path
+import shutil
+import struct
+import tempfile
+from typing import Callable, Optional, Union
+
+ALIGNMENT = 64
+
+
+def sidecar_path(filename: Union[str, Path], suffix: str, cache_dir: Union[str, Path, None] = None) -> Path:
+
+    """
+    Return the sidecar filename for the given source file, next to the source by default
+    or in cache_dir, named by a hash of the source's absolute path.
+    """
+
+    source = Path(filename).resolve()
+    if cache_dir is None:
+        return source.with_name(source.name + suffix)
+
+    digest = hashlib.sha1(str(source).encode("utf-8")).hexdigest()
+
+    return Path(cache_dir) / f"{digest}{suffix}"
+
+
+def source_key(filename: Union[str, Path]) -> dict:
+
+    """Return the path, size, and modification time of filename, which identify its contents."""
+
+    source = Path(filename).resolve()
+    stat = source.stat()
+
+    return {"source": str(source), "size": stat.st_size, "mtime_ns": stat.st_mtime_ns}
+
+
+def read_metadata(path: Union[str, Path], magic: bytes) -> Optional[tuple]:
+
+    """
+    Return (metadata dictionary, offset of the data) from the sidecar at path or None if
+    it doesn't exist or isn't a sidecar of the format given by magic.
+    """
+
+    try:
+        with Path(path).open("rb") as file:
+            if file.read(len(magic)) != magic:
+                return None
+            length, offset = struct.unpack("<QQ", file.read(16))
+            metadata = json.loads(file.read(length))
+    except (OSError, ValueError, struct.error):
+        return None
+
+    return metadata, offset
+
+
+def write(path: Union[str, Path], magic: bytes, metadata: dict, nbytes: int, fill: Callable, mode_from: Union[str, Path]) -> Path:
+
+    """
+    Write a sidecar atomically.
+
+    Args:
+        path:      sidecar filename, its directory is created if necessary
+        magic:     magic string of the sidecar format
+        metadata:  JSON serializable metadata, usually including source_key() of the source
+        nbytes:    size of the data
+        fill:      called as fill(file, temporary, offset) to write the data, file is open for writing
+                   at offset in the temporary file which is already nbytes past offset long
+        mode_from: file whose permissions the sidecar gets, usually the source
+
+    Returns:
+        sidecar filename
+    """
+
+    path = Path(path)
+    path.parent.mkdir(parents=True, exist_ok=True)
+    encoded = json.dumps(metadata).encode("utf-8")
+    prefix = len(magic) + 16 + len(encoded)
+    offset = -(-prefix // ALIGNMENT) * ALIGNMENT    # align data for memory mapping
+
+    handle, temporary = tempfile.mkstemp(dir=path.parent, suffix=".tmp")
+    try:
+        with os.fdopen(handle, "wb") as file:
+            file.write(magic)
+            file.write(struct.pack("<QQ", len(encoded), offset))
+            file.write(encoded)
+            file.write(b"\0" * (offset - prefix))
+            file.truncate(offset + nbytes)
+            file.flush()
+            fill(file, temporary, offset)
+        shutil.copymode(mode_from, temporary)   # mkstemp() creates the file readable only by its owner
+        os.replace(temporary, path)
+    except BaseException:
+        os.unlink(temporary)
+        raise
+
+    return path
@@ -20,9 +20,8 @@ There is little to no assistance here so you need to specify a valid key and val
 
 import os
 import emod_api.spatialreports.spatial as sr
-import matplotlib.pyplot as plt
 import numpy as np
-import sqlite3
+from emod_api.results_catalog import open_catalog, parse_value
 
 
 def collect(exp_id, chan="Prevalence", tag=None):
@@ -35,20 +34,14 @@ def collect(exp_id, chan="Prevalence", tag=None):
 
         groupby_key = tag.split("=")[0]
         groupby_value = tag.split("=")[1]
-        db = os.path.join("latest_experiment", "results.db")
-        con = sqlite3.connect(db)
-        cur = con.cursor()
-
-        query = f"SELECT sim_id FROM results where CAST({groupby_key} AS DECIMAL)-CAST({groupby_value} AS DECIMAL)<0.0001"
-        all_results = cur.execute(query)
-        groupby_values["ref"] = list()
-        for result in all_results:
-            sim_id = result[0]
-            groupby_values["ref"].append(sim_id)
+        with open_catalog(os.path.join("latest_experiment", "results.db")) as catalog:
+            catalog.ensure_index(groupby_key)
+            groupby_values["ref"] = catalog.sim_ids(groupby_key, parse_value(groupby_value), tolerance=0.0001)
+    elif os.path.exists(os.path.join(exp_id, "results.db")):
+        with open_catalog(os.path.join(exp_id, "results.db")) as catalog:
+            groupby_values["ref"] = catalog.all_sim_ids()
     else:
         groupby_values["ref"] = os.listdir(exp_id)
-        if "results.db" in groupby_values["ref"]:
-            groupby_values["ref"].remove("results.db")
 
     for sim_id in groupby_values["ref"]:
         report_path = os.path.join(str(exp_id), sim_id, "SpatialReport_" + chan + ".bin")
@@ -68,6 +61,8 @@ def collect(exp_id, chan="Prevalence", tag=None):
 
 def plot(exp_id, chan="Prevalence", tag=None):
 
+    import matplotlib.pyplot as plt
+
     node_chan_means = collect(exp_id, chan, tag)
 
     for node in node_chan_means.keys():
@@ -1,10 +1,17 @@
 #!/usr/bin/env python3
 
-"""emod-api spatial report module. Exposes SpatialReport and SpatialNode objects."""
+"""emod-api spatial report module. Exposes SpatialReport, SpatialNode, and SpatialReportBundle objects."""
 
+import os
 from pathlib import Path
+import shutil
+import tempfile
+from typing import Union
+
 import numpy as np
 
+from emod_api import sidecar
+
 
 class SpatialNode(object):
 
@@ -50,19 +57,28 @@ class SpatialReport(object):
     "Filtered" reports will have start > 0 and/or reporting interval > 1.
     """
 
-    def __init__(self, filename: str = None, node_ids: list[int] = None, data: np.array = None, start: int = 0, interval: int = 1):
+    def __init__(self, filename: str = None, node_ids: list[int] = None, data: np.array = None, start: int = 0, interval: int = 1,
+                 mmap: bool = False, time_slice: slice = None, node_major: Union[bool, str, Path] = False):
 
         """
         Args:
             filename: file from which to read data
             node_ids: list of node ids, must be integer values
+                      (with filename, optional subset of the nodes in the file to read)
             data: NumPy array of data, shape must be (#values, #nodes)
             start: time step of first sample (used with filtered reports)
             interval: # of time steps between samples (used with filtered reports)
+            mmap: memory map the data section of filename rather than reading it, only the pages
+                  of data actually accessed are read (changes to data are not written to the file)
+            time_slice: with filename, optional slice of the samples in the file to read, e.g., slice(-365, None)
+                        for the last 365 samples, start and interval are adjusted to match
+            node_major: with filename, read data through a node-major (transposed) sidecar, built on first
+                        use, so each node's time series is contiguous - True keeps the sidecar next to
+                        filename, a directory keeps it there (see write_node_major())
         """
 
-        if isinstance(filename, str):
-            self._from_file(filename)
+        if isinstance(filename, (str, Path)):
+            self._from_file(str(filename), mmap, node_ids, time_slice, node_major)
         else:
             self._from_node_ids_and_data(node_ids, data, start, interval)
 
@@ -81,11 +97,18 @@ class SpatialReport(object):
     @property
     def nodes(self) -> dict[int, SpatialNode]:
         """Returns dictionary of SpatialNodes keyed on node ID."""
+        if len(self._nodes) < len(self._node_id_to_index_map):
+            for node_id in self._node_id_to_index_map:
+                self[node_id]
         return self._nodes
 
-    # index into report by node id
+    # index into report by node id, SpatialNodes (views of a column of data) are created on first access
     def __getitem__(self, item: int) -> SpatialNode:
-        return self._nodes[item]
+        node = self._nodes.get(item)
+        if node is None:
+            node = SpatialNode(item, self._data[:, self._node_id_to_index_map[item]])
+            self._nodes[item] = node
+        return node
 
     @property
     def node_count(self) -> int:
@@ -111,60 +134,73 @@ class SpatialReport(object):
 
         """Save current nodes and timeseries data to given file."""
 
-        with open(filename, "wb") as file:
-            np.array([self.node_count], dtype=np.uint32).tofile(file)
-            np.array([self.time_steps], dtype=np.uint32).tofile(file)
-            if self.start != 0 or self.interval != 1:
-                np.array([self.start], dtype=np.float32).tofile(file)
-                np.array([self.interval], dtype=np.float32).tofile(file)
-            np.array([self.node_ids], dtype=np.uint32).tofile(file)
-            self.data.tofile(file)
+        # write to a temporary file and rename, data may be memory mapped from filename itself
+        path = Path(filename).absolute()
+        handle, temporary = tempfile.mkstemp(dir=path.parent, suffix=".tmp")
+        try:
+            with os.fdopen(handle, "wb") as file:
+                np.array([self.node_count], dtype=np.uint32).tofile(file)
+                np.array([self.time_steps], dtype=np.uint32).tofile(file)
+                if self.start != 0 or self.interval != 1:
+                    np.array([self.start], dtype=np.float32).tofile(file)
+                    np.array([self.interval], dtype=np.float32).tofile(file)
+                # node ids in column order of data (node_ids is sorted)
+                np.array(list(self._node_id_to_index_map), dtype=np.uint32).tofile(file)
+                self.data.tofile(file)
+            if path.exists():
+                shutil.copymode(path, temporary)
+            else:
+                umask = os.umask(0)
+                os.umask(umask)
+                os.chmod(temporary, 0o666 & ~umask)     # mkstemp() creates the file readable only by its owner
+            os.replace(temporary, path)
+        except BaseException:
+            os.unlink(temporary)
+            raise
 
         return
 
-    def _from_file(self, filename: str):
+    def _from_file(self, filename: str, mmap: bool = False, node_ids: list[int] = None, time_slice: slice = None,
+                   node_major: Union[bool, str, Path] = False):
         """
         Read binary spatial report file.
         #nodes,
         #time steps,
         node ids (#nodes values),
         data (#nodes x #time steps values)
+        Optionally, only the samples in time_slice of the nodes in node_ids.
         """
-        # File format:
-        # number of nodes      - uint32 * 1
-        # number of time steps - uint32 * 1
-        # OPTIONAL:
-        #     starting time step - float32 * 1 (integral value in reality)
-        #     time step interval - float32 * 1 (integral value in reality)
-        # node ids             - uint32 * number of nodes
-        # data                 - (float32 * number of nodes) * number of time_steps
-
-        file_size = Path(filename).stat().st_size
-
-        with open(filename, "rb") as file:
-            num_nodes = np.fromfile(file, dtype=np.uint32, count=1)[0]
-            num_time_steps = np.fromfile(file, dtype=np.uint32, count=1)[0]
-
-            simple_size = (2 + num_nodes + (num_nodes * num_time_steps)) * 4    # num_nodes, num_time_steps, node_ids, and data
-            filtered_size = simple_size + 8     # include starting time step and time step interval
-
-            if file_size == simple_size:
-                self._start = 0
-                self._interval = 1
-            elif file_size == filtered_size:
-                self._start = int(np.fromfile(file, dtype=np.float32, count=1)[0])
-                self._interval = int(np.fromfile(file, dtype=np.float32, count=1)[0])
-                assert self.start >= 0
-                assert self.interval >= 1
-            else:
-                raise RuntimeError(f"Unexpected file size {file_size}, expected {simple_size} (standard spatial report) or {filtered_size} (filtered spatial report).")
 
-            node_ids = np.fromfile(file, dtype=np.uint32, count=num_nodes)
-            data = np.fromfile(file, dtype=np.float32, count=num_nodes * num_time_steps)
+        num_nodes, num_time_steps, start, interval, file_node_ids, offset = _read_header(filename)
 
-        # let us index data[step, node]
-        data = data.reshape((num_time_steps, num_nodes))
-        self._from_node_ids_and_data(node_ids, data, self._start, self._interval)
+        # let us index data[step, node], only the pages of the file holding the selected samples and nodes are read
+        if node_major:
+            cache_dir = None if node_major is True else node_major
+            data = _read_node_major(filename, (num_time_steps, num_nodes), cache_dir)
+            if data is None:
+                write_node_major(filename, cache_dir)
+                data = _read_node_major(filename, (num_time_steps, num_nodes), cache_dir)
+        else:
+            data = np.memmap(filename, dtype=np.float32, mode="c", offset=offset, shape=(num_time_steps, num_nodes))
+
+        if time_slice is not None:
+            first, _, step = time_slice.indices(num_time_steps)
+            assert step >= 1, "time_slice step must be >= 1"
+            data = data[time_slice]
+            start += first * interval
+            interval *= step
+
+        if node_ids is not None:
+            columns = _node_columns({int(node_id): n for n, node_id in enumerate(file_node_ids)}, node_ids, filename)
+            file_node_ids = file_node_ids[columns]
+            if node_major:
+                data = np.asarray(data.T[columns]).T    # a copy in memory, still node-major
+            else:
+                data = np.asarray(data[:, columns])     # a copy in memory
+        elif not mmap:
+            data = np.array(data)
+
+        self._from_node_ids_and_data(file_node_ids, data, start, interval)
 
         return
 
@@ -183,12 +219,9 @@ class SpatialReport(object):
         self._data = data
 
         self._node_id_to_index_map = {
-            node_ids[n]: n for n in range(data.shape[NUM_NODES_INDEX])
-        }
-        self._nodes = {
-            node_id: SpatialNode(node_id, data[:, self._node_id_to_index_map[node_id]])
-            for node_id in node_ids
+            int(node_id): n for n, node_id in enumerate(concrete)
         }
+        self._nodes = {}
 
         assert int(start) >= 0, "start sample time must be >= 0"
         self._start = int(start)
@@ -198,6 +231,321 @@ class SpatialReport(object):
         return
 
 
+def _read_header(filename: str) -> tuple:
+
+    """
+    Read the header of a binary spatial report file.
+
+    Returns:
+        tuple of (#nodes, #time steps, start, interval, node ids, byte offset of the data)
+    """
+
+    # File format:
+    # number of nodes      - uint32 * 1
+    # number of time steps - uint32 * 1
+    # OPTIONAL:
+    #     starting time step - float32 * 1 (integral value in reality)
+    #     time step interval - float32 * 1 (integral value in reality)
+    # node ids             - uint32 * number of nodes
+    # data                 - (float32 * number of nodes) * number of time_steps
+
+    file_size = Path(filename).stat().st_size
+
+    with open(filename, "rb") as file:
+        num_nodes = int(np.fromfile(file, dtype=np.uint32, count=1)[0])
+        num_time_steps = int(np.fromfile(file, dtype=np.uint32, count=1)[0])
+
+        simple_size = (2 + num_nodes + (num_nodes * num_time_steps)) * 4    # num_nodes, num_time_steps, node_ids, and data
+        filtered_size = simple_size + 8     # include starting time step and time step interval
+
+        if file_size == simple_size:
+            start = 0
+            interval = 1
+        elif file_size == filtered_size:
+            start = int(np.fromfile(file, dtype=np.float32, count=1)[0])
+            interval = int(np.fromfile(file, dtype=np.float32, count=1)[0])
+            assert start >= 0
+            assert interval >= 1
+        else:
+            raise RuntimeError(f"Unexpected file size {file_size}, expected {simple_size} (standard spatial report) or {filtered_size} (filtered spatial report).")
+
+        node_ids = np.fromfile(file, dtype=np.uint32, count=num_nodes)
+        offset = file.tell()
+
+    return num_nodes, num_time_steps, start, interval, node_ids, offset
+
+
+class SpatialReportBundle(object):
+
+    """
+    The spatial reports, one SpatialReport_<Channel>.bin per channel, of a simulation, memory mapped.
+
+    All reports must have the same node ids (in the same order) and time steps, so channels can be
+    combined directly, e.g., bundle["New_Infections"].data / bundle["Population"].data, or taken
+    together as a lazy (#channels, #time steps, #nodes) array with bundle.array().
+    """
+
+    PREFIX = "SpatialReport_"
+    SUFFIX = ".bin"
+
+    def __init__(self, directory: Union[str, Path], channels: list[str] = None):
+
+        """
+        Args:
+            directory: directory holding the SpatialReport_<Channel>.bin files
+            channels: optional list of channels to open, default is all channels found
+        """
+
+        directory = Path(directory)
+        found = {path.name[len(self.PREFIX):-len(self.SUFFIX)]: path for path in directory.glob(f"{self.PREFIX}*{self.SUFFIX}")}
+        channels = sorted(found) if channels is None else list(channels)
+        missing = [channel for channel in channels if channel not in found]
+        if missing:
+            raise FileNotFoundError(f"No spatial report for channel(s) {missing} in {directory}, found {sorted(found)}.")
+        if not channels:
+            raise FileNotFoundError(f"No {self.PREFIX}<Channel>{self.SUFFIX} files in {directory}.")
+
+        self._reports = {channel: SpatialReport(found[channel], mmap=True) for channel in channels}
+
+        first = self._reports[channels[0]]
+        node_ids = list(first._node_id_to_index_map)
+        for channel, report in self._reports.items():
+            if list(report._node_id_to_index_map) != node_ids:
+                raise RuntimeError(f"Node ids of {found[channel]} don't match those of {found[channels[0]]}.")
+            if (report.time_steps, report.start, report.interval) != (first.time_steps, first.start, first.interval):
+                raise RuntimeError(f"Time steps of {found[channel]} ({report.time_steps} from {report.start} every {report.interval}) "
+                                   f"don't match those of {found[channels[0]]} ({first.time_steps} from {first.start} every {first.interval}).")
+
+        return
+
+    @property
+    def channels(self) -> list[str]:
+        """Names of the channels in the bundle."""
+        return list(self._reports)
+
+    # index into bundle by channel name
+    def __getitem__(self, item: str) -> SpatialReport:
+        return self._reports[item]
+
+    def __contains__(self, item: str) -> bool:
+        return item in self._reports
+
+    @property
+    def _first(self) -> SpatialReport:
+        return next(iter(self._reports.values()))
+
+    @property
+    def node_ids(self) -> list[int]:
+        """Returns list of node IDs (integers) for nodes in the reports."""
+        return self._first.node_ids
+
+    @property
+    def node_count(self) -> int:
+        """Number of nodes in the reports."""
+        return self._first.node_count
+
+    @property
+    def time_steps(self) -> int:
+        """Number of samples in the reports."""
+        return self._first.time_steps
+
+    @property
+    def start(self) -> int:
+        """Time step of first sample."""
+        return self._first.start
+
+    @property
+    def interval(self) -> int:
+        """Interval, in time steps, between samples."""
+        return self._first.interval
+
+    def array(self, channels: list[str] = None, node_ids: list[int] = None, time_slice: slice = None) -> "SpatialBundleArray":
+
+        """
+        Return a lazy (#channels, #time steps, #nodes) view of report data. Nothing is read until
+        the view is indexed, and then only the pages of each report holding the selected samples
+        and nodes, e.g., view[0] is the first channel's data, a view of its memory map.
+
+        Args:
+            channels: optional list of channels, default is all channels in the bundle
+            node_ids: optional subset of nodes, the node axis is in report order (see array_node_ids())
+            time_slice: optional slice of the samples
+
+        Returns:
+            SpatialBundleArray, np.asarray() of it reads everything into memory (see its nbytes)
+        """
+
+        channels = self.channels if channels is None else channels
+        columns = None if node_ids is None else _node_columns(self._first._node_id_to_index_map, node_ids, "bundle")
+        time_slice = slice(None) if time_slice is None else time_slice
+
+        return SpatialBundleArray([self._reports[channel].data[time_slice] for channel in channels], columns)
+
+    def array_node_ids(self, node_ids: list[int] = None) -> list[int]:
+
+        """Node ids in the order of the node axis of array(node_ids=node_ids)."""
+
+        columns = _node_columns(self._first._node_id_to_index_map, self.node_ids if node_ids is None else node_ids, "bundle")
+        in_order = list(self._first._node_id_to_index_map)
+
+        return [in_order[column] for column in columns]
+
+
+class SpatialBundleArray(object):
+
+    """
+    A (#channels, #time steps, #nodes) array over the memory mapped reports of a SpatialReportBundle.
+
+    Indexing reads only what is selected: view[c] and view[c, t, n] index channel c's memory map
+    directly (view[c] is a view of it unless a non-contiguous subset of nodes was selected). Selecting
+    several channels, np.asarray(view), or view.copy() stacks them in memory, nbytes bytes for
+    the whole array, which can be several GB for national-scale simulations.
+    """
+
+    def __init__(self, views: list[np.ndarray], columns: np.ndarray = None):
+
+        """
+        Args:
+            views: (#time steps, #nodes) data of each channel
+            columns: optional (sorted) node columns selected from each channel's data
+        """
+
+        if columns is not None and len(columns) and columns[-1] - columns[0] + 1 == len(columns):
+            columns = slice(int(columns[0]), int(columns[-1]) + 1)   # contiguous nodes, keep views
+        self._views = views
+        self._columns = columns
+
+        return
+
+    @property
+    def shape(self) -> tuple:
+        time_steps, node_count = self._views[0].shape if self._views else (0, 0)
+        if isinstance(self._columns, slice):
+            node_count = len(range(*self._columns.indices(node_count)))
+        elif self._columns is not None:
+            node_count = len(self._columns)
+        return len(self._views), time_steps, node_count
+
+    @property
+    def ndim(self) -> int:
+        return 3
+
+    @property
+    def dtype(self) -> np.dtype:
+        return np.dtype(np.float32)
+
+    @property
+    def nbytes(self) -> int:
+        """Size, in bytes, of the whole array in memory."""
+        return int(np.prod(self.shape)) * self.dtype.itemsize
+
+    def __len__(self) -> int:
+        return len(self._views)
+
+    def _channel(self, index: int, time_key=slice(None), node_key=slice(None)) -> np.ndarray:
+
+        view = self._views[index][time_key]
+        if isinstance(self._columns, slice):
+            view = view[..., self._columns]
+        elif self._columns is not None:
+            view = np.take(view, self._columns, axis=-1)
+
+        return view[..., node_key]
+
+    def __getitem__(self, key) -> np.ndarray:
+
+        key = key if isinstance(key, tuple) else (key,)
+        assert len(key) <= 3, f"too many indices ({len(key)}) for a (#channels, #time steps, #nodes) array"
+        channel, rest = key[0], key[1:]
+        if isinstance(channel, (int, np.integer)):
+            return self._channel(channel, *rest)
+        indices = range(len(self._views))[channel] if isinstance(channel, slice) else channel
+
+        return np.stack([self._channel(index, *rest) for index in indices])
+
+    def __iter__(self):
+        for index in range(len(self._views)):
+            yield self._channel(index)
+
+    def __array__(self, dtype=None, copy=None) -> np.ndarray:
+        stacked = np.empty(self.shape, dtype=np.float32)
+        for index in range(len(self._views)):
+            stacked[index] = self._channel(index)
+        return stacked if dtype is None else stacked.astype(dtype, copy=False)
+
+    def copy(self) -> np.ndarray:
+        """Read the whole array into memory, nbytes bytes."""
+        return np.asarray(self)
+
+
+def _node_columns(index_map: dict, node_ids: list[int], source: str) -> np.ndarray:
+
+    """Return the sorted (file order, for sequential reads) column indices of node_ids in data."""
+
+    assert _is_iterable(node_ids), "node_ids must be iterable"
+    missing = [node_id for node_id in node_ids if node_id not in index_map]
+    assert not missing, f"node_ids {missing[:8]} not found in {source}"
+
+    return np.unique([index_map[node_id] for node_id in node_ids]).astype(np.int64)
+
+
+_NODE_MAJOR_MAGIC = b"EMODSRN1"
+_NODE_MAJOR_SUFFIX = ".nodemajor"
+_BLOCK_BYTES = 64 << 20
+
+
+def _read_node_major(filename: str, shape: tuple, cache_dir: Union[str, Path, None] = None) -> Union[np.ndarray, None]:
+
+    """
+    Return a (#time steps, #nodes) transposed view of the memory mapped node-major sidecar for
+    the given spatial report or None if there is no valid sidecar.
+    """
+
+    path = sidecar.sidecar_path(filename, _NODE_MAJOR_SUFFIX, cache_dir)
+    found = sidecar.read_metadata(path, _NODE_MAJOR_MAGIC)
+    if found is None:
+        return None
+
+    metadata, offset = found
+    if metadata["key"] != sidecar.source_key(filename) or tuple(metadata["shape"]) != shape[::-1]:
+        return None
+
+    return np.memmap(path, dtype=np.float32, mode="c", offset=offset, shape=shape[::-1]).T
+
+
+def write_node_major(filename: Union[str, Path], cache_dir: Union[str, Path, None] = None, block_bytes: int = _BLOCK_BYTES) -> Path:
+
+    """
+    Write a node-major sidecar for a spatial report: the report data transposed to (#nodes, #time steps)
+    so each node's time series is contiguous. The data is transposed a block of time steps
+    (about block_bytes) at a time so the full report never has to be in memory.
+
+    Args:
+        filename:    spatial report
+        cache_dir:   optional directory for the sidecar, default is next to the report
+        block_bytes: approximate size of each block of time steps transposed
+
+    Returns:
+        sidecar filename
+    """
+
+    num_nodes, num_time_steps, _, _, _, offset = _read_header(str(filename))
+    source = np.memmap(filename, dtype=np.float32, mode="r", offset=offset, shape=(num_time_steps, num_nodes))
+    metadata = {"key": sidecar.source_key(filename), "shape": [num_nodes, num_time_steps]}
+
+    def fill(file, temporary, data_offset):
+        target = np.memmap(temporary, dtype=np.float32, mode="r+", offset=data_offset, shape=(num_nodes, num_time_steps))
+        block = max(1, block_bytes // max(1, source.itemsize * num_nodes))
+        for first in range(0, num_time_steps, block):
+            target[:, first:first + block] = source[first:first + block].T
+        target.flush()
+        del target
+
+    path = sidecar.sidecar_path(filename, _NODE_MAJOR_SUFFIX, cache_dir)
+
+    return sidecar.write(path, _NODE_MAJOR_MAGIC, metadata, source.nbytes, fill, filename)
+
+
 def _is_iterable(obj) -> bool:
     try:
         _ = iter(obj)
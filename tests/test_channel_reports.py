@@ -1,6 +1,7 @@
 import unittest
 import os
 import csv
+import gzip
 from pathlib import Path
 import tempfile
 from emod_api.channelreports.channels import ChannelReport, Header, Channel
@@ -8,6 +9,15 @@ from emod_api.channelreports.plot_prop_report import prop_report_json_to_csv
 from datetime import datetime
 from random import random, randint
 import json
+import shutil
+import sqlite3
+import warnings
+import numpy as np
+from emod_api.channelreports import cache
+from emod_api.channelreports.aggregate import aggregate, ChannelStatistics, aggregate_quantiles, ChannelQuantiles
+from emod_api.channelreports.smoothing import stack_series, smooth
+from emod_api.channelreports.plot_icj_means import collect
+from emod_api.channelreports.downsample import downsample, minmax_indices, lttb_indices
 from tests import manifest
 
 
@@ -123,7 +133,7 @@ class TestChannel(unittest.TestCase):
 
         self.assertEqual(channel.title, TestChannel._TITLE)
         self.assertEqual(channel.units, TestChannel._UNITS)
-        self.assertListEqual(channel.data, TestChannel._DATA)
+        self.assertListEqual(list(channel.data), TestChannel._DATA)
 
         return
 
@@ -139,7 +149,7 @@ class TestChannel(unittest.TestCase):
 
         self.assertEqual(channel.title, TestChannel._TITLE)
         self.assertEqual(channel.units, TestChannel._UNITS)
-        self.assertListEqual(channel.data, TestChannel._DATA)
+        self.assertListEqual(list(channel.data), TestChannel._DATA)
 
         return
 
@@ -287,6 +297,217 @@ class TestChannels(unittest.TestCase):
 
         return
 
+    def test_asMatrix(self):
+
+        chart = ChannelReport(os.path.join(manifest.reports_folder, "InsetChart.json"))
+        matrix = chart.as_matrix()
+
+        self.assertEqual(matrix.shape, (16, 365))
+        self.assertEqual(matrix.dtype, np.float64)
+        for row, name in enumerate(chart.channel_names):
+            self.assertTrue(np.shares_memory(matrix[row], chart[name].data))
+            self.assertTrue(np.array_equal(matrix[row], chart[name].data))
+
+        # writes through the matrix are visible in the channels and vice versa
+        matrix[chart.channel_names.index("Births"), 0] = -1
+        self.assertEqual(chart["Births"][0], -1)
+        chart["Infected"][1] = 42
+        self.assertEqual(matrix[chart.channel_names.index("Infected"), 1], 42)
+
+        subset = chart.as_matrix(["Infected", "Births"])
+        self.assertEqual(subset.shape, (2, 365))
+        self.assertTrue(np.array_equal(subset[0], chart["Infected"].data))
+        self.assertTrue(np.array_equal(subset[1], chart["Births"].data))
+
+        adjacent = chart.as_matrix(chart.channel_names[2:5])
+        self.assertTrue(np.shares_memory(adjacent, matrix))
+
+        return
+
+    def test_asMatrixFloat32(self):
+
+        chart = ChannelReport(os.path.join(manifest.reports_folder, "InsetChart.json"), dtype=np.float32)
+        reference = ChannelReport(os.path.join(manifest.reports_folder, "InsetChart.json"))
+
+        self.assertEqual(chart.as_matrix().dtype, np.float32)
+        self.assertEqual(chart["Births"].data.dtype, np.float32)
+        self.assertEqual(chart.as_matrix().nbytes * 2, reference.as_matrix().nbytes)
+        self.assertTrue(np.allclose(chart.as_matrix(), reference.as_matrix(), rtol=1e-6))
+
+        return
+
+    def test_nbytes(self):
+
+        chart = ChannelReport(os.path.join(manifest.reports_folder, "InsetChart.json"))
+        single = ChannelReport(os.path.join(manifest.reports_folder, "InsetChart.json"), dtype=np.float32)
+
+        self.assertEqual(chart.dtype, np.float64)
+        self.assertEqual(single.dtype, np.float32)
+        self.assertEqual(chart.nbytes, 16 * 365 * 8)
+        self.assertEqual(single.nbytes, 16 * 365 * 4)
+        self.assertEqual(chart["Infected"].nbytes, 365 * 8)
+
+        # a replaced channel no longer shares the matrix, both are held until consolidated
+        chart.add_channel("Infected", "", np.zeros(365))
+        self.assertEqual(chart.nbytes, 17 * 365 * 8)
+        chart.as_matrix()
+        self.assertEqual(chart.nbytes, 16 * 365 * 8)
+
+        self.assertEqual(ChannelReport().nbytes, 0)
+
+        return
+
+    def test_asMatrixAfterAddingChannel(self):
+
+        chart = ChannelReport()
+        chart.channels["foo"] = Channel("foo", "units", [1, 1, 2, 3, 5, 8])
+        chart.channels["bar"] = Channel("bar", "units", [1, 2, 3, 4, 5, 6])
+
+        matrix = chart.as_matrix()
+        self.assertListEqual(matrix.tolist(), [[1, 2, 3, 4, 5, 6], [1, 1, 2, 3, 5, 8]])
+        self.assertIs(chart.as_matrix(), matrix)     # no re-consolidation without changes
+
+        chart.channels["baz"] = Channel("baz", "units", [0, 0, 0, 0, 0, 0])
+        matrix = chart.as_matrix()
+        self.assertEqual(matrix.shape, (3, 6))
+        self.assertTrue(np.shares_memory(matrix[2], chart["foo"].data))
+
+        chart.channels["qux"] = Channel("qux", "units", [0, 0])
+        self.assertRaises(AssertionError, chart.as_matrix)
+
+        return
+
+    def test_fromFileSelectedChannels(self):
+
+        filename = os.path.join(manifest.reports_folder, "InsetChart.json")
+        full = ChannelReport(filename)
+        chart = ChannelReport(filename, channels=["Infected", "New*"])
+
+        self.assertListEqual(chart.channel_names, ["Infected", "New Infections", "Newly Symptomatic"])
+        self.assertDictEqual(chart.header.as_dictionary(), full.header.as_dictionary())
+        for name in chart.channel_names:
+            self.assertEqual(chart[name].units, full[name].units)
+            self.assertTrue(np.array_equal(chart[name].data, full[name].data))
+        self.assertTrue(np.array_equal(chart.as_matrix(), full.as_matrix(chart.channel_names)))
+
+        self.assertEqual(ChannelReport(filename, channels=[]).num_channels, 0)
+        self.assertEqual(ChannelReport(filename, channels=["Zombies"]).num_channels, 0)
+
+        return
+
+    def test_fromFileSelectedChannelsBadFiles(self):
+
+        for name in ["missingHeader.json", "missingChannels.json", "missingUnits.json", "missingData.json"]:
+            with self.subTest(name):
+                self.assertRaises(
+                    AssertionError,
+                    ChannelReport,
+                    os.path.join(manifest.reports_folder, name),
+                    channels=["Infected"]
+                )
+
+        return
+
+    def test_readHeader(self):
+
+        filename = os.path.join(manifest.reports_folder, "InsetChart.json")
+        chart = ChannelReport(filename)
+        header, units = ChannelReport.read_header(filename)
+
+        self.assertDictEqual(header.as_dictionary(), chart.header.as_dictionary())
+        self.assertListEqual(list(units), chart.channel_names)
+        for name, unit in units.items():
+            self.assertEqual(unit, chart[name].units)
+
+        self.assertRaises(AssertionError, ChannelReport.read_header, os.path.join(manifest.reports_folder, "missingHeader.json"))
+        self.assertRaises(AssertionError, ChannelReport.read_header, os.path.join(manifest.reports_folder, "missingUnits.json"))
+
+        header, units = ChannelReport.read_header(Path(filename))
+        self.assertDictEqual(header.as_dictionary(), chart.header.as_dictionary())
+
+        return
+
+    def test_writeFileMatchesJsonDump(self):
+
+        filename = os.path.join(manifest.reports_folder, "InsetChart.json")
+        chart = ChannelReport(filename)
+        with open(filename) as file:
+            sources = {title: channel["Data"] for title, channel in json.load(file)["Channels"].items()}
+        sources["Special \"Values\"\u00e9"] = [float("nan"), float("inf"), -float("inf"), -0.0, 1e-7, 1e300] + [0.5] * 359
+        sources["Counts"] = [-0.0, 1e15, 2.0 ** 53, 1e16] + [3] * 361
+        chart.channels["Special \"Values\"\u00e9"] = Channel("Special \"Values\"\u00e9", "\u00fcnits", sources["Special \"Values\"\u00e9"])
+        chart.channels["Counts"] = Channel("Counts", "people", sources["Counts"])
+        chart.header._tags["Extra"] = {"list": [1, 2, {"nested": None}], "text": "two\nlines"}
+
+        def expected(indent, separators):
+            # as json.dump() of the source data, integers and floats as they were read
+            channels = {channel.title: {"Units": channel.units, "Data": sources[channel.title]} for channel in chart.channels.values()}
+            return json.dumps({"Header": chart.header.as_dictionary(), "Channels": channels}, indent=indent, separators=separators)
+
+        with tempfile.TemporaryDirectory() as temp:
+            filename = Path(temp) / "InsetChart.json"
+            for indent in [None, 0, 2, "\t"]:
+                for separators in [(",", ":"), (", ", ": "), None]:
+                    with self.subTest(indent=indent, separators=separators):
+                        chart.write_file(str(filename), indent=indent, separators=separators)
+                        self.assertEqual(filename.read_text(encoding="utf-8"), expected(indent, separators))
+
+        return
+
+    def test_roundTripMatchesBaseline(self):
+
+        # the writers used to json.dump() / csv.writer() the lists from json.load(), so integers in the file stay integers
+        source = os.path.join(manifest.reports_folder, "InsetChart.json")
+        with open(source) as file:
+            jason = json.load(file)
+
+        with tempfile.TemporaryDirectory() as temp:
+            path = Path(temp)
+            baseline_json = path / "baseline.json"
+            with baseline_json.open("w", encoding="utf-8") as file:
+                json.dump({"Header": ChannelReport(source).header.as_dictionary(), "Channels": jason["Channels"]}, file, indent=0, separators=(",", ":"))
+            baseline_csv = path / "baseline.csv"
+            with baseline_csv.open("w") as file:
+                csv.writer(file, dialect="unix", quoting=csv.QUOTE_MINIMAL).writerows(
+                    [title] + jason["Channels"][title]["Data"] for title in sorted(jason["Channels"]))
+
+            shutil.copy(source, path / "InsetChart.json")
+            copy = str(path / "InsetChart.json")
+            ChannelReport(copy, cache=True)     # write the sidecar
+            for name, kwargs in [("file", {}), ("selected", {"channels": ["*"]}), ("cache", {"cache": True})]:
+                with self.subTest(read=name):
+                    chart = ChannelReport(copy, **kwargs)
+                    chart.write_file(str(path / "InsetChart-out.json"))
+                    self.assertEqual((path / "InsetChart-out.json").read_bytes(), baseline_json.read_bytes())
+                    chart.to_csv(path / "InsetChart-out.csv")
+                    self.assertEqual((path / "InsetChart-out.csv").read_bytes(), baseline_csv.read_bytes())
+
+        return
+
+    def test_toCsv(self):
+
+        chart = ChannelReport(os.path.join(manifest.reports_folder, "InsetChart.json"))
+        names = ["Infected", "Births"]
+
+        with tempfile.TemporaryDirectory() as temp:
+            rows_file = Path(temp) / "rows.csv"
+            chart.to_csv(rows_file, channel_names=names)
+            with rows_file.open() as file:
+                rows = list(csv.reader(file))
+            self.assertListEqual([row[0] for row in rows], names)
+            for row, name in zip(rows, names):
+                self.assertTrue(np.array_equal(np.array(row[1:], dtype=np.float64), chart[name].data))
+
+            columns_file = Path(temp) / "columns.csv.gz"
+            chart.to_csv(columns_file, transpose=True)
+            with gzip.open(columns_file, "rt") as file:
+                rows = list(csv.reader(file))
+            self.assertListEqual(rows[0], chart.channel_names)
+            self.assertEqual(len(rows), chart.num_time_steps + 1)
+            self.assertTrue(np.array_equal(np.array(rows[1:], dtype=np.float64), chart.as_matrix().T))
+
+        return
+
     def test_timeStampFromString(self):
 
         now = datetime.now()
@@ -421,6 +642,516 @@ class TestChannels(unittest.TestCase):
         return
 
 
+class TestReportOperations(unittest.TestCase):
+
+    def setUp(self) -> None:
+        self.chart = ChannelReport(os.path.join(manifest.reports_folder, "InsetChart.json"))
+        return
+
+    def test_channel_arithmetic(self):
+
+        chart = self.chart
+        prevalence = chart["Infected"] / chart["Statistical Population"]
+        self.assertIsInstance(prevalence, np.ndarray)
+        self.assertTrue(np.array_equal(prevalence, chart["Infected"].data / chart["Statistical Population"].data))
+        self.assertTrue(np.array_equal(1 - chart["Infected"], 1 - chart["Infected"].data))
+        self.assertTrue(np.array_equal(np.asarray(chart["Births"]), chart["Births"].data))
+        self.assertEqual(len(chart["Births"].data), 365)
+        self.assertTrue(Channel("Empty", "", []))
+
+        channel = chart.add_channel("Prevalence", "fraction", prevalence)
+        self.assertIs(chart["Prevalence"], channel)
+        self.assertEqual(chart.num_channels, 17)
+        self.assertEqual(chart.as_matrix().shape, (17, 365))
+
+        return
+
+    def test_report_arithmetic(self):
+
+        chart = self.chart
+        doubled = chart * 2
+        self.assertIsInstance(doubled, ChannelReport)
+        self.assertListEqual(doubled.channel_names, chart.channel_names)
+        self.assertEqual(doubled["Births"].units, chart["Births"].units)
+        self.assertTrue(np.array_equal(doubled.as_matrix(), chart.as_matrix() * 2))
+        self.assertTrue(np.array_equal((doubled - chart).as_matrix(), chart.as_matrix()))
+        self.assertTrue(np.array_equal((1 + chart).as_matrix(), chart.as_matrix() + 1))
+        self.assertEqual(doubled.num_time_steps, chart.num_time_steps)
+        self.assertEqual(doubled.dtk_version, chart.dtk_version)
+
+        other = ChannelReport(os.path.join(manifest.reports_folder, "InsetChart.json"), channels=["Births"])
+        self.assertRaises(AssertionError, chart.__sub__, other)
+
+        combined = ChannelReport.combine([chart, doubled, chart * 3], how="mean")
+        self.assertTrue(np.allclose(combined.as_matrix(), chart.as_matrix() * 2))
+        self.assertTrue(np.allclose(ChannelReport.combine([chart, doubled], how="sum").as_matrix(), chart.as_matrix() * 3))
+
+        with tempfile.TemporaryDirectory() as temp:
+            filename = os.path.join(temp, "Derived.json")
+            doubled.write_file(filename)
+            self.assertTrue(np.array_equal(ChannelReport(filename).as_matrix(), doubled.as_matrix()))
+
+        return
+
+    def test_resample(self):
+
+        chart = self.chart
+        births = chart["Births"].data
+
+        weekly = chart.resample(7, how="sum")
+        self.assertEqual(weekly.step_size, 7)
+        self.assertEqual(weekly.start_time, 0)
+        self.assertEqual(weekly.num_time_steps, 53)     # 52 full weeks and one day
+        self.assertAlmostEqual(weekly["Births"][0], births[:7].sum())
+        self.assertAlmostEqual(weekly["Births"][52], births[364])
+
+        weekly = chart.resample(7, how="mean", partial=False)
+        self.assertEqual(weekly.num_time_steps, 52)
+        self.assertAlmostEqual(weekly["Births"][51], births[357:364].mean())
+
+        # a partial first bin cannot start before time 0, whether origin is before or after Start_Time
+        self.assertRaises(AssertionError, chart.resample, 30, "sum", -10)
+        self.assertRaises(AssertionError, chart.resample, 30, "sum", 50)
+        monthly = chart.resample(30, how="sum", origin=50, partial=False)
+        self.assertEqual(monthly.start_time, 20)
+        self.assertAlmostEqual(monthly["Births"][0], births[20:50].sum())
+        self.assertAlmostEqual(monthly["Births"][1], births[50:80].sum())
+        self.assertEqual(chart.resample(30, how="sum", origin=60).start_time, 0)
+
+        chart.step_size = 5
+        self.assertRaises(AssertionError, chart.resample, 7)
+        self.assertEqual(chart.resample(10).num_time_steps, 183)
+
+        return
+
+    def test_rolling(self):
+
+        chart = self.chart
+        births = chart["Births"].data
+
+        rolled = chart.rolling(7)
+        self.assertEqual(rolled.num_time_steps, chart.num_time_steps)
+        self.assertAlmostEqual(rolled["Births"][0], births[0])
+        self.assertAlmostEqual(rolled["Births"][3], births[:4].mean())
+        self.assertAlmostEqual(rolled["Births"][100], births[94:101].mean())
+        self.assertAlmostEqual(chart.rolling(7, how="sum")["Births"][100], births[94:101].sum())
+
+        return
+
+
+class TestCache(unittest.TestCase):
+
+    def setUp(self) -> None:
+        self.temp = tempfile.TemporaryDirectory()
+        self.filename = os.path.join(self.temp.name, "InsetChart.json")
+        shutil.copy(os.path.join(manifest.reports_folder, "InsetChart.json"), self.filename)
+        return
+
+    def tearDown(self) -> None:
+        self.temp.cleanup()
+        return
+
+    def assertSameReport(self, chart, reference):
+        self.assertDictEqual(chart.header.as_dictionary(), reference.header.as_dictionary())
+        self.assertListEqual(chart.channel_names, reference.channel_names)
+        for name in chart.channel_names:
+            self.assertEqual(chart[name].units, reference[name].units)
+        self.assertTrue(np.array_equal(chart.as_matrix(), reference.as_matrix()))
+        return
+
+    def test_sidecar(self):
+
+        reference = ChannelReport(self.filename)
+        sidecar = cache.sidecar_path(self.filename)
+        self.assertFalse(sidecar.exists())
+
+        first = ChannelReport(self.filename, cache=True)
+        self.assertTrue(sidecar.exists())
+        self.assertSameReport(first, reference)
+
+        cached = ChannelReport(self.filename, cache=True)
+        self.assertIsInstance(cached.as_matrix(), np.memmap)
+        self.assertSameReport(cached, reference)
+
+        # changes are copy-on-write, the sidecar is unchanged
+        cached["Births"][0] = -1
+        self.assertEqual(ChannelReport(self.filename, cache=True)["Births"][0], reference["Births"][0])
+
+        selected = ChannelReport(self.filename, cache=True, channels=["Infected", "New*"])
+        self.assertListEqual(selected.channel_names, ["Infected", "New Infections", "Newly Symptomatic"])
+        self.assertTrue(np.array_equal(selected.as_matrix(), reference.as_matrix(selected.channel_names)))
+
+        return
+
+    def test_invalidation(self):
+
+        ChannelReport(self.filename, cache=True)
+        self.assertIsNotNone(cache.read(self.filename))
+        self.assertIsNone(cache.read(self.filename, dtype=np.float32))
+
+        # a new modification time invalidates the sidecar
+        stat = os.stat(self.filename)
+        os.utime(self.filename, ns=(stat.st_atime_ns, stat.st_mtime_ns + 1_000_000_000))
+        self.assertIsNone(cache.read(self.filename))
+
+        chart = ChannelReport(self.filename, cache=True)
+        self.assertIsNotNone(cache.read(self.filename))
+        self.assertSameReport(chart, ChannelReport(self.filename))
+
+        return
+
+    def test_cache_dir(self):
+
+        cache_dir = os.path.join(self.temp.name, "cache")
+        chart = ChannelReport(self.filename, dtype=np.float32, cache=cache_dir)
+
+        self.assertFalse(cache.sidecar_path(self.filename).exists())
+        self.assertTrue(cache.sidecar_path(self.filename, cache_dir).exists())
+        self.assertEqual(ChannelReport(self.filename, dtype=np.float32, cache=cache_dir).as_matrix().dtype, np.float32)
+        self.assertTrue(np.array_equal(chart.as_matrix(), ChannelReport(self.filename, dtype=np.float32).as_matrix()))
+
+        return
+
+    def test_prewarm(self):
+
+        for sim in ["sim1", "sim2"]:
+            os.mkdir(os.path.join(self.temp.name, sim))
+            shutil.copy(self.filename, os.path.join(self.temp.name, sim, "InsetChart.json"))
+
+        filenames = cache.prewarm(self.temp.name, workers=1)
+
+        self.assertEqual(len(filenames), 3)
+        for filename in filenames:
+            self.assertIsNotNone(cache.read(filename))
+
+        return
+
+
+class TestAggregate(unittest.TestCase):
+
+    LENGTHS = [30, 30, 25, 30, 12, 30, 28]
+
+    @classmethod
+    def setUpClass(cls):
+        cls.temp = tempfile.TemporaryDirectory()
+        cls.series = {"Infected": [], "Births": []}
+        rng = np.random.default_rng(20240501)
+        for index, length in enumerate(cls.LENGTHS):
+            chart = ChannelReport(Timesteps=length)
+            for name in cls.series:
+                data = rng.random(length) * 100
+                chart.channels[name] = Channel(name, "units", data)
+                cls.series[name].append(data)
+            chart.channels["Other"] = Channel("Other", "units", np.zeros(length))
+            os.mkdir(os.path.join(cls.temp.name, f"sim{index}"))
+            chart.write_file(os.path.join(cls.temp.name, f"sim{index}", "InsetChart.json"))
+        os.mkdir(os.path.join(cls.temp.name, "empty"))    # simulation without a report is skipped
+        return
+
+    @classmethod
+    def tearDownClass(cls):
+        cls.temp.cleanup()
+        return
+
+    def check(self, stats, series):
+        longest = max(len(data) for data in series)
+        padded = np.full((len(series), longest), np.nan)
+        for row, data in enumerate(series):
+            padded[row, :len(data)] = data
+        self.assertTrue(np.array_equal(stats.count, np.sum(~np.isnan(padded), axis=0)))
+        self.assertTrue(np.allclose(stats.mean, np.nanmean(padded, axis=0)))
+        with warnings.catch_warnings():
+            warnings.simplefilter("ignore", RuntimeWarning)     # timesteps reached by a single series
+            self.assertTrue(np.allclose(stats.variance, np.nanvar(padded, axis=0, ddof=1), equal_nan=True))
+        self.assertTrue(np.array_equal(stats.minimum, np.nanmin(padded, axis=0)))
+        self.assertTrue(np.array_equal(stats.maximum, np.nanmax(padded, axis=0)))
+        return
+
+    def test_aggregate(self):
+
+        for workers in [1, 2]:
+            with self.subTest(workers=workers):
+                results = aggregate(self.temp.name, ["Infected", "Births"], workers=workers, batch_size=2)
+                self.assertListEqual(list(results), ["ref"])
+                for name in ["Infected", "Births"]:
+                    self.check(results["ref"][name], self.series[name])
+                self.assertEqual(results["ref"]["Infected"].nbytes, max(self.LENGTHS) * 5 * 8)
+
+        return
+
+    def test_aggregate_groups(self):
+
+        groups = {"low": ["sim0", "sim2", "sim4"], "high": ["sim1", "sim3", "sim5", "sim6"]}
+        results = aggregate(self.temp.name, "Infected", groups=groups, workers=1)
+
+        self.check(results["low"]["Infected"], [self.series["Infected"][index] for index in [0, 2, 4]])
+        self.check(results["high"]["Infected"], [self.series["Infected"][index] for index in [1, 3, 5, 6]])
+
+        return
+
+    def test_aggregate_errors(self):
+
+        self.assertRaises(ValueError, aggregate, self.temp.name, ["Zombies"], workers=1)
+        self.assertRaises(ValueError, aggregate, self.temp.name, ["Infected"], groups={"none": ["empty"]}, workers=1)
+
+        return
+
+    def test_aggregate_quantiles(self):
+
+        padded, _ = stack_series(self.series["Infected"])
+        with warnings.catch_warnings():
+            warnings.simplefilter("ignore", RuntimeWarning)
+            expected = np.nanquantile(padded, [0.1, 0.5, 0.9], axis=0)
+
+        for workers in [1, 2]:
+            with self.subTest(workers=workers):
+                results = aggregate_quantiles(self.temp.name, ["Infected"], workers=workers, batch_size=2, exact=True)
+                quantiles = results["ref"]["Infected"]
+                self.assertTrue(quantiles.exact)
+                self.assertTrue(np.allclose(quantiles.quantiles([0.1, 0.5, 0.9]), expected))
+                self.assertTrue(np.array_equal(quantiles.count, np.sum(~np.isnan(padded), axis=0)))
+
+        # histograms after the first two series, values are in [0, 100)
+        quantiles = aggregate_quantiles(self.temp.name, ["Infected"], workers=1, batch_size=3, bins=1000, buffer=2)["ref"]["Infected"]
+        self.assertFalse(quantiles.exact)
+        self.assertTrue(np.all(np.abs(quantiles.median - expected[1]) <= 4 * 100 / 1000))
+
+        return
+
+    def test_merge(self):
+
+        series = self.series["Infected"]
+        whole = ChannelStatistics()
+        first = ChannelStatistics()
+        second = ChannelStatistics()
+        for index, data in enumerate(series):
+            whole.add(data)
+            (first if index % 2 else second).add(data)
+
+        merged = ChannelStatistics().merge(second).merge(first)
+        self.assertEqual(len(merged), len(whole))
+        self.assertTrue(np.array_equal(merged.count, whole.count))
+        self.assertTrue(np.allclose(merged.mean, whole.mean))
+        self.assertTrue(np.allclose(merged.variance, whole.variance))
+
+        return
+
+
+class TestChannelQuantiles(unittest.TestCase):
+
+    def setUp(self):
+        rng = np.random.default_rng(46)
+        self.series = [np.cumsum(rng.normal(size=rng.integers(300, 365))) * 10 + 1000 for _ in range(400)]
+        self.padded, _ = stack_series(self.series)
+        self.q = [0.0, 0.05, 0.5, 0.95, 1.0]
+        with warnings.catch_warnings():
+            warnings.simplefilter("ignore", RuntimeWarning)
+            self.expected = np.nanquantile(self.padded, self.q, axis=0)
+        self.span = np.nanmax(self.padded, axis=0) - np.nanmin(self.padded, axis=0)
+        return
+
+    def test_exact(self):
+        quantiles = ChannelQuantiles(exact=True)
+        for data in self.series:
+            quantiles.add(data)
+        self.assertTrue(quantiles.exact)
+        self.assertTrue(np.allclose(quantiles.quantiles(self.q), self.expected))
+        return
+
+    def test_histograms(self):
+        quantiles = ChannelQuantiles(bins=256, buffer=32)
+        for data in self.series:
+            quantiles.add(data)
+        self.assertFalse(quantiles.exact)
+        estimate = quantiles.quantiles(self.q)
+        # within a bin width, doubling leaves histograms spanning at most four times the range of the values
+        self.assertTrue(np.all(np.abs(estimate - self.expected) <= 4 * self.span / 256 + 1e-9))
+        self.assertTrue(np.array_equal(estimate[0], np.nanmin(self.padded, axis=0)))
+        self.assertTrue(np.array_equal(estimate[-1], np.nanmax(self.padded, axis=0)))
+        low, high = quantiles.band(0.9)
+        self.assertTrue(np.allclose(low, estimate[1]) and np.allclose(high, estimate[3]))
+        self.assertTrue(np.array_equal(quantiles.median, estimate[2]))
+        return
+
+    def test_bounded_memory(self):
+        quantiles = ChannelQuantiles(bins=64, buffer=16)
+        for data in self.series[:16]:
+            quantiles.add(data[:300])
+        size = quantiles.nbytes
+        for data in self.series[16:]:
+            quantiles.add(data[:300])
+        self.assertEqual(quantiles.nbytes, size)
+        self.assertLess(size, ChannelQuantiles(exact=True).nbytes + self.padded.nbytes)
+        return
+
+    def test_merge(self):
+        parts = [ChannelQuantiles(bins=256, buffer=buffer) for buffer in [1000, 32, 32, 50]]
+        for index, data in enumerate(self.series):
+            parts[index % len(parts)].add(data)
+        # buffered into histograms, histograms into buffered, histograms into histograms
+        merged = parts[0].merge(parts[1]).merge(parts[2]).merge(parts[3])
+        self.assertTrue(np.array_equal(merged.count, np.sum(~np.isnan(self.padded), axis=0)))
+        estimate = merged.quantiles(self.q)
+        self.assertTrue(np.all(np.abs(estimate - self.expected) <= 4 * self.span / 256 + 1e-9))
+        return
+
+    def test_empty(self):
+        quantiles = ChannelQuantiles()
+        self.assertEqual(quantiles.quantiles([0.5]).shape, (1, 0))
+        quantiles.add([1.0, np.nan, 3.0])
+        median = quantiles.median
+        self.assertEqual(median[0], 1.0)
+        self.assertTrue(np.isnan(median[1]))
+        return
+
+
+class TestSmoothing(unittest.TestCase):
+
+    def setUp(self) -> None:
+        rng = np.random.default_rng(31415)
+        self.series = [rng.random(length) for length in [60, 60, 45, 20]]
+        return
+
+    def test_stack_series(self):
+
+        stacked, mask = stack_series(self.series)
+        self.assertEqual(stacked.shape, (4, 60))
+        self.assertListEqual(mask.sum(axis=1).tolist(), [60, 60, 45, 20])
+        self.assertTrue(np.isnan(stacked[~mask]).all())
+        self.assertTrue(np.array_equal(stacked[2, :45], self.series[2]))
+
+        return
+
+    def test_moving_average(self):
+
+        stacked, mask = stack_series(self.series)
+        smoothed = smooth(stacked, mask, "moving_average", window=7)
+        self.assertEqual(smoothed.shape, (4, 54))
+        for row, data in zip(smoothed, self.series):
+            expected = np.convolve(data, np.ones(7), "valid") / 7
+            self.assertTrue(np.allclose(row[:len(expected)], expected))
+            self.assertTrue(np.isnan(row[len(expected):]).all())
+
+        return
+
+    def test_exponential(self):
+
+        stacked, mask = stack_series(self.series)
+        smoothed = smooth(stacked, mask, "exponential", alpha=0.25)
+        for row, data in zip(smoothed, self.series):
+            expected = [data[0]]
+            for value in data[1:]:
+                expected.append(0.25 * value + 0.75 * expected[-1])
+            self.assertTrue(np.allclose(row[:len(data)], expected))
+            self.assertTrue(np.isnan(row[len(data):]).all())
+
+        return
+
+    def test_loess(self):
+
+        # a local linear fit reproduces a line exactly, including at the (ragged) ends
+        line = np.arange(60) * 0.5 + 3
+        stacked, mask = stack_series([line, line[:25]])
+        smoothed = smooth(stacked, mask, "loess", window=9)
+        self.assertTrue(np.allclose(smoothed[0], line))
+        self.assertTrue(np.allclose(smoothed[1, :25], line[:25]))
+        self.assertTrue(np.isnan(smoothed[1, 25:]).all())
+
+        self.assertRaises(ValueError, smooth, stacked, mask, "spline")
+
+        return
+
+    def test_collect(self):
+
+        with tempfile.TemporaryDirectory() as temp:
+            experiment = os.path.join(temp, "experiment")
+            os.mkdir(experiment)
+            with sqlite3.connect(os.path.join(experiment, "results.db")) as connection:
+                connection.execute("CREATE TABLE results (sim_id TEXT, Run_Number INTEGER)")
+                connection.executemany("INSERT INTO results VALUES (?, ?)", [(f"sim{index}", index) for index in range(len(self.series))])
+            connection.close()
+            for index, data in enumerate(self.series):
+                chart = ChannelReport(Timesteps=len(data))
+                chart.channels["Infected"] = Channel("Infected", "fraction", data)
+                os.mkdir(os.path.join(experiment, f"sim{index}"))
+                chart.write_file(os.path.join(experiment, f"sim{index}", "InsetChart.json"))
+
+            raw = np.array(collect(experiment, "Infected", smoothing=False)["ref"])
+            self.assertEqual(raw.shape, (4, 60))
+            # series which ended early are padded with NaN, not zero, so means aren't skewed
+            self.assertListEqual(sorted(np.sum(~np.isnan(raw), axis=1).tolist()), [20, 45, 60, 60])
+            self.assertAlmostEqual(np.nanmean(raw, axis=0)[50], np.mean([data[50] for data in self.series[:2]]))
+
+            smoothed = np.array(collect(experiment, "Infected")["ref"])
+            self.assertEqual(smoothed.shape, (4, 54))
+            shortest = smoothed[np.argmin(np.sum(~np.isnan(smoothed), axis=1))]
+            self.assertTrue(np.allclose(shortest[:14], np.convolve(self.series[3], np.ones(7), "valid") / 7))
+            self.assertTrue(np.isnan(shortest[14:]).all())
+
+        return
+
+
+class TestDownsample(unittest.TestCase):
+
+    def setUp(self):
+        generator = np.random.default_rng(20)
+        self.series = np.cumsum(generator.normal(size=36500))
+        return
+
+    def test_short_series_unchanged(self):
+        x, y = downsample(self.series[:100], 1000)
+        self.assertTrue(np.array_equal(x, np.arange(100)))
+        self.assertTrue(np.array_equal(y, self.series[:100]))
+        x, y = downsample(self.series, None)
+        self.assertEqual(len(y), len(self.series))
+        return
+
+    def test_minmax(self):
+        indices = minmax_indices(self.series, 2000)
+        self.assertLessEqual(len(indices), 2000)
+        self.assertTrue(np.all(np.diff(indices) > 0))
+        self.assertEqual(indices[0], 0)
+        self.assertEqual(indices[-1], len(self.series) - 1)
+        # global extremes always survive
+        self.assertIn(np.argmin(self.series), indices)
+        self.assertIn(np.argmax(self.series), indices)
+        # the envelope of each bucket is preserved
+        edges = np.linspace(0, len(self.series), 999 + 1).astype(int)
+        for start, stop in zip(edges[:-1], edges[1:]):
+            kept = self.series[indices[(indices >= start) & (indices < stop)]]
+            self.assertEqual(kept.min(), self.series[start:stop].min())
+            self.assertEqual(kept.max(), self.series[start:stop].max())
+        return
+
+    def test_minmax_nan(self):
+        data = self.series.copy()
+        data[1000:3000] = np.nan
+        indices = minmax_indices(data, 2000)
+        self.assertFalse(np.isnan(data[indices[1:-1]]).any())
+        return
+
+    def test_lttb(self):
+        indices = lttb_indices(self.series, 1000)
+        self.assertEqual(len(indices), 1000)
+        self.assertTrue(np.all(np.diff(indices) > 0))
+        self.assertEqual(indices[0], 0)
+        self.assertEqual(indices[-1], len(self.series) - 1)
+        # a single spike is kept
+        data = np.zeros(10000)
+        data[4321] = 1.0
+        self.assertIn(4321, lttb_indices(data, 100))
+        return
+
+    def test_x_values(self):
+        x_data = np.arange(len(self.series)) * 0.5
+        for method in ["minmax", "lttb"]:
+            x, y = downsample(self.series, 500, method, x=x_data)
+            self.assertTrue(np.array_equal(y, self.series[(x * 2).astype(int)]))
+        with self.assertRaises(ValueError):
+            downsample(self.series, 500, "decimate")
+        return
+
+
 class TestPropReport(unittest.TestCase):
     @classmethod
     def setUpClass(self):
@@ -0,0 +1,64 @@
+import subprocess
+import sys
+import unittest
+
+# plotting and numerical packages which are slow to import and only needed by some functions
+_HEAVY = ["matplotlib", "scipy", "geographiclib", "pandas", "emod_api.demographics.demographics"]
+
+
+def _imported_modules(module: str) -> dict:
+
+    """Import module in a fresh interpreter with -X importtime, return cumulative microseconds keyed on module imported."""
+
+    completed = subprocess.run([sys.executable, "-X", "importtime", "-c", f"import {module}"], capture_output=True, text=True, check=True)
+    imported = {}
+    for line in completed.stderr.splitlines():
+        if line.startswith("import time:") and "|" in line:
+            _, cumulative, name = line[len("import time:"):].split("|")
+            if cumulative.strip().isdigit():
+                imported[name.strip()] = int(cumulative)
+
+    return imported
+
+
+class TestImportTime(unittest.TestCase):
+    """Reading and writing reports and migration files must not pull in plotting or numerical packages."""
+
+    def _check(self, module: str) -> None:
+
+        imported = _imported_modules(module)
+        self.assertIn(module, imported)
+        heavy = sorted(name for name in imported if any(name == package or name.startswith(package + ".") for package in _HEAVY))
+        self.assertListEqual(heavy, [], f"import {module} ({imported[module] / 1e6:.2f}s) imports {heavy}")
+
+        return
+
+    def test_channel_reports(self):
+        for module in ["emod_api.channelreports.channels", "emod_api.channelreports.utils", "emod_api.channelreports.aggregate",
+                       "emod_api.channelreports.cache", "emod_api.channelreports.plot_prop_report", "emod_api.channelreports.plot_icj_means"]:
+            with self.subTest(module=module):
+                self._check(module)
+        return
+
+    def test_spatial_reports(self):
+        for module in ["emod_api.spatialreports.spatial", "emod_api.spatialreports.plot_spat_means"]:
+            with self.subTest(module=module):
+                self._check(module)
+        return
+
+    def test_migration(self):
+        self._check("emod_api.migration.migration")
+        return
+
+    def test_multidim_plotter(self):
+        self._check("emod_api.multidim_plotter")
+        return
+
+    def test_demographics_calculators(self):
+        imported = _imported_modules("emod_api.demographics.calculators")
+        self.assertFalse(any(name.startswith("scipy") for name in imported))
+        return
+
+
+if __name__ == '__main__':
+    unittest.main()
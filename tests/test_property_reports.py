@@ -1,12 +1,18 @@
 from functools import reduce
 from pathlib import Path
+import gzip
 import os
+import shutil
 import tempfile
 import unittest
 
 from emod_api.channelreports.utils import property_report_to_csv, read_json_file, get_report_channels, accumulate_channel_data, save_to_csv, plot_traces
+from emod_api.channelreports.utils import PropertyReportIndex, _validate_property_report_ips, reports_to_csv, render_figures, merge_property_reports
+from emod_api.channelreports.channels import ChannelReport
 from emod_api.channelreports.utils import __get_trace_name as utils__get_trace_name, __index_for as utils__index_for, __title_for as utils__title_for
 
+import matplotlib
+import matplotlib.pyplot as plt
 import numpy as np
 
 from tests import manifest
@@ -69,6 +75,49 @@ class TestPublicApi(unittest.TestCase):
 
         return
 
+    def test_read_json_file_selected_channels(self):
+
+        full = read_json_file(filename=self.prop_file_short)
+        selected = read_json_file(filename=self.prop_file_short, channels=["Infected", "Statistical Population"])
+
+        self.assertDictEqual(selected["Header"], full["Header"])
+        expected = {key for key in full["Channels"] if key.split(":")[0] in ("Infected", "Statistical Population")}
+        self.assertSetEqual(set(selected["Channels"]), expected)
+        for key, channel in selected["Channels"].items():
+            self.assertEqual(channel["Units"], full["Channels"][key]["Units"])
+            self.assertTrue(np.array_equal(channel["Data"], full["Channels"][key]["Data"]))
+
+        return
+
+    def test_read_json_file_data_type(self):
+
+        # plain lists, as from json.load(), unless channels or dtype is given
+        report = read_json_file(filename=self.prop_file_short)
+        for channel in report["Channels"].values():
+            self.assertIsInstance(channel["Data"], list)
+
+        for kwargs in [{"channels": ["Infected"]}, {"dtype": np.float32}]:
+            with self.subTest(**kwargs):
+                report = read_json_file(filename=self.prop_file_short, **kwargs)
+                for channel in report["Channels"].values():
+                    self.assertIsInstance(channel["Data"], np.ndarray)
+                    self.assertEqual(channel["Data"].dtype, kwargs.get("dtype", np.float64))
+
+        return
+
+    def test_read_json_file_dtype(self):
+
+        full = read_json_file(filename=self.prop_file_short)
+        for dtype in [np.float32, np.float64]:
+            with self.subTest(dtype=dtype):
+                typed = read_json_file(filename=self.prop_file_short, dtype=dtype)
+                self.assertSetEqual(set(typed["Channels"]), set(full["Channels"]))
+                for key, channel in typed["Channels"].items():
+                    self.assertEqual(channel["Data"].dtype, dtype)
+                    self.assertTrue(np.allclose(channel["Data"], full["Channels"][key]["Data"]))
+
+        return
+
     def test_get_report_channels(self):
 
         property_report = read_json_file(filename=self.prop_file)
@@ -285,3 +334,235 @@ class TestInternalApi(unittest.TestCase):
         # TODO - test with overlay=True when overlay functionality is fixed
 
         return
+
+
+class TestPropertyReportIndex(unittest.TestCase):
+    """Test cases for the vectorized property report multi-index."""
+
+    @classmethod
+    def setUpClass(cls):
+        cls.channel_data = get_report_channels(read_json_file(TestPublicApi.prop_file_short))
+        return
+
+    def reference(self, channels, groupby):
+        """Accumulate traces one channel key at a time."""
+        trace_values = {}
+        for key in sorted(self.channel_data):
+            channel_title, ip_string = key.split(":", 1)
+            if channel_title in channels:
+                trace_name = utils__get_trace_name(channel_title, ip_string.split(","), groupby)
+                data = np.array(self.channel_data[key]["Data"], dtype=np.float32)
+                if trace_name in trace_values:
+                    trace_values[trace_name] += data
+                else:
+                    trace_values[trace_name] = data
+        return trace_values
+
+    def test_index(self):
+
+        index = PropertyReportIndex(self.channel_data)
+
+        self.assertListEqual(index.keys, sorted(self.channel_data))
+        self.assertListEqual(index.ips, ["Age_Bin", "QualityOfCare", "QualityOfCare1", "QualityOfCare2"])
+        self.assertListEqual(index.channel_names, ["Infected", "New Infections", "Statistical Population"])
+        self.assertEqual(index.data.shape, (len(self.channel_data), len(self.channel_data[index.keys[0]]["Data"])))
+        self.assertEqual(index.data.dtype, np.float32)
+
+        row = 7
+        name, ip_string = index.keys[row].split(":", 1)
+        self.assertEqual(index.channel_names[index.names[row]], name)
+        for kvp in ip_string.split(","):
+            ip, value = kvp.split(":")
+            self.assertEqual(index.values[ip][index.codes[row, index.ips.index(ip)]], value)
+        self.assertTrue(np.array_equal(index.data[row], np.array(self.channel_data[index.keys[row]]["Data"], dtype=np.float32)))
+
+        return
+
+    def test_group_by(self):
+
+        channels = ["Infected", "Statistical Population"]
+        index = PropertyReportIndex(self.channel_data, channels=channels)
+        self.assertListEqual(index.channel_names, channels)
+
+        for groupby in [None, [], ["Age_Bin"], ["QualityOfCare2", "Age_Bin"]]:
+            with self.subTest(groupby=groupby):
+                trace_values = index.group_by(groupby)
+                expected = self.reference(channels, groupby)
+                self.assertListEqual(list(trace_values), list(expected))
+                for trace_name, data in expected.items():
+                    self.assertTrue(np.allclose(trace_values[trace_name], data))
+                self.assertListEqual(list(accumulate_channel_data(channels, False, groupby, self.channel_data)), list(expected))
+
+        self.assertListEqual(list(index.group_by([], channels=["Infected"])), ["Infected"])
+
+        return
+
+    def test_dtype_and_nbytes(self):
+
+        single = PropertyReportIndex(self.channel_data)
+        double = PropertyReportIndex(self.channel_data, dtype=np.float64)
+        self.assertEqual(double.data.dtype, np.float64)
+        self.assertEqual(double.nbytes - single.nbytes, single.data.nbytes)
+        self.assertEqual(single.nbytes, single.data.nbytes + single.names.nbytes + single.codes.nbytes)
+
+        trace_values = accumulate_channel_data(["Infected"], False, ["Age_Bin"], self.channel_data, dtype=np.float64)
+        self.assertTrue(all(data.dtype == np.float64 for data in trace_values.values()))
+
+        return
+
+    def test_validate_ips_uses_all_keys(self):
+
+        channel_data = {
+            "Infected:Age_Bin:Young": {},
+            "Infected:Age_Bin:Old,Risk:High": {},
+        }
+        _validate_property_report_ips(["Risk"], channel_data)
+        with self.assertRaises(ValueError):
+            _validate_property_report_ips(["Zombie"], channel_data)
+
+        return
+
+
+class TestReportsToCsv(unittest.TestCase):
+    """Test cases for converting a directory of reports to CSV."""
+
+    def test_reports_to_csv(self):
+
+        source = os.path.join(manifest.reports_folder, "InsetChart.json")
+        expected = ChannelReport(source)
+
+        with tempfile.TemporaryDirectory() as temp:
+            for sim in ["sim1", "sim2", "sim3"]:
+                os.mkdir(os.path.join(temp, sim))
+                shutil.copy(source, os.path.join(temp, sim, "InsetChart.json"))
+
+            for workers, compress in [(1, False), (2, True)]:
+                with self.subTest(workers=workers, compress=compress):
+                    filenames = reports_to_csv(temp, transpose=True, compress=compress, workers=workers)
+                    self.assertListEqual(filenames, [Path(temp) / sim / ("InsetChart.csv.gz" if compress else "InsetChart.csv") for sim in ["sim1", "sim2", "sim3"]])
+                    for filename in filenames:
+                        with (gzip.open(filename, "rt") if compress else open(filename)) as file:
+                            lines = file.read().splitlines()
+                        self.assertEqual(lines[0], ",".join(expected.channel_names))
+                        self.assertEqual(len(lines), expected.num_time_steps + 1)
+
+        return
+
+
+class TestMergePropertyReports(unittest.TestCase):
+    """Test cases for merging property reports."""
+
+    def setUp(self):
+
+        # the truncated report's header still has the original channel and time step counts
+        json_data = read_json_file(TestPublicApi.prop_file_short, dtype=np.float64)
+        timesteps = len(next(iter(json_data["Channels"].values()))["Data"])
+        self.source = ChannelReport(**{**json_data["Header"], "Channels": len(json_data["Channels"]), "Timesteps": timesteps})
+        for key, channel in json_data["Channels"].items():
+            self.source.add_channel(key, channel["Units"], channel["Data"])
+        self.temp = tempfile.TemporaryDirectory()
+        self.paths = []
+        for scale in [1, 2, 3, 4, 5]:
+            path = os.path.join(self.temp.name, f"PropertyReport_{scale}.json")
+            (self.source * scale).write_file(path)
+            self.paths.append(path)
+
+        return
+
+    def tearDown(self):
+        self.temp.cleanup()
+        return
+
+    def test_sum_and_mean(self):
+
+        expected = self.source.as_matrix() * 15
+        for workers in [1, 2]:
+            with self.subTest(workers=workers):
+                merged = merge_property_reports(self.paths, op="sum", workers=workers, batch_size=2)
+                self.assertListEqual(merged.channel_names, self.source.channel_names)
+                self.assertEqual(merged.num_time_steps, self.source.num_time_steps)
+                self.assertTrue(np.allclose(merged.as_matrix(), expected))
+                self.assertEqual(merged["Infected:Age_Bin:Age_Bin_Property_From_0_To_20,QualityOfCare:High,QualityOfCare1:High,QualityOfCare2:High"].units,
+                                 self.source["Infected:Age_Bin:Age_Bin_Property_From_0_To_20,QualityOfCare:High,QualityOfCare1:High,QualityOfCare2:High"].units)
+
+        merged = merge_property_reports(self.paths, op="mean", workers=1, dtype=np.float32)
+        self.assertEqual(merged.as_matrix().dtype, np.float32)
+        self.assertTrue(np.allclose(merged.as_matrix(), self.source.as_matrix() * 3))
+
+        with self.assertRaises(ValueError):
+            merge_property_reports(self.paths, op="median", workers=1)
+
+        return
+
+    def test_write_and_cache(self):
+
+        filename = os.path.join(self.temp.name, "merged", "PropertyReport.json")
+        os.mkdir(os.path.dirname(filename))
+        merged = merge_property_reports(self.paths, workers=1, filename=filename, cache=True)
+
+        self.assertTrue(Path(filename + ".cache").exists())
+        for cache in [False, True]:
+            reread = ChannelReport(filename, cache=cache)
+            self.assertListEqual(reread.channel_names, merged.channel_names)
+            self.assertTrue(np.allclose(reread.as_matrix(), merged.as_matrix()))
+
+        return
+
+    def test_mismatched_reports(self):
+
+        removed = "New Infections:Age_Bin:Age_Bin_Property_From_0_To_20,QualityOfCare:High,QualityOfCare1:High,QualityOfCare2:High"
+        altered = ChannelReport(self.paths[0])
+        del altered.channels[removed]
+        altered.write_file(self.paths[3])
+        with self.assertRaises(ValueError) as context:
+            merge_property_reports(self.paths, workers=1, batch_size=2)
+        self.assertIn(removed, str(context.exception))
+
+        shorter = self.source._derived(self.source.as_matrix()[:, :10])
+        shorter.write_file(self.paths[3])
+        with self.assertRaises(ValueError):
+            merge_property_reports(self.paths, workers=1)
+
+        return
+
+
+class TestRenderFigures(unittest.TestCase):
+    """Test cases for downsampled and batch (headless) plotting."""
+
+    def test_plot_traces_downsampled(self):
+
+        long_trace = np.cumsum(np.random.default_rng(42).normal(size=20000))
+        figure = plot_traces({"Infected": long_trace}, None, False, ["Infected"], "Downsampled", False, max_points=1000)
+        line = figure.axes[0].get_lines()[0]
+        self.assertLessEqual(len(line.get_ydata()), 1000)
+        self.assertEqual(max(line.get_ydata()), long_trace.max())
+
+        figure = plot_traces({"Infected": long_trace}, None, False, ["Infected"], "Every Point", False, max_points=None)
+        self.assertEqual(len(figure.axes[0].get_lines()[0].get_ydata()), 20000)
+
+        return
+
+    def test_render_figures(self):
+
+        traces = {f"Infected:Age_Bin:{age}": np.arange(365.0) * age for age in range(3)}
+        with tempfile.TemporaryDirectory() as temp:
+            tasks = []
+            for index in range(3):
+                kwargs = {"trace_values": traces, "norm_values": None, "overlay": True, "channels": ["Infected"], "title": f"figure{index}", "legend": True}
+                tasks.append((plot_traces, kwargs, os.path.join(temp, f"figure{index}.png")))
+            # rendering in this process must not switch the caller's backend
+            backend = matplotlib.get_backend()
+            plt.switch_backend("svg")
+            try:
+                for workers in [1, 2]:
+                    with self.subTest(workers=workers):
+                        filenames = render_figures(tasks, workers=workers, dpi=50)
+                        self.assertEqual(matplotlib.get_backend(), "svg")
+                        self.assertListEqual(filenames, [task[2] for task in tasks])
+                        self.assertTrue(all(Path(filename).stat().st_size > 0 for filename in filenames))
+                        for filename in filenames:
+                            os.remove(filename)
+            finally:
+                plt.switch_backend(backend)
+
+        return
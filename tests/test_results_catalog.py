@@ -0,0 +1,113 @@
+import os
+import sqlite3
+import tempfile
+import time
+import unittest
+
+from emod_api.results_catalog import ResultsCatalog, open_catalog, parse_value
+
+
+class TestResultsCatalog(unittest.TestCase):
+
+    def setUp(self):
+        self.temp = tempfile.TemporaryDirectory()
+        self.db = os.path.join(self.temp.name, "results.db")
+        connection = sqlite3.connect(self.db)
+        connection.execute("CREATE TABLE results (sim_id TEXT, Base_Infectivity REAL, Run_Number INTEGER, Label TEXT, Prevalence REAL, Untyped)")
+        rows = []
+        for infectivity in [0.1, 0.2, 0.3]:
+            for run in range(4):
+                rows.append((f"sim_{infectivity}_{run}", infectivity, run, str(infectivity), infectivity * 10 + run, str(infectivity)))
+        connection.executemany("INSERT INTO results VALUES (?, ?, ?, ?, ?, ?)", rows)
+        connection.commit()
+        connection.close()
+        self.catalog = ResultsCatalog(self.db)
+        return
+
+    def tearDown(self):
+        self.catalog.close()
+        self.temp.cleanup()
+        return
+
+    def test_parse_value(self):
+        self.assertEqual(parse_value("3"), 3)
+        self.assertIsInstance(parse_value("3"), int)
+        self.assertEqual(parse_value("0.25"), 0.25)
+        self.assertEqual(parse_value("high"), "high")
+        return
+
+    def test_sim_ids(self):
+        self.assertEqual(len(self.catalog.all_sim_ids()), 12)
+        self.assertListEqual(sorted(self.catalog.sim_ids("Run_Number", 2)), ["sim_0.1_2", "sim_0.2_2", "sim_0.3_2"])
+        self.assertEqual(len(self.catalog.sim_ids("Base_Infectivity", 0.2)), 4)
+        return
+
+    def test_sim_ids_tolerance(self):
+        self.assertEqual(len(self.catalog.sim_ids("Base_Infectivity", 0.20005, tolerance=0.0001)), 4)
+        # values below the target are not within tolerance (only the difference used to be tested)
+        self.assertEqual(len(self.catalog.sim_ids("Base_Infectivity", 0.3, tolerance=0.0001)), 4)
+        # numbers stored as text
+        self.assertEqual(len(self.catalog.sim_ids("Label", 0.1, tolerance=0.0001)), 4)
+        self.assertEqual(len(self.catalog.sim_ids("Untyped", 0.1, tolerance=0.0001)), 4)
+        return
+
+    def test_groups(self):
+        groups = self.catalog.groups("Base_Infectivity")
+        self.assertListEqual(list(groups), [0.1, 0.2, 0.3])
+        self.assertTrue(all(len(sims) == 4 for sims in groups.values()))
+        return
+
+    def test_averages(self):
+        averages = self.catalog.averages("Base_Infectivity", "Run_Number", "Prevalence")
+        self.assertEqual(len(averages), 12)
+        for infectivity, run, prevalence in averages:
+            self.assertAlmostEqual(prevalence, infectivity * 10 + run)
+        return
+
+    def _indices(self):
+        with sqlite3.connect(self.db) as connection:
+            return [row[0] for row in connection.execute("SELECT name FROM sqlite_master WHERE type = 'index'")]
+
+    def test_index_created(self):
+        # queries don't write to the database
+        self.catalog.groups("Run_Number")
+        self.catalog.sim_ids("Base_Infectivity", 0.2, tolerance=0.0001)
+        self.catalog.averages("Base_Infectivity", "Run_Number", "Prevalence")
+        self.assertListEqual(self._indices(), [])
+        self.catalog.ensure_index("Run_Number")
+        self.assertIn("idx_results_Run_Number", self._indices())
+        self.assertEqual(len(self.catalog.groups("Run_Number")[0]), 3)
+        return
+
+    def test_invalid_column(self):
+        with self.assertRaises(ValueError):
+            self.catalog.sim_ids("Run_Number; DROP TABLE results", 1)
+        with self.assertRaises(ValueError):
+            self.catalog.groups("Not_A_Tag")
+        return
+
+    def test_cache_invalidated_on_change(self):
+        self.assertEqual(len(self.catalog.sim_ids("Run_Number", 0)), 3)
+        time.sleep(0.01)    # make sure the modification time changes
+        with sqlite3.connect(self.db) as connection:
+            connection.execute("INSERT INTO results VALUES ('sim_extra', 0.4, 0, '0.4', 4.0, '0.4')")
+        self.assertEqual(len(self.catalog.sim_ids("Run_Number", 0)), 4)
+        return
+
+    def test_open_catalog_closes(self):
+        with open_catalog(self.db) as catalog:
+            catalog.ensure_index("Base_Infectivity", "Run_Number")
+            self.assertEqual(len(catalog.groups("Run_Number")), 4)
+        self.assertIn("idx_results_Base_Infectivity", self._indices())
+        with self.assertRaises(sqlite3.ProgrammingError):
+            catalog.all_sim_ids()
+        return
+
+    def test_missing_database(self):
+        with self.assertRaises(FileNotFoundError):
+            ResultsCatalog(os.path.join(self.temp.name, "missing.db"))
+        return
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -3,9 +3,15 @@
 from __future__ import print_function
 import os
 import gc
+import io
+import json
+import pickle
+import sys
 import tempfile
 import unittest
 import time
+from contextlib import redirect_stderr
+from unittest.mock import patch
 import emod_api.serialization.dtk_file_tools as dft
 import emod_api.serialization.dtk_file_support as support
 import emod_api.serialization.serialized_population as SerPop
@@ -1565,6 +1571,358 @@ class TestReadVersion6(unittest.TestCase):
             os.remove(output_file)
 
 
+class TestReadMany(unittest.TestCase):
+
+    def setUp(self):
+        self.filenames = [os.path.join(manifest.serialization_folder, "state-00004-reduced.dtk"),
+                          os.path.join(manifest.serialization_folder, "version3.dtk"),
+                          os.path.join(manifest.serialization_folder, "baseline.dtk")]
+        return
+
+    def test_summaries(self):
+        for workers in [1, 2]:
+            summaries = dft.read_many(self.filenames, workers=workers)
+            self.assertEqual(self.filenames, [summary["filename"] for summary in summaries])
+            self.assertEqual([6, 3, 3], [summary["version"] for summary in summaries])
+            self.assertEqual([3, 1, 4], [summary["num_nodes"] for summary in summaries])
+            self.assertEqual([14, 1023, 1000], [summary["num_humans"] for summary in summaries])
+            self.assertTrue(all("columns" not in summary for summary in summaries))
+        return
+
+    def test_fields(self):
+        results = dft.read_many(self.filenames, workers=2, fields=["m_age", "suid.id", "not_a_field"])
+        self.assertEqual([14, 1023, 1000], [result["num_humans"] for result in results])
+
+        columns = results[0]["columns"]
+        self.assertEqual([1] * 5 + [2] * 2 + [3] * 7, columns["node_suid"])
+        self.assertEqual([2, 5, 8, 11, 14, 3, 6, 4, 7, 10, 13, 16, 19, 22], columns["suid.id"])
+        self.assertEqual([1111] * 5 + [2222] * 2 + [3333] * 7, columns["m_age"])
+        self.assertEqual([None] * 14, columns["not_a_field"])
+
+        # serial and concurrent reads give the same answer
+        serial = dft.read_many(self.filenames, workers=1, fields=["m_age", "suid.id", "not_a_field"])
+        self.assertEqual(results, serial)
+
+        dtk = dft.read(self.filenames[2])
+        ages = [human.m_age for node in dtk.nodes for human in node.individualHumans]
+        self.assertEqual(ages, results[2]["columns"]["m_age"])
+        return
+
+
+class TestInstrumentation(unittest.TestCase):
+
+    def test_read_write_v6(self):
+        input_file = os.path.join(manifest.serialization_folder, "state-00004-reduced.dtk")
+        output_file = os.path.join(manifest.output_folder, "TestInstrumentation.test_read_write_v6.dtk")
+        events = []
+        with dft.instrument(callback=events.append) as stats:
+            dtk = dft.read(input_file)
+            for node in dtk.nodes:
+                for human in node.individualHumans:
+                    human.m_age += 1
+            dft.write(dtk, output_file)
+
+        self.assertEqual(events, stats.events)
+        totals = stats.totals()
+        # one sim chunk, three node chunks, and six human collections
+        self.assertEqual(10, totals["read"]["count"])
+        header = dft.read(input_file).header
+        chunk_sizes = [header.sim_chunk_size] + header.node_chunk_sizes + header.human_chunk_sizes
+        self.assertEqual(sum(int(size, 16) for size in chunk_sizes), totals["read"]["bytes"])
+        self.assertEqual(10, totals["write"]["count"])
+        for operation in ["decompress", "parse", "serialize", "compress"]:
+            self.assertIn(operation, totals)
+            self.assertGreater(totals[operation]["uncompressed_bytes"], 0)
+        self.assertEqual(totals["decompress"]["count"], totals["parse"]["count"])
+        self.assertEqual({"sim", "node:1", "node:2", "node:3", "human:1", "human:2", "human:3"},
+                         {event["chunk"] for event in stats.events if event["operation"] == "read"})
+
+        output = json.loads(stats.to_json())
+        self.assertEqual(len(stats.events), len(output["events"]))
+        self.assertEqual(sorted(totals), sorted(output["totals"]))
+
+        # nothing recorded once the context is closed
+        dft.read(output_file)
+        self.assertEqual(len(events), len(stats.events))
+        os.remove(output_file)
+        return
+
+    def test_read_version3(self):
+        with dft.instrument() as stats:
+            dtk = dft.read(os.path.join(manifest.serialization_folder, "version3.dtk"))
+            _ = dtk.nodes[0].individualHumans[0].m_age
+        totals = stats.totals()
+        self.assertEqual(dtk.chunk_count, totals["read"]["count"])
+        self.assertEqual(dtk.byte_count, totals["read"]["bytes"])
+        self.assertEqual(1, totals["decompress"]["count"])
+        self.assertEqual(1, totals["parse"]["count"])
+        return
+
+
+class TestCompact(unittest.TestCase):
+
+    def test_compact_object(self):
+        registry = {}
+        table = support.KeyTable.lookup(("a", "b"), registry)
+        obj = support.CompactObject(table, [1, {"c": 2}])
+        self.assertEqual(1, obj.a)
+        self.assertEqual(1, obj["a"])
+        self.assertEqual({"a": 1, "b": {"c": 2}}, obj)
+        obj.a += 10
+        obj["d"] = 4
+        self.assertEqual(["a", "b", "d"], obj.keys())
+        self.assertEqual(11, obj.a)
+        del obj.b
+        self.assertEqual({"a": 11, "d": 4}, dict(obj))
+        self.assertNotIn("b", obj)
+        with self.assertRaises(AttributeError):
+            _ = obj.b
+        with self.assertRaises(KeyError):
+            _ = obj["b"]
+
+        # objects which gain the same key share a key table
+        other = support.CompactObject(table, [5, 6])
+        other.d = 7
+        del other.b
+        self.assertIs(obj._table, other._table)
+        return
+
+    def test_read_compact_v6(self):
+        input_file = os.path.join(manifest.serialization_folder, "state-00004-reduced.dtk")
+        pop = SerPop.SerializedPopulation(input_file, compact=True)
+        node = pop.nodes[0]
+        human = node.individualHumans[0]
+        self.assertIsInstance(human, support.CompactObject)
+        self.assertIs(human._table, node.individualHumans[1]._table)
+        self.assertEqual(2, human.suid.id)
+        self.assertEqual(1111, human["m_age"])
+
+        for node in pop.nodes:
+            for human in node.individualHumans:
+                human.m_age += 1
+
+        output_file = os.path.join(manifest.output_folder, "TestCompact.test_read_compact_v6.dtk")
+        pop.write(output_file)
+
+        compact = dft.read(output_file, compact=True)
+        regular = dft.read(output_file)
+        for compact_node, regular_node in zip(compact.nodes, regular.nodes):
+            compact_humans = list(compact_node.individualHumans)
+            regular_humans = list(regular_node.individualHumans)
+            self.assertEqual(regular_humans, compact_humans)
+            self.assertEqual(json.dumps(regular_humans), json.dumps(compact_humans, default=support.serialize_default))
+        self.assertEqual([1112] * 5 + [2223] * 2 + [3334] * 7,
+                         [human.m_age for node in regular.nodes for human in node.individualHumans])
+        os.remove(output_file)
+        return
+
+    def test_pickle(self):
+        input_file = os.path.join(manifest.serialization_folder, "state-00004-reduced.dtk")
+        node = dft.read(input_file, compact=True).nodes[0]
+        humans = list(node.individualHumans)
+        copies = pickle.loads(pickle.dumps(humans))
+        self.assertIsInstance(copies[0], support.CompactObject)
+        self.assertEqual(humans, copies)
+        self.assertEqual(humans[0].m_age, copies[0].m_age)
+        # key tables are still shared after unpickling
+        self.assertIs(copies[0]._table, copies[1]._table)
+        copies[0].m_age = 42
+        self.assertEqual(["m_age"], [key for key in copies[0] if key == "m_age"])
+        return
+
+    def test_find_and_get_parameters(self):
+        input_file = os.path.join(manifest.serialization_folder, "state-00004-reduced.dtk")
+        regular = dft.read(input_file).nodes[0].individualHumans
+        compact = dft.read(input_file, compact=True).nodes[0].individualHumans
+        self.assertEqual(SerPop.get_parameters(regular), SerPop.get_parameters(compact))
+        # nested objects are searched too
+        self.assertIn("dtk.nodes suid id", SerPop.get_parameters(compact))
+        return
+
+    def test_read_compact_v4(self):
+        input_file = os.path.join(manifest.serialization_folder, "version4.dtk")
+        regular = dft.read(input_file).nodes[0]
+        compact = dft.read(input_file, compact=True).nodes[0]
+        self.assertIsInstance(compact, support.CompactObject)
+        self.assertEqual(regular, compact)
+        self.assertEqual(regular.individualHumans[0].m_age, compact.individualHumans[0].m_age)
+        return
+
+
+class TestLazy(unittest.TestCase):
+
+    def test_scan(self):
+        data = b'{"human_collection":[{"m_age":1.5,"name":"{x}","suid":{"id":1,"m_age":7}},{"suid":{"id":2},"m_age": 2}]}'
+        collection = support.LazyHumanCollection.scan(data)
+        self.assertEqual(2, len(collection))
+        first, second = collection.humans
+        self.assertEqual(1.5, first.m_age)
+        self.assertEqual(2, second["m_age"])
+        self.assertEqual("{x}", first.name)
+        self.assertNotIn("name", second)
+        with self.assertRaises(AttributeError):
+            _ = second.name
+        self.assertFalse(collection.modified)
+        self.assertTrue(collection.unchanged(list(collection.humans)))
+
+        # objects parse the human
+        self.assertEqual({"id": 1, "m_age": 7}, first.suid)
+        self.assertTrue(collection.modified)
+        self.assertFalse(collection.unchanged(list(collection.humans)))
+
+        self.assertIsNone(support.LazyHumanCollection.scan(b'{"human_collection":[{"name":"\\"x\\""}]}'))
+        self.assertIsNone(support.LazyHumanCollection.scan('{"human_collection":[{"name":"\u00e9"}]}'.encode()))
+        return
+
+    def test_column_whitespace(self):
+        data = b'{"human_collection":[{"m_age" : 1.5,"suid":{"id":1}},{"suid":{"id":2},"m_age"\n:2}]}'
+        collection = support.LazyHumanCollection.scan(data)
+        self.assertEqual([1.5, 2], [human.m_age for human in collection.humans])
+        self.assertFalse(collection.modified)
+        return
+
+    def test_pickle(self):
+        data = b'{"human_collection":[{"m_age":1.5,"suid":{"id":1}},{"suid":{"id":2},"m_age":2}]}'
+        collection = support.LazyHumanCollection.scan(data)
+        first, second = pickle.loads(pickle.dumps(collection.humans))
+        self.assertIsInstance(first, support.LazyHuman)
+        self.assertEqual(1.5, first.m_age)
+        self.assertEqual({"suid": {"id": 2}, "m_age": 2}, second)
+        # pickling doesn't count as parsing the humans
+        self.assertFalse(collection.modified)
+        first.m_age = 3
+        self.assertEqual(3, first["m_age"])
+        self.assertEqual(1.5, collection.humans[0].m_age)
+        return
+
+    def test_unscannable_chunk(self):
+        input_file = os.path.join(manifest.serialization_folder, "state-00004-reduced.dtk")
+        output_file = os.path.join(manifest.output_folder, "TestLazy.test_unscannable_chunk.dtk")
+        dtk = dft.read(input_file)
+        dtk.nodes[0].individualHumans[0]["name"] = "\u00e9"     # non-ASCII, can't be scanned
+        dft.write(dtk, output_file)
+
+        with dft.instrument() as stats:
+            lazy = dft.read(output_file, lazy=True)
+            humans = lazy.nodes[0].individualHumans
+        self.assertEqual("\u00e9", humans[0].name)
+        self.assertNotIsInstance(humans[0], support.LazyHuman)
+        decompressed = [event["chunk"] for event in stats.events if event["operation"] == "decompress"]
+        self.assertEqual(len(decompressed), len(set(decompressed)))
+        os.remove(output_file)
+        return
+
+    def test_read_lazy(self):
+        input_file = os.path.join(manifest.serialization_folder, "state-00004-reduced.dtk")
+        regular = dft.read(input_file)
+        lazy = dft.read(input_file, lazy=True)
+        for regular_node, lazy_node in zip(regular.nodes, lazy.nodes):
+            regular_humans = list(regular_node.individualHumans)
+            lazy_humans = list(lazy_node.individualHumans)
+            self.assertIsInstance(lazy_humans[0], support.LazyHuman)
+            self.assertEqual([human.m_age for human in regular_humans], [human.m_age for human in lazy_humans])
+            self.assertEqual(regular_humans, lazy_humans)
+        return
+
+    def test_write_lazy(self):
+        input_file = os.path.join(manifest.serialization_folder, "state-00004-reduced.dtk")
+        output_file = os.path.join(manifest.output_folder, "TestLazy.test_write_lazy.dtk")
+
+        # humans which were only read are written back as they were
+        pop = SerPop.SerializedPopulation(input_file, lazy=True)
+        ages = [human.m_age for node in pop.nodes for human in node.individualHumans]
+        self.assertEqual([1111] * 5 + [2222] * 2 + [3333] * 7, ages)
+        pop.write(output_file)
+        input_header = dft.read(input_file).header
+        output_header = dft.read(output_file).header
+        self.assertEqual(input_header.human_chunk_sizes, output_header.human_chunk_sizes)
+        human_bytes = sum(int(size, 16) for size in input_header.human_chunk_sizes)
+        with open(input_file, "rb") as input_handle, open(output_file, "rb") as output_handle:
+            self.assertEqual(input_handle.read()[-human_bytes:], output_handle.read()[-human_bytes:])
+
+        # changes are kept
+        pop = SerPop.SerializedPopulation(output_file, lazy=True)
+        for node in pop.nodes:
+            for human in node.individualHumans:
+                if human.suid.id == 5:
+                    human.m_age = 5555
+        pop.write(output_file)
+
+        dtk = dft.read(output_file)
+        ages = [human.m_age for node in dtk.nodes for human in node.individualHumans]
+        self.assertEqual([1111, 5555, 1111, 1111, 1111] + [2222] * 2 + [3333] * 7, ages)
+        os.remove(output_file)
+        return
+
+
+class TestCompressionEngines(unittest.TestCase):
+
+    def setUp(self):
+        self.input_file = os.path.join(manifest.serialization_folder, "state-00004-reduced.dtk")
+        return
+
+    def write_and_check(self, engine, level, expected_compression):
+        output_file = os.path.join(manifest.output_folder, f"TestCompressionEngines.{engine}.{level}.dtk")
+        dtk = dft.read(self.input_file)
+        dtk.set_compression(engine, level)
+        for node in dtk.nodes:
+            node.mosquito_weight = 2.0
+        dft.write(dtk, output_file)
+
+        dtk = dft.read(output_file)
+        header = dtk.header
+        compressions = [header.sim_compression] + header.node_compressions + header.human_compressions
+        self.assertEqual({expected_compression}, set(compressions))
+        self.assertEqual([2.0, 2.0, 2.0], [node.mosquito_weight for node in dtk.nodes])
+        self.assertEqual([1111] * 5 + [2222] * 2 + [3333] * 7,
+                         [human.m_age for node in dtk.nodes for human in node.individualHumans])
+        os.remove(output_file)
+        return header
+
+    def test_lz4_levels(self):
+        default = self.write_and_check(dft.LZ4, None, dft.V6_COMPRESSION_STR_LZ4)
+        high = self.write_and_check(dft.LZ4, 9, dft.V6_COMPRESSION_STR_LZ4)
+        sizes = [sum(int(size, 16) for size in header.human_chunk_sizes) for header in [default, high]]
+        self.assertLess(sizes[1], sizes[0])
+        return
+
+    def test_none(self):
+        self.write_and_check(dft.NONE, None, dft.V6_COMPRESSION_STR_NONE)
+        return
+
+    @unittest.skipUnless(support.ZSTD_SUPPORT, "No Zstandard [de]compression support.")
+    def test_zstd(self):
+        with self.assertWarns(UserWarning):
+            self.write_and_check(dft.ZSTD, 9, dft.V6_COMPRESSION_STR_ZSTD)
+        return
+
+    @unittest.skipIf(support.ZSTD_SUPPORT, "If Zstandard support, test should not raise a UserWarning")
+    def test_zstd_exception(self):
+        with self.assertRaises(UserWarning):
+            dft.compress(b"data", dft.ZSTD)
+        return
+
+    def test_benchmark(self):
+        from emod_api.serialization import codec_benchmark
+        results = codec_benchmark.benchmark([self.input_file], codecs=[(dft.NONE, None), (dft.LZ4, None), (dft.LZ4, 9), (dft.ZSTD, 3)], repeat=1)
+        engines = [(result["engine"], result["level"]) for result in results]
+        self.assertEqual([(dft.NONE, None), (dft.LZ4, None), (dft.LZ4, 9)], engines[:3])
+        self.assertEqual(support.ZSTD_SUPPORT, (dft.ZSTD, 3) in engines)
+        self.assertEqual(1.0, results[0]["ratio"])
+        self.assertTrue(all(result["uncompressed_bytes"] == results[0]["uncompressed_bytes"] for result in results))
+        self.assertGreater(results[2]["ratio"], results[1]["ratio"])
+        self.assertTrue(results[1]["emod_readable"])
+        return
+
+    def test_benchmark_requires_files(self):
+        from emod_api.serialization import codec_benchmark
+        with patch.object(sys, "argv", ["codec_benchmark"]), redirect_stderr(io.StringIO()) as stderr:
+            with self.assertRaises(SystemExit) as context:
+                codec_benchmark.main()
+        self.assertEqual(2, context.exception.code)
+        self.assertIn("usage:", stderr.getvalue())
+        return
+
 
 if __name__ == "__main__":
     unittest.main()
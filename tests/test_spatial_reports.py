@@ -3,7 +3,7 @@ import numpy as np
 import os
 import pathlib
 import tempfile
-from emod_api.spatialreports.spatial import SpatialReport, SpatialNode
+from emod_api.spatialreports.spatial import SpatialReport, SpatialNode, SpatialReportBundle, write_node_major
 
 from tests import manifest
 
@@ -186,3 +186,282 @@ class TestSpatial(unittest.TestCase):
         self.assertEqual(report.interval, SAMPLE_INTERVAL)
 
         return
+
+    def test_mmap(self):
+
+        for name in ["SpatialReport_Prevalence.bin", "SpatialReportMalariaFiltered_Adult_Vectors.bin"]:
+            with self.subTest(name=name):
+                filename = os.path.join(manifest.spatrep_folder, name)
+                report = SpatialReport(filename)
+                mapped = SpatialReport(filename, mmap=True)
+
+                self.assertIsInstance(mapped.data, np.memmap)
+                self.assertEqual(mapped.data.shape, report.data.shape)
+                self.assertTrue(np.array_equal(mapped.data, report.data))
+                self.assertListEqual(list(mapped.node_ids), list(report.node_ids))
+                self.assertEqual(mapped.start, report.start)
+                self.assertEqual(mapped.interval, report.interval)
+
+                node_id = report.node_ids[-1]
+                self.assertTrue(np.array_equal(mapped[node_id].data, report[node_id].data))
+
+        return
+
+    def test_mmap_copy_on_write(self):
+
+        with tempfile.TemporaryDirectory() as temp:
+            filename = pathlib.Path(temp) / "spatial_report.bin"
+            SpatialReport(node_ids=[1, 2], data=np.ones((3, 2), dtype=np.float32)).write_file(str(filename))
+
+            report = SpatialReport(filename, mmap=True)
+            report[2][1] = 42.0
+            self.assertEqual(report.data[1, 1], 42.0)
+            del report
+            self.assertEqual(SpatialReport(str(filename))[2][1], 1.0)
+
+        return
+
+    def test_mmap_write_file_in_place(self):
+
+        with tempfile.TemporaryDirectory() as temp:
+            filename = pathlib.Path(temp) / "spatial_report.bin"
+            data = np.arange(6, dtype=np.float32).reshape((3, 2))
+            SpatialReport(node_ids=[1, 2], data=data).write_file(str(filename))
+            mode = filename.stat().st_mode
+
+            report = SpatialReport(filename, mmap=True)
+            report[2][1] = 42.0
+            report.write_file(str(filename))
+            self.assertEqual(filename.stat().st_mode, mode)
+            self.assertListEqual(os.listdir(temp), ["spatial_report.bin"])
+
+            written = SpatialReport(str(filename))
+            self.assertListEqual(list(written.node_ids), [1, 2])
+            expected = data.copy()
+            expected[1, 1] = 42.0
+            self.assertTrue(np.array_equal(written.data, expected))
+
+        return
+
+    def test_lazy_nodes(self):
+
+        report = SpatialReport(os.path.join(manifest.spatrep_folder, "SpatialReport_Prevalence.bin"), mmap=True)
+        self.assertEqual(len(report._nodes), 0)
+
+        node = report[0x58D12FFA]
+        self.assertIs(report[0x58D12FFA], node)
+        self.assertEqual(len(report._nodes), 1)
+        self.assertAlmostEqual(node[180], 0.43820226)
+        # a view, not a copy, of the report data
+        self.assertTrue(np.shares_memory(node.data, report.data))
+
+        self.assertEqual(len(report.nodes), report.node_count)
+        self.assertIs(report.nodes[0x58D12FFA], node)
+        self.assertRaises(KeyError, report.__getitem__, 42)
+
+        return
+
+    def test_window(self):
+
+        for name in ["SpatialReport_Prevalence.bin", "SpatialReportMalariaFiltered_Adult_Vectors.bin"]:
+            with self.subTest(name=name):
+                filename = os.path.join(manifest.spatrep_folder, name)
+                report = SpatialReport(filename)
+                node_ids = [report.node_ids[-1], report.node_ids[10], report.node_ids[3]]
+                columns = [report._node_id_to_index_map[node_id] for node_id in node_ids]
+
+                window = SpatialReport(filename, node_ids=node_ids, time_slice=slice(5, 25))
+                self.assertEqual(window.data.shape, (20, 3))
+                self.assertListEqual(list(window.node_ids), sorted(node_ids))
+                self.assertEqual(window.start, report.start + 5 * report.interval)
+                self.assertEqual(window.interval, report.interval)
+                for node_id, column in zip(node_ids, columns):
+                    self.assertTrue(np.array_equal(window[node_id].data, report.data[5:25, column]))
+
+        return
+
+    def test_window_time_only(self):
+
+        filename = os.path.join(manifest.spatrep_folder, "SpatialReportMalariaFiltered_Adult_Vectors.bin")
+        report = SpatialReport(filename)
+
+        window = SpatialReport(filename, time_slice=slice(-10, None, 2))
+        self.assertEqual(window.data.shape, (5, report.node_count))
+        self.assertEqual(window.start, 8 + (45 - 10) * 16)
+        self.assertEqual(window.interval, 32)
+        self.assertNotIsInstance(window.data, np.memmap)
+        self.assertTrue(np.array_equal(window.data, report.data[-10::2]))
+
+        mapped = SpatialReport(filename, mmap=True, time_slice=slice(-10, None))
+        self.assertIsInstance(mapped.data, np.memmap)
+        self.assertTrue(np.array_equal(mapped.data, report.data[-10:]))
+
+        # windowed reports are written as filtered reports and read back the same
+        with tempfile.TemporaryDirectory() as temp:
+            written = pathlib.Path(temp) / "window.bin"
+            window.write_file(str(written))
+            test = SpatialReport(str(written))
+            self.assertEqual((test.start, test.interval), (window.start, window.interval))
+            self.assertTrue(np.array_equal(test.data, window.data))
+
+        return
+
+    def test_window_unknown_node(self):
+
+        filename = os.path.join(manifest.spatrep_folder, "SpatialReport_Prevalence.bin")
+        self.assertRaises(AssertionError, SpatialReport, filename, [42])
+
+        return
+
+    def test_writefile_unsorted_node_ids(self):
+
+        data = np.array([[3, 1, 2], [30, 10, 20]], dtype=np.float32)
+        report = SpatialReport(node_ids=[3, 1, 2], data=data)
+
+        with tempfile.TemporaryDirectory() as temp:
+            filename = pathlib.Path(temp) / "spatial_report.bin"
+            report.write_file(str(filename))
+            test = SpatialReport(str(filename))
+            for node_id in [1, 2, 3]:
+                self.assertListEqual(list(test[node_id].data), [node_id, node_id * 10])
+
+        return
+
+    def test_node_major(self):
+
+        with tempfile.TemporaryDirectory() as temp:
+            for name in ["SpatialReport_Prevalence.bin", "SpatialReportMalariaFiltered_Adult_Vectors.bin"]:
+                with self.subTest(name=name):
+                    filename = os.path.join(manifest.spatrep_folder, name)
+                    report = SpatialReport(filename)
+                    transposed = SpatialReport(filename, node_major=temp)
+
+                    self.assertTrue(np.array_equal(transposed.data, report.data))
+                    self.assertTrue(transposed.data.flags.f_contiguous)
+                    node_id = report.node_ids[7]
+                    self.assertTrue(transposed[node_id].data.flags.c_contiguous)
+                    self.assertTrue(np.array_equal(transposed[node_id].data, report[node_id].data))
+                    self.assertEqual((transposed.start, transposed.interval), (report.start, report.interval))
+
+                    window = SpatialReport(filename, node_ids=report.node_ids[:4], time_slice=slice(2, 12), node_major=temp)
+                    self.assertTrue(window[report.node_ids[0]].data.flags.c_contiguous)
+                    self.assertTrue(np.array_equal(window.data, SpatialReport(filename, node_ids=report.node_ids[:4], time_slice=slice(2, 12)).data))
+
+            self.assertEqual(len(list(pathlib.Path(temp).glob("*.nodemajor"))), 2)
+
+        return
+
+    def test_node_major_blocks_and_refresh(self):
+
+        data = np.arange(7 * 5, dtype=np.float32).reshape((7, 5))
+        with tempfile.TemporaryDirectory() as temp:
+            filename = pathlib.Path(temp) / "spatial_report.bin"
+            SpatialReport(node_ids=[5, 4, 3, 2, 1], data=data).write_file(str(filename))
+
+            # blocks of a single time step
+            sidecar = write_node_major(filename, block_bytes=1)
+            self.assertEqual(sidecar.parent, pathlib.Path(temp))
+            self.assertEqual(sidecar.name, "spatial_report.bin.nodemajor")
+            report = SpatialReport(filename, node_major=True)
+            self.assertTrue(np.array_equal(report.data, data))
+            self.assertListEqual(list(report[1].data), list(data[:, 4]))
+            mtime = sidecar.stat().st_mtime_ns
+            del report
+
+            SpatialReport(filename, node_major=True)
+            self.assertEqual(sidecar.stat().st_mtime_ns, mtime)
+
+            # a changed report rebuilds its sidecar
+            SpatialReport(node_ids=[5, 4, 3, 2, 1], data=data[:6] * 2).write_file(str(filename))
+            report = SpatialReport(filename, node_major=True)
+            self.assertTrue(np.array_equal(report.data, data[:6] * 2))
+
+        return
+
+
+class TestSpatialBundle(unittest.TestCase):
+
+    NODE_IDS = [7, 3, 5, 1]
+    NUM_TIME_STEPS = 10
+
+    def setUp(self):
+
+        self.temp = tempfile.TemporaryDirectory()
+        self.directory = pathlib.Path(self.temp.name)
+        steps = np.arange(self.NUM_TIME_STEPS, dtype=np.float32)[:, np.newaxis]
+        population = np.full((self.NUM_TIME_STEPS, len(self.NODE_IDS)), 100.0, dtype=np.float32)
+        infected = (steps + np.array(self.NODE_IDS, dtype=np.float32)).astype(np.float32)
+        for channel, data in [("Population", population), ("Infected", infected)]:
+            SpatialReport(node_ids=self.NODE_IDS, data=data).write_file(str(self.directory / f"SpatialReport_{channel}.bin"))
+        self.population = population
+        self.infected = infected
+
+        return
+
+    def tearDown(self):
+        self.temp.cleanup()
+        return
+
+    def test_bundle(self):
+
+        bundle = SpatialReportBundle(self.directory)
+
+        self.assertListEqual(bundle.channels, ["Infected", "Population"])
+        self.assertIn("Population", bundle)
+        self.assertIsInstance(bundle["Population"].data, np.memmap)
+        self.assertListEqual(list(bundle.node_ids), sorted(self.NODE_IDS))
+        self.assertEqual((bundle.node_count, bundle.time_steps, bundle.start, bundle.interval), (4, self.NUM_TIME_STEPS, 0, 1))
+
+        stacked = bundle.array()
+        self.assertEqual(stacked.shape, (2, self.NUM_TIME_STEPS, 4))
+        self.assertEqual(stacked.nbytes, 2 * self.NUM_TIME_STEPS * 4 * 4)
+        # channels are views of the reports' memory maps, not copies
+        self.assertTrue(np.shares_memory(stacked[0], bundle["Infected"].data))
+        self.assertEqual(stacked[1, 2, 3], self.population[2, 3])
+        self.assertTrue(np.array_equal(stacked[:, 4], np.stack([self.infected[4], self.population[4]])))
+        self.assertTrue(np.array_equal(np.asarray(stacked), np.stack([self.infected, self.population])))
+        self.assertListEqual(bundle.array_node_ids(), self.NODE_IDS)
+        prevalence = stacked[0] / stacked[1]
+        self.assertTrue(np.allclose(prevalence, self.infected / self.population))
+        self.assertTrue(np.array_equal(bundle["Infected"].data / bundle["Population"].data, prevalence))
+
+        return
+
+    def test_window(self):
+
+        bundle = SpatialReportBundle(self.directory, channels=["Population", "Infected"])
+
+        window = bundle.array(channels=["Infected"], node_ids=[1, 7], time_slice=slice(-3, None))
+        self.assertEqual(window.shape, (1, 3, 2))
+        self.assertListEqual(bundle.array_node_ids([1, 7]), [7, 1])
+        self.assertTrue(np.array_equal(window[0], self.infected[-3:, [0, 3]]))
+        self.assertTrue(np.array_equal(window[0, -1, 1], self.infected[-1, 3]))
+        self.assertTrue(np.array_equal(window.copy(), self.infected[np.newaxis, -3:][..., [0, 3]]))
+
+        # contiguous nodes stay views of the memory map
+        window = bundle.array(channels=["Infected"], node_ids=[3, 5], time_slice=slice(2, 5))
+        self.assertEqual(window.shape, (1, 3, 2))
+        self.assertTrue(np.shares_memory(window[0], bundle["Infected"].data))
+        self.assertTrue(np.array_equal(window[0], self.infected[2:5, 1:3]))
+
+        return
+
+    def test_missing_channel(self):
+
+        self.assertRaises(FileNotFoundError, SpatialReportBundle, self.directory, ["Prevalence"])
+        with tempfile.TemporaryDirectory() as empty:
+            self.assertRaises(FileNotFoundError, SpatialReportBundle, empty)
+
+        return
+
+    def test_mismatched_reports(self):
+
+        SpatialReport(node_ids=[1, 3, 5, 7], data=self.population).write_file(str(self.directory / "SpatialReport_Sorted.bin"))
+        self.assertRaises(RuntimeError, SpatialReportBundle, self.directory)
+
+        SpatialReport(node_ids=self.NODE_IDS, data=self.population[:5]).write_file(str(self.directory / "SpatialReport_Sorted.bin"))
+        self.assertRaises(RuntimeError, SpatialReportBundle, self.directory)
+
+        self.assertListEqual(SpatialReportBundle(self.directory, ["Infected", "Population"]).channels, ["Infected", "Population"])
+
+        return